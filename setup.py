@@ -40,8 +40,11 @@ setup(
         std_daq_udp_simulator=std_daq_service.udp_simulator.start_rest:main
         std_daq_image_simulator=std_daq_service.image_simulator.start:main
         std_daq_file_validator=std_daq_service.file_validator.start:main
+        std_daq_stream_roi=std_daq_service.roi.start:main
+        std_daq_stream_corrected=std_daq_service.correction.start:main
         std_daq_stream_compressed=std_daq_service.compression.start:main
         std_daq_stream_decompressed=std_daq_service.decompression.start:main
+        std_daq_stream_preview=std_daq_service.preview.start:main
         std_daq_writer=std_daq_service.writer.start:main
         
         std_cli_tune_network=std_daq_service.tools.tune_network:main
@@ -49,6 +52,12 @@ setup(
         std_cli_monitor_irq=std_daq_service.tools.monitor_irq:main
         std_cli_monitor_cpu=std_daq_service.tools.monitor_cpu:main
         std_cli_move_irq=std_daq_service.tools.move_irq:main
+        std_cli_benchmark_ram_buffer=std_daq_service.tools.benchmark_ram_buffer:main
+        std_cli_monitor_ram_buffer=std_daq_service.tools.monitor_ram_buffer:main
+        std_cli_benchmark_compression=std_daq_service.compression.benchmark:main
+        std_cli_benchmark_writer=std_daq_service.writer.benchmark:main
+        std_cli_benchmark_writer_stream=std_daq_service.writer.benchmark_stream:main
+        std_cli_export_raw=std_daq_service.writer.raw:main
     ''',
     long_description=long_description,
     long_description_content_type='text/markdown',
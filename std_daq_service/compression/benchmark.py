@@ -0,0 +1,166 @@
+import argparse
+import json
+import multiprocessing
+from time import perf_counter
+
+import numpy as np
+
+from std_daq_service.compression.codecs import CODECS, create_codec
+
+# Distinct frames per run, cycled to reach n_frames. Enough to defeat caching of a single frame.
+N_DISTINCT_FRAMES = 8
+BIT_DEPTHS = [8, 16, 32]
+# Eiger modules, each filled with its own value by the UDP simulator.
+EIGER_MODULE_HEIGHT = 256
+EIGER_MODULE_WIDTH = 512
+
+
+def gigafrost_noise(rng, shape, bit_depth):
+    """Uniform noise scaled to 12 bits, as sent by the Gigafrost UDP simulator."""
+    image = rng.integers(10000, 50000, size=shape)
+    max_value = min(2 ** 12 - 1, 2 ** bit_depth - 1)
+    return image * max_value // image.max()
+
+
+def photon_counting(rng, shape, bit_depth, occupancy=0.01):
+    """Sparse frame of a counting detector: few pixels with a handful of photons."""
+    image = np.zeros(shape, dtype='int64')
+    hits = rng.random(shape) < occupancy
+    image[hits] = rng.poisson(3, size=int(hits.sum())) + 1
+    return image
+
+
+def flat_field(rng, shape, bit_depth):
+    """Each Eiger module filled with a constant, as sent by the Eiger UDP simulator."""
+    rows = np.arange(shape[0])[:, None] // EIGER_MODULE_HEIGHT
+    columns = np.arange(shape[1])[None, :] // EIGER_MODULE_WIDTH
+    n_module_columns = -(-shape[1] // EIGER_MODULE_WIDTH)
+    return (rows * n_module_columns + columns + rng.integers(0, 16)) % 2 ** bit_depth
+
+
+FRAME_MODELS = {
+    'gigafrost_noise': gigafrost_noise,
+    'photon_counting': photon_counting,
+    'flat_field': flat_field,
+}
+
+
+def generate_frames(model, shape, bit_depth, n_frames=N_DISTINCT_FRAMES, seed=0):
+    rng = np.random.default_rng(seed)
+    dtype = f'uint{bit_depth}'
+    return [np.ascontiguousarray(FRAME_MODELS[model](rng, shape, bit_depth), dtype=dtype) for _ in range(n_frames)]
+
+
+def get_codec_configs(codec_names, block_sizes):
+    codec_configs = []
+    for codec_name in codec_names:
+        if codec_name == 'raw':
+            codec_configs.append({'name': codec_name})
+            continue
+        for block_size in block_sizes:
+            codec_configs.append({'name': codec_name, 'block_size': block_size})
+
+    return codec_configs
+
+
+def compress_frames(codec, frames, n_frames):
+    """Returns the per-frame latencies in seconds, the uncompressed and the compressed number of bytes."""
+    output = np.empty(codec.get_max_n_bytes(frames[0].size, frames[0].itemsize), dtype='uint8')
+    latencies = np.empty(n_frames)
+    n_output_bytes = 0
+
+    for i_frame in range(n_frames):
+        frame = frames[i_frame % len(frames)]
+        start_time = perf_counter()
+        n_output_bytes += codec.compress_into(frame, output)
+        latencies[i_frame] = perf_counter() - start_time
+
+    return latencies, frames[0].nbytes * n_frames, n_output_bytes
+
+
+_worker_state = {}
+
+
+def _init_worker(model, shape, bit_depth, codec_config, seed):
+    _worker_state['codec'] = create_codec(codec_config)
+    _worker_state['frames'] = generate_frames(model, shape, bit_depth, seed=seed)
+
+
+def _run_worker(n_frames):
+    return compress_frames(_worker_state['codec'], _worker_state['frames'], n_frames)
+
+
+def benchmark(model, shape, bit_depth, codec_config, n_workers=1, n_frames=100, seed=0):
+    if n_workers == 1:
+        frames = generate_frames(model, shape, bit_depth, seed=seed)
+        codec = create_codec(codec_config)
+
+        start_time = perf_counter()
+        results = [compress_frames(codec, frames, n_frames)]
+        elapsed_time = perf_counter() - start_time
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(n_workers, initializer=_init_worker,
+                      initargs=(model, shape, bit_depth, codec_config, seed)) as pool:
+            # Wait for the workers to generate their frames before starting the clock.
+            pool.map(_run_worker, [1] * n_workers)
+
+            start_time = perf_counter()
+            results = pool.map(_run_worker, [n_frames // n_workers] * n_workers)
+            elapsed_time = perf_counter() - start_time
+
+    latencies = np.concatenate([result[0] for result in results])
+    n_input_bytes = sum(result[1] for result in results)
+    n_output_bytes = sum(result[2] for result in results)
+
+    return {
+        'model': model,
+        'bit_depth': bit_depth,
+        'codec': codec_config['name'],
+        'block_size': codec_config.get('block_size', 0),
+        'n_workers': n_workers,
+        'input_MBps': n_input_bytes / elapsed_time / 1024 / 1024,
+        'output_MBps': n_output_bytes / elapsed_time / 1024 / 1024,
+        'ratio': n_output_bytes / n_input_bytes,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compression codec benchmark over synthetic detector frames')
+    parser.add_argument('--height', type=int, default=2016, help='Frame height in pixels.')
+    parser.add_argument('--width', type=int, default=2016, help='Frame width in pixels.')
+    parser.add_argument('--models', nargs='+', default=list(FRAME_MODELS), choices=list(FRAME_MODELS))
+    parser.add_argument('--bit_depths', nargs='+', type=int, default=BIT_DEPTHS, choices=BIT_DEPTHS)
+    parser.add_argument('--codecs', nargs='+', default=list(CODECS), choices=list(CODECS))
+    parser.add_argument('--block_sizes', nargs='+', type=int, default=[0],
+                        help='Block sizes in elements, 0 for the codec default.')
+    parser.add_argument('--n_workers', nargs='+', type=int, default=[1], help='Numbers of worker processes.')
+    parser.add_argument('--n_frames', type=int, default=100, help='Frames compressed per run.')
+    parser.add_argument('--json', action='store_true', help='Output results as JSON.')
+
+    args = parser.parse_args()
+
+    results = []
+    for model in args.models:
+        for bit_depth in args.bit_depths:
+            for codec_config in get_codec_configs(args.codecs, args.block_sizes):
+                for n_workers in args.n_workers:
+                    results.append(benchmark(model, (args.height, args.width), bit_depth, codec_config,
+                                             n_workers=n_workers, n_frames=args.n_frames))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:<16} {:>4} {:<14} {:>6} {:>8} {:>10} {:>11} {:>7} {:>8} {:>8}".format(
+        'MODEL', 'BITS', 'CODEC', 'BLOCK', 'WORKERS', 'IN_MB/s', 'OUT_MB/s', 'RATIO', 'P50_MS', 'P99_MS'))
+    for result in results:
+        print("{:<16} {:>4} {:<14} {:>6} {:>8} {:>10.1f} {:>11.1f} {:>7.3f} {:>8.3f} {:>8.3f}".format(
+            result['model'], result['bit_depth'], result['codec'], result['block_size'], result['n_workers'],
+            result['input_MBps'], result['output_MBps'], result['ratio'], result['p50_ms'], result['p99_ms']))
+
+
+if __name__ == "__main__":
+    main()
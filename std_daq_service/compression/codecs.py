@@ -0,0 +1,248 @@
+import logging
+
+import bitshuffle
+import numpy as np
+
+_logger = logging.getLogger("CompressionCodecs")
+
+# Values of protocol.image_metadata_encoding_mapping, stamped into ImageMetadata.compression.
+ENCODING_RAW = 0
+ENCODING_BSHUFFLE_LZ4 = 1
+ENCODING_BLOSC2 = 2
+ENCODING_BSHUFFLE_ZSTD = 3
+
+# Registered HDF5 filter ids.
+H5_FILTER_BITSHUFFLE = 32008
+H5_FILTER_BLOSC2 = 32026
+H5_BITSHUFFLE_LZ4 = 2
+H5_BITSHUFFLE_ZSTD = 3
+
+# Bitshuffle defaults, from bitshuffle_internals.h.
+BSHUF_TARGET_BLOCK_SIZE_B = 8192
+BSHUF_MIN_RECOMMEND_BLOCK = 128
+BSHUF_BLOCKED_MULT = 8
+# The HDF5 filter prefixes each chunk with the uncompressed size (u8) and the block size in bytes (u4), big endian.
+BSHUF_HEADER_N_BYTES = 12
+BSHUF_BLOCK_HEADER_N_BYTES = 4
+
+# Blosc2 frame header and trailer of a single chunk frame, with margin.
+BLOSC2_FRAME_N_BYTES = 1024
+# Compressor codes of the Blosc2 HDF5 filter.
+BLOSC2_H5_COMPCODES = {'blosclz': 0, 'lz4': 1, 'lz4hc': 2, 'zlib': 4, 'zstd': 5}
+
+
+def lz4_compress_bound(n_bytes):
+    return n_bytes + n_bytes // 255 + 16
+
+
+def zstd_compress_bound(n_bytes):
+    # ZSTD_COMPRESSBOUND from zstd.h.
+    small_input_margin = (128 * 1024 - n_bytes) >> 11 if n_bytes < 128 * 1024 else 0
+    return n_bytes + (n_bytes >> 8) + small_input_margin
+
+
+def get_default_block_size(element_n_bytes):
+    block_size = BSHUF_TARGET_BLOCK_SIZE_B // element_n_bytes
+    return max(block_size - block_size % BSHUF_BLOCKED_MULT, BSHUF_MIN_RECOMMEND_BLOCK)
+
+
+def bitshuffle_bound(n_elements, element_n_bytes, block_size=0, compress_bound=lz4_compress_bound):
+    """Maximum size of the bitshuffle output (with the HDF5 filter header) for n_elements."""
+    if block_size == 0:
+        block_size = get_default_block_size(element_n_bytes)
+
+    block_bound = compress_bound(block_size * element_n_bytes) + BSHUF_BLOCK_HEADER_N_BYTES
+    bound = block_bound * (n_elements // block_size)
+    leftover_block = n_elements % block_size
+    leftover_block -= leftover_block % BSHUF_BLOCKED_MULT
+    if leftover_block:
+        bound += compress_bound(leftover_block * element_n_bytes) + BSHUF_BLOCK_HEADER_N_BYTES
+    # Elements that do not fill a multiple of 8 are copied as they are.
+    bound += (n_elements % BSHUF_BLOCKED_MULT) * element_n_bytes
+
+    return bound + BSHUF_HEADER_N_BYTES
+
+
+class PassthroughCodec(object):
+    name = 'raw'
+    encoding = ENCODING_RAW
+
+    def __init__(self):
+        pass
+
+    def get_max_n_bytes(self, n_elements, element_n_bytes):
+        return n_elements * element_n_bytes
+
+    def compress_into(self, data, output):
+        """Compress data into the uint8 array output, return the number of bytes used."""
+        output[:data.nbytes] = data.view('uint8').reshape(-1)
+        return data.nbytes
+
+    def decompress(self, data, shape, dtype):
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    def can_join(self, n_elements, element_n_bytes):
+        """If consecutive compressed images of n_elements can be joined into one multi-image chunk."""
+        return True
+
+    def get_join_header(self, n_bytes, element_n_bytes):
+        """Chunk header of a joined chunk with n_bytes of uncompressed data."""
+        return np.empty(0, dtype='uint8')
+
+    def get_join_payload(self, data):
+        """Part of a compressed image that goes into a joined chunk."""
+        return data
+
+    def get_hdf5_filter(self):
+        """Keyword arguments for h5py create_dataset that match the compressed chunks."""
+        return {}
+
+
+class BitshuffleCodec(object):
+    """Bitshuffle with LZ4 or zstd. Chunks carry the header of the bitshuffle HDF5 filter, so they can be written
+    as HDF5 chunks directly."""
+    def __init__(self, algorithm='lz4', block_size=0, level=3):
+        if algorithm not in ('lz4', 'zstd'):
+            raise ValueError(f"Unknown bitshuffle algorithm {algorithm}. Use 'lz4' or 'zstd'.")
+
+        self.algorithm = algorithm
+        self.name = f'bshuffle_{algorithm}'
+        self.encoding = ENCODING_BSHUFFLE_LZ4 if algorithm == 'lz4' else ENCODING_BSHUFFLE_ZSTD
+        self.block_size = int(block_size)
+        self.level = int(level)
+
+    def get_max_n_bytes(self, n_elements, element_n_bytes):
+        compress_bound = lz4_compress_bound if self.algorithm == 'lz4' else zstd_compress_bound
+        return bitshuffle_bound(n_elements, element_n_bytes, self.block_size, compress_bound)
+
+    def compress_into(self, data, output):
+        if self.algorithm == 'lz4':
+            compressed_data = bitshuffle.compress_lz4(data, self.block_size)
+        else:
+            compressed_data = bitshuffle.compress_zstd(data, self.block_size, self.level)
+
+        block_size = self.block_size or get_default_block_size(data.itemsize)
+        output[:8] = np.array([data.nbytes], dtype='>u8').view('uint8')
+        output[8:BSHUF_HEADER_N_BYTES] = np.array([block_size * data.itemsize], dtype='>u4').view('uint8')
+        output[BSHUF_HEADER_N_BYTES:BSHUF_HEADER_N_BYTES + compressed_data.nbytes] = compressed_data
+
+        return BSHUF_HEADER_N_BYTES + compressed_data.nbytes
+
+    def decompress(self, data, shape, dtype):
+        dtype = np.dtype(dtype)
+        block_size = int(np.frombuffer(data[8:BSHUF_HEADER_N_BYTES], dtype='>u4')[0]) // dtype.itemsize
+        payload = data[BSHUF_HEADER_N_BYTES:]
+
+        if self.algorithm == 'lz4':
+            return bitshuffle.decompress_lz4(payload, shape, dtype, block_size)
+        return bitshuffle.decompress_zstd(payload, shape, dtype, block_size)
+
+    def can_join(self, n_elements, element_n_bytes):
+        # The compressed blocks of each image can be concatenated only if no image ends in a partial block.
+        return n_elements % (self.block_size or get_default_block_size(element_n_bytes)) == 0
+
+    def get_join_header(self, n_bytes, element_n_bytes):
+        block_size = self.block_size or get_default_block_size(element_n_bytes)
+        return np.concatenate([np.array([n_bytes], dtype='>u8').view('uint8'),
+                               np.array([block_size * element_n_bytes], dtype='>u4').view('uint8')])
+
+    def get_join_payload(self, data):
+        return data[BSHUF_HEADER_N_BYTES:]
+
+    def get_hdf5_filter(self):
+        if self.algorithm == 'lz4':
+            compression_opts = (self.block_size, H5_BITSHUFFLE_LZ4)
+        else:
+            compression_opts = (self.block_size, H5_BITSHUFFLE_ZSTD, self.level)
+
+        return {'compression': H5_FILTER_BITSHUFFLE, 'compression_opts': compression_opts}
+
+
+class Blosc2Codec(object):
+    """Blosc2 with byte shuffle. Chunks are single chunk Blosc2 frames, as stored by the Blosc2 HDF5 filter."""
+    name = 'blosc2'
+    encoding = ENCODING_BLOSC2
+
+    def __init__(self, cname='lz4', level=5, block_size=0):
+        # Optional dependency, only needed when the codec is configured.
+        import blosc2
+
+        if cname not in BLOSC2_H5_COMPCODES:
+            raise ValueError(f"Unknown blosc2 compressor {cname}. Use one of {list(BLOSC2_H5_COMPCODES)}.")
+
+        self.blosc2 = blosc2
+        self.cname = cname
+        self.level = int(level)
+        self.block_size = int(block_size)
+
+    def get_max_n_bytes(self, n_elements, element_n_bytes):
+        return n_elements * element_n_bytes + self.blosc2.MAX_OVERHEAD + BLOSC2_FRAME_N_BYTES
+
+    def compress_into(self, data, output):
+        cparams = {'typesize': data.itemsize,
+                   'clevel': self.level,
+                   'codec': getattr(self.blosc2.Codec, self.cname.upper()),
+                   'filters': [self.blosc2.Filter.SHUFFLE],
+                   'blocksize': self.block_size * data.itemsize,
+                   'nthreads': 1}
+        frame = self.blosc2.SChunk(chunksize=data.nbytes, data=data, cparams=cparams).to_cframe()
+
+        output[:len(frame)] = np.frombuffer(frame, dtype='uint8')
+        return len(frame)
+
+    def decompress(self, data, shape, dtype):
+        schunk = self.blosc2.schunk_from_cframe(bytes(data), copy=True)
+        return np.frombuffer(schunk.decompress_chunk(0), dtype=dtype).reshape(shape)
+
+    def can_join(self, n_elements, element_n_bytes):
+        # Every image is a self-contained frame, a chunk holds exactly one.
+        return False
+
+    def get_hdf5_filter(self):
+        return {'compression': H5_FILTER_BLOSC2,
+                'compression_opts': (0, 0, 0, 0, self.level, 1, BLOSC2_H5_COMPCODES[self.cname])}
+
+
+CODECS = {
+    'raw': lambda **params: PassthroughCodec(**params),
+    'bshuffle_lz4': lambda **params: BitshuffleCodec(algorithm='lz4', **params),
+    'bshuffle_zstd': lambda **params: BitshuffleCodec(algorithm='zstd', **params),
+    'blosc2': lambda **params: Blosc2Codec(**params),
+}
+
+ENCODING_CODECS = {
+    ENCODING_RAW: 'raw',
+    ENCODING_BSHUFFLE_LZ4: 'bshuffle_lz4',
+    ENCODING_BLOSC2: 'blosc2',
+    ENCODING_BSHUFFLE_ZSTD: 'bshuffle_zstd',
+}
+
+DEFAULT_CODEC = 'bshuffle_lz4'
+
+
+def create_codec(codec_config=None):
+    """Codec from the optional 'compression_codec' DAQ config entry: a codec name, or a dict with the name and
+    its parameters, for example {"name": "bshuffle_zstd", "block_size": 0, "level": 3}."""
+    if codec_config is None:
+        codec_config = DEFAULT_CODEC
+    if isinstance(codec_config, str):
+        codec_config = {'name': codec_config}
+
+    params = dict(codec_config)
+    name = params.pop('name', DEFAULT_CODEC)
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name}. Available codecs: {list(CODECS)}.")
+
+    return CODECS[name](**params)
+
+
+def get_codec(daq_config):
+    return create_codec(daq_config.get('compression_codec'))
+
+
+def get_decoder(encoding):
+    """Codec able to decompress images stamped with encoding. Parameters only matter for compression."""
+    if encoding not in ENCODING_CODECS:
+        raise ValueError(f"Unknown image encoding {encoding}.")
+
+    return create_codec(ENCODING_CODECS[encoding])
@@ -0,0 +1,133 @@
+import logging
+
+from std_daq_service.compression.codecs import create_codec, get_codec
+from std_daq_service.compression.stats import CompressionStats
+
+_logger = logging.getLogger("CompressionController")
+
+# Fraction of the time the workers spend compressing.
+DEFAULT_HIGH_LOAD = 0.85
+DEFAULT_LOW_LOAD = 0.5
+# Lag, in images, above which the controller speeds up regardless of the load.
+DEFAULT_MAX_LAG_IMAGES = 100
+# Consecutive quiet intervals before the controller trades speed for ratio again.
+DEFAULT_HOLD_INTERVALS = 5
+
+
+class CompressionController(object):
+    """Keeps compression ahead of the input rate by walking a ladder of codec settings and the worker count.
+
+    The limits come from the optional 'compression_controller' DAQ config entry, for example:
+        {"codecs": [{"name": "bshuffle_zstd", "level": 1}, {"name": "bshuffle_zstd", "level": 3}],
+         "min_workers": 1, "max_workers": 4, "high_load": 0.85, "low_load": 0.5}
+    codecs go from the fastest to the best ratio and must all have the same name, since the HDF5 filter of
+    the writer does not change during an acquisition. The controller starts at the best ratio.
+    """
+    def __init__(self, controller_config, n_workers=1, stats=None):
+        codec_configs = controller_config.get('codecs')
+        if not codec_configs:
+            raise ValueError("The compression controller needs at least one codec in 'codecs'.")
+
+        self.codec_configs = codec_configs
+        self.codecs = [create_codec(codec_config) for codec_config in codec_configs]
+        if len(set(codec.name for codec in self.codecs)) != 1:
+            raise ValueError(f"All codecs of the compression controller must have the same name: {codec_configs}.")
+
+        self.min_workers = int(controller_config.get('min_workers', n_workers))
+        self.max_workers = int(controller_config.get('max_workers', n_workers))
+        self.high_load = float(controller_config.get('high_load', DEFAULT_HIGH_LOAD))
+        self.low_load = float(controller_config.get('low_load', DEFAULT_LOW_LOAD))
+        self.max_lag_images = int(controller_config.get('max_lag_images', DEFAULT_MAX_LAG_IMAGES))
+        self.hold_intervals = int(controller_config.get('hold_intervals', DEFAULT_HOLD_INTERVALS))
+        self.stats = stats
+
+        self.i_codec = len(self.codecs) - 1
+        self.n_workers = min(max(n_workers, self.min_workers), self.max_workers)
+        self._n_quiet_intervals = 0
+
+    @property
+    def codec(self):
+        return self.codecs[self.i_codec]
+
+    @property
+    def codec_config(self):
+        return self.codec_configs[self.i_codec]
+
+    def update(self, interval_seconds, compress_seconds, n_input_bytes, n_output_bytes, lag_images=None):
+        """Feed the measurements of the last interval. Returns the decision if the settings changed, else None.
+
+        compress_seconds is the time all workers together spent compressing in the interval.
+        """
+        if interval_seconds <= 0:
+            return None
+
+        load = compress_seconds / (interval_seconds * self.n_workers)
+        ratio = n_output_bytes / n_input_bytes if n_input_bytes else 0
+        lag_images = lag_images or 0
+
+        if load > self.high_load or lag_images > self.max_lag_images:
+            self._n_quiet_intervals = 0
+            reason = f'load {load:.2f} lag {lag_images}'
+
+            if self.i_codec > 0:
+                self.i_codec -= 1
+                return self._decide('faster_codec', reason, load, lag_images, ratio)
+            if self.n_workers < self.max_workers:
+                self.n_workers += 1
+                return self._decide('add_worker', reason, load, lag_images, ratio)
+            return None
+
+        if load < self.low_load and lag_images <= self.max_lag_images // 10:
+            self._n_quiet_intervals += 1
+            if self._n_quiet_intervals < self.hold_intervals:
+                return None
+            self._n_quiet_intervals = 0
+            reason = f'load {load:.2f} for {self.hold_intervals} intervals'
+
+            # Give workers back first, as long as the remaining ones stay below the high load.
+            if self.n_workers > self.min_workers and load * self.n_workers / (self.n_workers - 1) < self.high_load:
+                self.n_workers -= 1
+                return self._decide('remove_worker', reason, load, lag_images, ratio)
+            if self.i_codec < len(self.codecs) - 1:
+                self.i_codec += 1
+                return self._decide('better_ratio_codec', reason, load, lag_images, ratio)
+            return None
+
+        self._n_quiet_intervals = 0
+        return None
+
+    def _decide(self, action, reason, load, lag_images, ratio):
+        decision = {'action': action,
+                    'reason': reason,
+                    'codec': self.codec.name,
+                    'level': getattr(self.codec, 'level', 0),
+                    'block_size': getattr(self.codec, 'block_size', 0),
+                    'n_workers': self.n_workers,
+                    'load': load,
+                    'lag_images': lag_images,
+                    'ratio': ratio}
+
+        _logger.info(f"Compression controller decision: {decision}")
+        if self.stats:
+            self.stats.write_decision(decision)
+
+        return decision
+
+
+def get_controller(daq_config, n_workers=1, stats=None):
+    """Controller from the optional 'compression_controller' DAQ config entry, None if not configured.
+    Decisions go to the compression stats, unless other stats are given."""
+    controller_config = daq_config.get('compression_controller')
+    if not controller_config:
+        return None
+
+    if stats is None:
+        stats = CompressionStats(daq_config['detector_name'])
+
+    controller = CompressionController(controller_config, n_workers=n_workers, stats=stats)
+    writer_codec = get_codec(daq_config)
+    if controller.codec.name != writer_codec.name:
+        raise ValueError(f"Compression controller codec {controller.codec.name} does not match "
+                         f"the compression_codec {writer_codec.name} the writer uses for the HDF5 filter.")
+
+    return controller
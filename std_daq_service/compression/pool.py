@@ -0,0 +1,272 @@
+import json
+import logging
+import multiprocessing
+import signal
+from collections import deque
+from time import time, perf_counter_ns
+
+from std_buffer.image_metadata_pb2 import ImageMetadata
+import zmq
+from zmq import Again
+
+from std_daq_service.compression.controller import get_controller
+from std_daq_service.compression.stats import CompressionStats
+from std_daq_service.compression.worker import start_worker, get_worker_address, get_results_address, \
+    get_worker_cursor_name, open_buffers, get_image_geometry, get_input_channel, N_IMAGE_SLOTS, \
+    STATUS_COMPRESSION_FAILED, WORKER_CODEC_COMMAND
+from std_daq_service.image_accounting import ImageIdAccounting
+from std_daq_service.ram_buffer import RamBufferCursors
+
+_logger = logging.getLogger("CompressionPool")
+
+# In milliseconds.
+POLL_TIMEOUT_MS = 200
+# In seconds. Images whose result did not arrive in this time are dropped from the output stream.
+RESULT_TIMEOUT = 2
+
+
+class CompressionSequencer(object):
+    """Releases compressed images in the order they were dispatched, regardless of which worker finished first.
+
+    Images that failed, timed out or fell more than max_pending behind are dropped, so one lost result
+    cannot stall the stream.
+    """
+    def __init__(self, timeout=RESULT_TIMEOUT, max_pending=N_IMAGE_SLOTS):
+        self.timeout = timeout
+        self.max_pending = max_pending
+
+        self.dispatched = deque()
+        self.dispatch_times = {}
+        self.completed = {}
+        self.n_dropped = 0
+
+    def dispatch(self, image_id, dispatch_time=None):
+        self.dispatched.append(image_id)
+        self.dispatch_times[image_id] = time() if dispatch_time is None else dispatch_time
+
+    def complete(self, image_id, meta_raw):
+        """Record the result of image_id. meta_raw=None marks the image as failed."""
+        # Results of images that were already dropped are ignored.
+        if image_id in self.dispatch_times:
+            self.completed[image_id] = meta_raw
+
+    def pop_ready(self, current_time=None):
+        current_time = time() if current_time is None else current_time
+
+        ready = []
+        while self.dispatched:
+            image_id = self.dispatched[0]
+
+            if image_id in self.completed:
+                meta_raw = self.completed.pop(image_id)
+                if meta_raw is None:
+                    self._drop(f"Image_id {image_id} failed compression.")
+                else:
+                    self.dispatched.popleft()
+                    del self.dispatch_times[image_id]
+                    ready.append(meta_raw)
+
+            elif len(self.dispatched) > self.max_pending:
+                self._drop(f"Image_id {image_id} dropped, more than {self.max_pending} images pending.")
+            elif current_time - self.dispatch_times[image_id] > self.timeout:
+                self._drop(f"Image_id {image_id} dropped, no result after {self.timeout} seconds.")
+            else:
+                break
+
+        return ready
+
+    def _drop(self, message):
+        _logger.warning(message)
+        image_id = self.dispatched.popleft()
+        del self.dispatch_times[image_id]
+        self.n_dropped += 1
+
+    def n_pending(self):
+        return len(self.dispatched)
+
+
+def get_worker_cores(daq_config, n_workers):
+    cores = daq_config.get('compression_cores') or []
+    return [cores[i_worker % len(cores)] if cores else None for i_worker in range(n_workers)]
+
+
+def start_worker_process(config_file, i_worker, core_id):
+    # Spawned, not forked: dead workers are restarted while the pool already has a ZMQ context.
+    worker = multiprocessing.get_context('spawn').Process(target=start_worker, args=(config_file, i_worker, core_id),
+                                                          daemon=True)
+    worker.start()
+    return worker
+
+
+def send_codec_config(worker_sender, codec_config):
+    try:
+        worker_sender.send_multipart([WORKER_CODEC_COMMAND, json.dumps(codec_config).encode()], flags=zmq.NOBLOCK)
+        return True
+    except Again:
+        return False
+
+
+def get_input_lag(input_cursors, n_active_workers, last_dispatched_image_ids):
+    """Lag of the slowest compression worker behind the input buffer, None without cursors.
+
+    Only active workers with dispatched images they did not compress yet count. Idle workers and workers the
+    controller removed keep their cursor where they stopped, their lag grows with the head without meaning anything.
+    """
+    if not input_cursors:
+        return None
+
+    lags = input_cursors.get_lag()
+    worker_lags = []
+    for i_worker in range(n_active_workers):
+        lag = lags.get(get_worker_cursor_name(i_worker))
+        last_dispatched_image_id = last_dispatched_image_ids[i_worker]
+        if lag and last_dispatched_image_id is not None and lag['image_id'] < last_dispatched_image_id:
+            worker_lags.append(lag['lag_images'])
+
+    return max(worker_lags, default=0)
+
+
+def start_compression_pool(config_file, daq_config, n_workers):
+    detector_name = daq_config['detector_name']
+    backend = daq_config.get('ram_buffer_backend')
+    _, _, image_n_bytes = get_image_geometry(daq_config)
+
+    stats = CompressionStats(detector_name)
+    controller = get_controller(daq_config, n_workers=n_workers, stats=stats)
+    # The controller can activate workers up to its max_workers, so all of them are started upfront.
+    n_active_workers = n_workers
+    if controller:
+        n_workers = max(n_workers, controller.max_workers)
+        n_active_workers = controller.n_workers
+
+    cores = get_worker_cores(daq_config, n_workers)
+    _logger.info(f"Starting compression pool for {detector_name} with {n_workers} workers on cores {cores}.")
+
+    # Stop the workers also when the pool is terminated.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # The output buffer must exist before the workers open it.
+    input_buffer, output_buffer = open_buffers(daq_config, create_output=True, n_partitions=n_workers)
+    workers = [start_worker_process(config_file, i_worker, cores[i_worker]) for i_worker in range(n_workers)]
+
+    ctx = zmq.Context()
+    image_metadata_receiver = ctx.socket(zmq.SUB)
+    image_metadata_receiver.connect(get_input_channel(daq_config)[1])
+    image_metadata_receiver.setsockopt_string(zmq.SUBSCRIBE, "")
+
+    worker_senders = []
+    for i_worker in range(n_workers):
+        worker_sender = ctx.socket(zmq.PUSH)
+        worker_sender.bind(get_worker_address(detector_name, i_worker))
+        worker_senders.append(worker_sender)
+
+    results_receiver = ctx.socket(zmq.PULL)
+    results_receiver.bind(get_results_address(detector_name))
+
+    image_metadata_sender = ctx.socket(zmq.PUB)
+    image_metadata_sender.bind(f"ipc:///tmp/{detector_name}-compressed")
+
+    output_cursors = RamBufferCursors(output_buffer.buffer_name, capacity=N_IMAGE_SLOTS, backend=backend, create=True)
+    try:
+        input_cursors = RamBufferCursors(input_buffer.buffer_name, backend=backend)
+    except FileNotFoundError:
+        _logger.warning(f"No cursors for {input_buffer.buffer_name}, input lag will not be reported.")
+        input_cursors = None
+
+    poller = zmq.Poller()
+    poller.register(image_metadata_receiver, zmq.POLLIN)
+    poller.register(results_receiver, zmq.POLLIN)
+
+    sequencer = CompressionSequencer()
+    accounting = ImageIdAccounting('compression')
+    image_meta = ImageMetadata()
+    n_dropped = 0
+    head_image_id = None
+    # Codec config each worker runs with, None for the one from the DAQ config.
+    worker_codec_configs = [None] * n_workers
+    last_dispatched_image_ids = [None] * n_workers
+    start_time = time()
+    try:
+        while True:
+            wait_start_time = perf_counter_ns()
+            events = dict(poller.poll(timeout=POLL_TIMEOUT_MS))
+            stats.record_wait(perf_counter_ns() - wait_start_time)
+
+            # Drain the results first, so workers never block on their result socket.
+            if results_receiver in events:
+                while True:
+                    try:
+                        meta_raw, image_compress_ns, overrun = results_receiver.recv_multipart(flags=zmq.NOBLOCK)
+                    except Again:
+                        break
+                    image_meta.ParseFromString(meta_raw)
+                    if overrun == b'1':
+                        accounting.record_overrun(image_meta.image_id)
+                    failed = image_meta.status == STATUS_COMPRESSION_FAILED
+                    sequencer.complete(image_meta.image_id, None if failed else meta_raw)
+                    if not failed:
+                        stats.record(image_n_bytes, image_meta.size, int(image_compress_ns))
+
+            if image_metadata_receiver in events:
+                meta_raw = image_metadata_receiver.recv(flags=zmq.NOBLOCK)
+                image_meta.ParseFromString(meta_raw)
+                accounting.record(image_meta.image_id)
+
+                sequencer.dispatch(image_meta.image_id)
+                i_worker = image_meta.image_id % n_active_workers
+                try:
+                    worker_senders[i_worker].send(meta_raw, flags=zmq.NOBLOCK)
+                    last_dispatched_image_ids[i_worker] = image_meta.image_id
+                except Again:
+                    # The queue of the worker is full, it is not keeping up.
+                    sequencer.complete(image_meta.image_id, None)
+
+            for ready_meta_raw in sequencer.pop_ready():
+                image_metadata_sender.send(ready_meta_raw)
+                image_meta.ParseFromString(ready_meta_raw)
+                head_image_id = image_meta.image_id
+                output_cursors.publish_head(head_image_id)
+
+            if controller:
+                for i_worker in range(n_workers):
+                    if worker_codec_configs[i_worker] != controller.codec_config and \
+                            send_codec_config(worker_senders[i_worker], controller.codec_config):
+                        worker_codec_configs[i_worker] = controller.codec_config
+
+            end_time = time()
+            if end_time - start_time > 1:
+                start_time = end_time
+
+                stats.record_dropped(sequencer.n_dropped - n_dropped)
+                n_dropped = sequencer.n_dropped
+                lag_images = get_input_lag(input_cursors, n_active_workers, last_dispatched_image_ids)
+                interval_stats = stats.write_stats(lag_images=lag_images, image_id_stats=accounting.get_stats())
+
+                if controller and controller.update(interval_stats['interval_seconds'],
+                                                    interval_stats['compress_seconds'],
+                                                    interval_stats['n_input_bytes'], interval_stats['n_output_bytes'],
+                                                    lag_images=max(lag_images or 0, sequencer.n_pending())):
+                    n_active_workers = controller.n_workers
+
+                for i_worker, worker in enumerate(workers):
+                    if not worker.is_alive():
+                        _logger.error(f"Compression worker {i_worker} died with exit code {worker.exitcode}, "
+                                      f"restarting it.")
+                        workers[i_worker] = start_worker_process(config_file, i_worker, cores[i_worker])
+                        worker_codec_configs[i_worker] = None
+
+                if interval_stats['n_frames'] and head_image_id is not None:
+                    # Only the partitions of the active workers hold images.
+                    output_cursors.publish_head(head_image_id, capacity=output_buffer.estimate_capacity(
+                        interval_stats['n_output_bytes'] / interval_stats['n_frames'], n_partitions=n_active_workers))
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        ctx.destroy(linger=0)
+        stats.close()
+
+    _logger.info("Compression pool stopped.")
@@ -1,14 +1,18 @@
 import argparse
 import logging
-from time import time
+from time import time, perf_counter_ns
 
-import bitshuffle
-from std_buffer.image_metadata_pb2 import ImageMetadata, ImageMetadataStatus
+from std_buffer.image_metadata_pb2 import ImageMetadata
 import zmq
 from zmq import Again
 
+from std_daq_service.compression.controller import get_controller
+from std_daq_service.compression.pool import start_compression_pool
+from std_daq_service.compression.stats import CompressionStats
+from std_daq_service.compression.worker import ImageCompressor, open_buffers, get_input_channel, N_IMAGE_SLOTS
 from std_daq_service.config import load_daq_config
-from std_daq_service.ram_buffer import RamBuffer
+from std_daq_service.image_accounting import ImageIdAccounting
+from std_daq_service.ram_buffer import RamBufferCursors, attach_consumer_cursor
 
 _logger = logging.getLogger("Compression")
 
@@ -16,13 +20,15 @@ _logger = logging.getLogger("Compression")
 def start_compression(config_file):
     daq_config = load_daq_config(config_file)
     detector_name = daq_config['detector_name']
-    shape = [daq_config['image_pixel_height'], daq_config['image_pixel_width']]
-    dtype = f'uint{daq_config["bit_depth"]}'
-    image_n_bytes = int(daq_config['bit_depth'] / 8 *
-                        daq_config['image_pixel_height'] * daq_config['image_pixel_width'])
-    block_size = 0
 
-    image_metadata_address = f"ipc:///tmp/{detector_name}-image"
+    n_workers = int(daq_config.get('compression_n_workers', 1))
+    # A controller that can add workers needs the pool.
+    max_workers = int((daq_config.get('compression_controller') or {}).get('max_workers', 1))
+    if max(n_workers, max_workers) > 1:
+        start_compression_pool(config_file, daq_config, n_workers)
+        return
+
+    _, image_metadata_address = get_input_channel(daq_config)
     compressed_metadata_address = f"ipc:///tmp/{detector_name}-compressed"
 
     # Receive the image metadata stream from the detector.
@@ -35,55 +41,74 @@ def start_compression(config_file):
     image_metadata_sender = ctx.socket(zmq.PUB)
     image_metadata_sender.bind(compressed_metadata_address)
 
-    input_buffer = RamBuffer(channel_name=detector_name, data_n_bytes=image_n_bytes, n_slots=1000)
-    output_buffer = RamBuffer(channel_name=detector_name, data_n_bytes=image_n_bytes, n_slots=1000,
-                              compression=True, create=True)
+    backend = daq_config.get('ram_buffer_backend')
+    input_buffer, output_buffer = open_buffers(daq_config, create_output=True)
+    compressor = ImageCompressor(daq_config, input_buffer, output_buffer)
+
+    stats = CompressionStats(detector_name)
+    controller = get_controller(daq_config, stats=stats)
+    if controller:
+        compressor.set_codec(controller.codec)
+
+    input_cursors, input_cursor = attach_consumer_cursor(input_buffer.buffer_name, 'compression', backend=backend)
+    output_cursors = RamBufferCursors(output_buffer.buffer_name, capacity=N_IMAGE_SLOTS, backend=backend,
+                                      create=True)
 
+    accounting = ImageIdAccounting('compression')
     image_meta = ImageMetadata()
-    compressed_bytes = 0
-    uncompressed_bytes = 0
-    n_compressions = 0
     start_time = time()
     while True:
         try:
-            meta_raw = image_metadata_receiver.recv()
-            image_meta.ParseFromString(meta_raw)
-
-            # Compress data into output buffer.
-            data = input_buffer.get_data(image_meta.image_id, shape=shape, dtype=dtype)
-            compressed_data = bitshuffle.compress_lz4(data, block_size)
-            output_buffer.write(image_meta.image_id, compressed_data)
-
-            # Update ImageMetadata header
-            image_meta.size = compressed_data.nbytes
-            image_meta.status = ImageMetadataStatus.compressed_image
-            image_metadata_sender.send(image_meta.SerializeToString())
-
-            # Update statistics.
-            uncompressed_bytes += data.nbytes
-            compressed_bytes += compressed_data.nbytes
-            n_compressions += 1
+            wait_start_time = perf_counter_ns()
+            try:
+                meta_raw = image_metadata_receiver.recv()
+            except Again:
+                meta_raw = None
+            compress_start_time = perf_counter_ns()
+            stats.record_wait(compress_start_time - wait_start_time)
+
+            if meta_raw is not None:
+                image_meta.ParseFromString(meta_raw)
+                accounting.record(image_meta.image_id)
+
+                # Compress data into output buffer and update the ImageMetadata header.
+                n_uncompressed_bytes = compressor.compress(image_meta)
+                stats.record(n_uncompressed_bytes, image_meta.size, perf_counter_ns() - compress_start_time)
+                if input_cursors:
+                    head_image_id, capacity = input_cursors.get_head()
+                    accounting.check_window(image_meta.image_id, head_image_id, capacity or input_buffer.n_slots)
+                    input_cursors.publish_cursor(input_cursor, image_meta.image_id)
+                output_cursors.publish_head(image_meta.image_id)
+
+                image_metadata_sender.send(image_meta.SerializeToString())
 
             end_time = time()
             if end_time - start_time > 1:
                 start_time = end_time
 
-                print(f'Uncompressed {uncompressed_bytes / 1024 / 1024} MB/s; '
-                      f'Compressed {compressed_bytes / 1024 / 1024} MB/s; '
-                      f'Ratio {compressed_bytes / uncompressed_bytes}; '
-                      f'Frequency {n_compressions} Hz')
-                uncompressed_bytes = 0
-                compressed_bytes = 0
-                n_compressions = 0
+                lag_images = None
+                if input_cursors:
+                    lag_images = input_cursors.get_lag()['compression']['lag_images']
+                interval_stats = stats.write_stats(lag_images=lag_images, image_id_stats=accounting.get_stats())
+
+                if controller and controller.update(interval_stats['interval_seconds'],
+                                                    interval_stats['compress_seconds'],
+                                                    interval_stats['n_input_bytes'], interval_stats['n_output_bytes'],
+                                                    lag_images=lag_images):
+                    compressor.set_codec(controller.codec)
+
+                if interval_stats['n_frames']:
+                    output_cursors.publish_head(image_meta.image_id, capacity=output_buffer.estimate_capacity(
+                        interval_stats['n_output_bytes'] / interval_stats['n_frames']))
 
-        except Again:
-            continue
         except KeyboardInterrupt:
             break
         except Exception:
             _logger.exception("Error in validator loop.")
             raise
 
+    stats.close()
+
 
 def main():
     parser = argparse.ArgumentParser(description='Stream compression')
@@ -0,0 +1,117 @@
+import logging
+from time import time_ns
+
+import numpy as np
+
+_logger = logging.getLogger("CompressionStats")
+
+DEFAULT_OUTPUT_FILE = '/var/log/std-daq/perf.log'
+
+
+def format_tags(tags):
+    # InfluxDB tag values cannot contain spaces or commas.
+    return ','.join(f'{name}={str(value).replace(" ", "_").replace(",", "_")}' for name, value in tags.items())
+
+
+class CompressionStats(object):
+    def __init__(self, detector_name, output_file=None):
+        self.detector_name = detector_name
+
+        if output_file is None:
+            output_file = DEFAULT_OUTPUT_FILE
+        self.output_file = output_file
+        _logger.info(f"Starting compression stats for {detector_name} logging to {self.output_file}.")
+
+        self.stats = {}
+        self._reset_stats()
+
+        self.output_file = open(self.output_file, 'a', buffering=1)
+        self.start_time = time_ns()
+
+    def _reset_stats(self):
+        self.stats = {
+            'n_frames': 0,
+            'n_input_bytes': 0,
+            'n_output_bytes': 0,
+            'compress_ns': [],
+            'wait_ns': 0,
+            'n_dropped': 0
+        }
+
+    def record(self, n_input_bytes, n_output_bytes, compress_ns):
+        """Record one compressed frame."""
+        self.stats['n_frames'] += 1
+        self.stats['n_input_bytes'] += n_input_bytes
+        self.stats['n_output_bytes'] += n_output_bytes
+        self.stats['compress_ns'].append(compress_ns)
+
+    def record_wait(self, wait_ns):
+        """Record time spent blocked waiting for image metadata."""
+        self.stats['wait_ns'] += wait_ns
+
+    def record_dropped(self, n_dropped=1):
+        self.stats['n_dropped'] += n_dropped
+
+    def write_stats(self, lag_images=None, image_id_stats=None):
+        """Write the stats of the interval since the last call and return them.
+        image_id_stats are the cumulative counters of an ImageIdAccounting."""
+        end_time = time_ns()
+        interval_seconds = (end_time - self.start_time) / 10**9
+
+        compress_ns = self.stats['compress_ns']
+        latency_p50, latency_p99, latency_max = np.percentile(compress_ns, [50, 99, 100]) / 10**6 if compress_ns \
+            else (0, 0, 0)
+        n_input_bytes = self.stats['n_input_bytes']
+        n_output_bytes = self.stats['n_output_bytes']
+
+        interval_stats = {
+            'interval_seconds': interval_seconds,
+            'compress_seconds': sum(compress_ns) / 10**9,
+            'n_frames': self.stats['n_frames'],
+            'n_input_bytes': n_input_bytes,
+            'n_output_bytes': n_output_bytes,
+        }
+
+        # InfluxDB line protocol
+        stats_output = f'compression,{format_tags({"detector_name": self.detector_name})}' \
+                       f' n_frames={self.stats["n_frames"]}i' \
+                       f',frames_per_s={self.stats["n_frames"] / interval_seconds}' \
+                       f',input_bytes_per_s={n_input_bytes / interval_seconds}' \
+                       f',output_bytes_per_s={n_output_bytes / interval_seconds}' \
+                       f',ratio={n_output_bytes / n_input_bytes if n_input_bytes else 0}' \
+                       f',latency_p50_ms={latency_p50}' \
+                       f',latency_p99_ms={latency_p99}' \
+                       f',latency_max_ms={latency_max}' \
+                       f',wait_metadata_s={self.stats["wait_ns"] / 10**9}' \
+                       f',n_dropped={self.stats["n_dropped"]}i'
+        if lag_images is not None:
+            stats_output += f',lag_images={lag_images}i'
+        for name, value in (image_id_stats or {}).items():
+            stats_output += f',{name}={value}i'
+        stats_output += f' {end_time}\n'
+
+        self.start_time = end_time
+        self._reset_stats()
+
+        self.output_file.write(stats_output)
+        return interval_stats
+
+    def write_decision(self, decision):
+        """Log a decision of the CompressionController."""
+        tags = {'detector_name': self.detector_name, 'action': decision['action'], 'codec': decision['codec']}
+
+        # InfluxDB line protocol
+        stats_output = f'compression_controller,{format_tags(tags)}' \
+                       f' level={decision["level"]}i' \
+                       f',block_size={decision["block_size"]}i' \
+                       f',n_workers={decision["n_workers"]}i' \
+                       f',load={decision["load"]}' \
+                       f',lag_images={decision["lag_images"]}i' \
+                       f',ratio={decision["ratio"]}' \
+                       f',reason="{decision["reason"]}"' \
+                       f' {time_ns()}\n'
+
+        self.output_file.write(stats_output)
+
+    def close(self):
+        self.output_file.close()
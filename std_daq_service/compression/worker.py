@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+from time import perf_counter_ns
+
+import numpy as np
+from std_buffer.image_metadata_pb2 import ImageMetadata, ImageMetadataStatus
+import zmq
+
+from std_daq_service.compression.codecs import get_codec, create_codec
+from std_daq_service.config import load_daq_config, get_roi_stream_address, get_corrected_stream_address, IPC_BASE
+from std_daq_service.correction.jungfrau import get_correction_config, get_output_dtype, get_correction_channel_name
+from std_daq_service.image_accounting import is_in_window
+from std_daq_service.ram_buffer import RamBuffer, PackedRamBuffer, attach_consumer_cursor
+from std_daq_service.roi.extractor import get_rois, get_roi_shape, get_roi_channel_name
+
+_logger = logging.getLogger("CompressionWorker")
+
+N_IMAGE_SLOTS = 1000
+# The compressed ring has the same byte budget as the image ring, with index entries for up to 10x compression.
+N_COMPRESSED_SLOTS = 10 * N_IMAGE_SLOTS
+
+# Status a worker reports back to the pool for an image it could not compress. Never published downstream.
+STATUS_COMPRESSION_FAILED = 100
+# First frame of the control message the pool sends to change the codec of a worker. The second is the codec config.
+WORKER_CODEC_COMMAND = b'codec'
+
+
+def get_image_geometry(daq_config):
+    """Shape, dtype and size of the images compression reads: the stacked ROIs if an ROI is configured,
+    in the output dtype of the Jungfrau correction if one is configured."""
+    rois = get_rois(daq_config)
+    shape = get_roi_shape(rois) if rois else [daq_config['image_pixel_height'], daq_config['image_pixel_width']]
+
+    correction_config = get_correction_config(daq_config)
+    dtype = get_output_dtype(correction_config) if correction_config else f'uint{daq_config["bit_depth"]}'
+    image_n_bytes = np.dtype(dtype).itemsize * shape[0] * shape[1]
+
+    return shape, dtype, image_n_bytes
+
+
+def get_input_channel(daq_config):
+    """Channel name of the buffer compression reads from and the address of its image metadata stream:
+    the output of the last configured stage out of the ROI and Jungfrau correction, else the detector images."""
+    detector_name = daq_config['detector_name']
+    if get_correction_config(daq_config):
+        return get_correction_channel_name(detector_name), get_corrected_stream_address(detector_name)
+    if get_rois(daq_config):
+        return get_roi_channel_name(detector_name), get_roi_stream_address(detector_name)
+
+    return detector_name, f"{IPC_BASE}/{detector_name}-image"
+
+
+def open_buffers(daq_config, create_output=False, n_partitions=1):
+    detector_name = daq_config['detector_name']
+    _, _, image_n_bytes = get_image_geometry(daq_config)
+    backend = daq_config.get('ram_buffer_backend')
+    input_channel_name, _ = get_input_channel(daq_config)
+
+    input_buffer = RamBuffer(channel_name=input_channel_name, data_n_bytes=image_n_bytes, n_slots=N_IMAGE_SLOTS,
+                             backend=backend)
+    if create_output:
+        output_buffer = PackedRamBuffer(channel_name=detector_name, ring_n_bytes=image_n_bytes * N_IMAGE_SLOTS,
+                                        n_slots=N_COMPRESSED_SLOTS, create=True, backend=backend,
+                                        n_partitions=n_partitions)
+    else:
+        output_buffer = PackedRamBuffer(channel_name=detector_name, backend=backend)
+
+    return input_buffer, output_buffer
+
+
+class ImageCompressor(object):
+    def __init__(self, daq_config, input_buffer, output_buffer, partition=0, codec=None):
+        self.shape, self.dtype, _ = get_image_geometry(daq_config)
+        self.input_buffer = input_buffer
+        self.output_buffer = output_buffer
+        self.partition = partition
+
+        self.element_n_bytes = np.dtype(self.dtype).itemsize
+        self.set_codec(get_codec(daq_config) if codec is None else codec)
+
+    def set_codec(self, codec):
+        self.codec = codec
+        self.max_compressed_n_bytes = codec.get_max_n_bytes(self.shape[0] * self.shape[1], self.element_n_bytes)
+        _logger.info(f"Compressing with codec {codec.name} (level={getattr(codec, 'level', None)}, "
+                     f"block_size={getattr(codec, 'block_size', None)}).")
+
+    def compress(self, image_meta):
+        """Compress the image straight into the reserved region of the output buffer and update image_meta.
+        Returns the number of uncompressed bytes."""
+        data = self.input_buffer.get_data(image_meta.image_id, shape=self.shape, dtype=self.dtype)
+
+        output_data = self.output_buffer.reserve(image_meta.image_id, self.max_compressed_n_bytes,
+                                                 partition=self.partition)
+        try:
+            n_compressed_bytes = self.codec.compress_into(data, output_data)
+        except Exception:
+            self.output_buffer.abort(image_meta.image_id)
+            raise
+        self.output_buffer.commit(image_meta.image_id, n_compressed_bytes)
+
+        image_meta.size = n_compressed_bytes
+        image_meta.compression = self.codec.encoding
+        image_meta.status = ImageMetadataStatus.compressed_image
+
+        return data.nbytes
+
+
+def get_worker_address(detector_name, i_worker):
+    return f"ipc:///tmp/{detector_name}-compression-worker-{i_worker}"
+
+
+def get_worker_cursor_name(i_worker):
+    return f'compression-{i_worker}'
+
+
+def get_results_address(detector_name):
+    return f"ipc:///tmp/{detector_name}-compression-results"
+
+
+def start_worker(config_file, i_worker, core_id=None):
+    """Compress the images dispatched to this worker into its own partition of the compressed buffer.
+    Results are sent back as [metadata, compression time in ns, overrun flag]. The overrun flag is b'1' if the
+    image was overwritten in the input ring before the compression finished."""
+    if core_id is not None:
+        os.sched_setaffinity(0, {core_id})
+
+    daq_config = load_daq_config(config_file)
+    detector_name = daq_config['detector_name']
+    _logger.info(f"Starting compression worker {i_worker} for {detector_name} on core {core_id}.")
+
+    input_buffer, output_buffer = open_buffers(daq_config)
+    compressor = ImageCompressor(daq_config, input_buffer, output_buffer, partition=i_worker)
+
+    input_cursors, input_cursor = attach_consumer_cursor(input_buffer.buffer_name, get_worker_cursor_name(i_worker),
+                                                         backend=daq_config.get('ram_buffer_backend'))
+
+    ctx = zmq.Context()
+    receiver = ctx.socket(zmq.PULL)
+    receiver.connect(get_worker_address(detector_name, i_worker))
+    sender = ctx.socket(zmq.PUSH)
+    sender.connect(get_results_address(detector_name))
+
+    image_meta = ImageMetadata()
+    try:
+        while True:
+            message = receiver.recv_multipart()
+            if message[0] == WORKER_CODEC_COMMAND:
+                compressor.set_codec(create_codec(json.loads(message[1])))
+                continue
+
+            image_meta.ParseFromString(message[0])
+            start_time = perf_counter_ns()
+            try:
+                compressor.compress(image_meta)
+            except Exception:
+                _logger.exception(f"Compression worker {i_worker} failed to compress image_id {image_meta.image_id}.")
+                image_meta.status = STATUS_COMPRESSION_FAILED
+                image_meta.size = 0
+            compress_ns = perf_counter_ns() - start_time
+
+            overrun = b'0'
+            if input_cursors:
+                head_image_id, capacity = input_cursors.get_head()
+                if not is_in_window(image_meta.image_id, head_image_id, capacity or input_buffer.n_slots):
+                    overrun = b'1'
+                input_cursors.publish_cursor(input_cursor, image_meta.image_id)
+            sender.send_multipart([image_meta.SerializeToString(), str(compress_ns).encode(), overrun])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ctx.destroy(linger=0)
+
+    _logger.info(f"Compression worker {i_worker} stopped.")
@@ -8,6 +8,12 @@ DAQ_CONFIG_FIELDS = ['detector_name', 'detector_type',
 DAQ_CONFIG_INT_FIELDS = ['bit_depth', 'image_pixel_height', 'image_pixel_width', 'n_modules', 'start_udp_port',
                          'writer_user_id']
 
+# Optional tuning fields, kept across config updates when present.
+DAQ_CONFIG_OPTIONAL_FIELDS = ['ram_buffer_backend', 'compression_n_workers', 'compression_cores', 'compression_codec',
+                              'compression_controller', 'roi', 'jungfrau_correction', 'preview',
+                              'writer_frames_per_chunk', 'writer_queue_mb', 'writer_io_profiles',
+                              'writer_rollover', 'writer_n_writers', 'writer_swmr', 'writer_raw']
+
 IPC_BASE = "ipc:///tmp"
 
 
@@ -43,14 +49,32 @@ def get_stream_addresses(detector_name):
 
     return command_address, in_status_address, out_status_address, image_metadata_address
 
+
+def get_striped_command_address(command_address, i_writer):
+    """Command address of writer instance i_writer when the driver stripes images over several writers."""
+    return f'{command_address}-{i_writer}'
+
+
 def get_compressed_stream_address(detector_name):
     return f'{IPC_BASE}/{detector_name}-compressed'
 
 
+def get_roi_stream_address(detector_name):
+    return f'{IPC_BASE}/{detector_name}-roi'
+
+
+def get_corrected_stream_address(detector_name):
+    return f'{IPC_BASE}/{detector_name}-corrected'
+
+
 def update_config(old_config, config_updates):
     if old_config is not None:
         new_config = OrderedDict({param: getattr(config_updates, param, old_config[param])
                                   for param in DAQ_CONFIG_FIELDS})
+        for param in DAQ_CONFIG_OPTIONAL_FIELDS:
+            value = getattr(config_updates, param, old_config.get(param))
+            if value is not None:
+                new_config[param] = value
     else:
         new_config = config_updates
 
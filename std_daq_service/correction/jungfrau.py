@@ -0,0 +1,121 @@
+import h5py
+import numpy as np
+
+from std_daq_service.roi.extractor import RoiExtractor
+
+# Raw Jungfrau pixels: the top 2 bits select the gain stage, the lower 14 bits are the ADC value.
+ADC_MASK = 0x3FFF
+GAIN_SHIFT = 14
+# Gain bits 0b00 -> G0, 0b01 -> G1, 0b11 -> G2. 0b10 is invalid and maps to an empty row of the maps.
+GAIN_BITS_TO_INDEX = np.array([0, 1, 3, 2], dtype='uint8')
+N_GAINS = 3
+
+PEDESTAL_DATASET = 'pedestal'
+GAIN_DATASET = 'gain'
+
+OUTPUT_FLOAT32 = 'float32'
+OUTPUT_PHOTONS = 'photons'
+OUTPUT_DTYPES = {OUTPUT_FLOAT32: 'float32', OUTPUT_PHOTONS: 'uint16'}
+
+
+def get_correction_config(daq_config):
+    """The optional 'jungfrau_correction' DAQ config entry, for example:
+        {"pedestal_file": "/sf/pedestal.h5", "gain_file": "/sf/gains.h5", "output": "photons",
+         "photon_energy": 12.4, "n_threads": 4}
+    Pedestals are in ADU, gains in ADU per keV and the photon energy in keV. Returns None if not configured."""
+    correction_config = daq_config.get('jungfrau_correction')
+    if not correction_config:
+        return None
+
+    if daq_config['detector_type'] != 'jungfrau':
+        raise ValueError(f"Jungfrau correction configured for detector_type {daq_config['detector_type']}.")
+    if daq_config['bit_depth'] != 16:
+        raise ValueError(f"Jungfrau correction needs bit_depth 16, not {daq_config['bit_depth']}.")
+
+    output = correction_config.get('output', OUTPUT_FLOAT32)
+    if output not in OUTPUT_DTYPES:
+        raise ValueError(f"Unknown Jungfrau correction output {output}, choose from {list(OUTPUT_DTYPES)}.")
+    if output == OUTPUT_PHOTONS and not correction_config.get('photon_energy'):
+        raise ValueError("Jungfrau correction to photons needs the photon_energy in keV.")
+
+    return correction_config
+
+
+def get_output_dtype(correction_config):
+    return OUTPUT_DTYPES[correction_config.get('output', OUTPUT_FLOAT32)]
+
+
+def get_correction_channel_name(detector_name):
+    return f'{detector_name}-corrected'
+
+
+def load_maps(pedestal_file, gain_file, image_shape, rois=None):
+    """Pedestal and gain maps of shape (3, height, width) from HDF5, cropped to the rois if given."""
+    with h5py.File(pedestal_file, 'r') as input_file:
+        pedestal = input_file[PEDESTAL_DATASET][:]
+    with h5py.File(gain_file, 'r') as input_file:
+        gain = input_file[GAIN_DATASET][:]
+
+    for name, correction_map in (('pedestal', pedestal), ('gain', gain)):
+        if correction_map.shape != (N_GAINS,) + tuple(image_shape):
+            raise ValueError(f"The {name} map has shape {correction_map.shape}, "
+                             f"expected {(N_GAINS,) + tuple(image_shape)}.")
+
+    if rois:
+        extractor = RoiExtractor(rois)
+        pedestal = np.stack([extractor.extract(pedestal[i_gain]) for i_gain in range(N_GAINS)])
+        gain = np.stack([extractor.extract(gain[i_gain]) for i_gain in range(N_GAINS)])
+
+    return pedestal, gain
+
+
+class JungfrauCorrector(object):
+    """Converts raw gain-encoded Jungfrau frames into energy (float32) or photon counts (uint16).
+
+    energy = (adc - pedestal[gain]) / gain[gain], photons = round(energy / photon_energy), clipped at 0.
+    Pixels with the invalid gain bits 0b10 or a zero gain come out as 0.
+    """
+    def __init__(self, pedestal, gain, output=OUTPUT_FLOAT32, photon_energy=None):
+        self.shape = pedestal.shape[1:]
+        self.n_pixels = int(np.prod(self.shape))
+        self.output_dtype = OUTPUT_DTYPES[output]
+        self.photon_energy = photon_energy
+
+        # One extra row of zeros for the invalid gain, flattened so one gather picks the value of each pixel.
+        self._pedestal = np.zeros((N_GAINS + 1, self.n_pixels), dtype='float32')
+        self._pedestal[:N_GAINS] = pedestal.reshape(N_GAINS, -1)
+        self._pedestal = self._pedestal.reshape(-1)
+
+        self._inverse_gain = np.zeros((N_GAINS + 1, self.n_pixels), dtype='float32')
+        gain = gain.reshape(N_GAINS, -1).astype('float32')
+        np.divide(1, gain, out=self._inverse_gain[:N_GAINS], where=gain != 0)
+        if photon_energy:
+            self._inverse_gain /= photon_energy
+        self._inverse_gain = self._inverse_gain.reshape(-1)
+
+        self._pixel_index = np.arange(self.n_pixels, dtype=np.intp)
+
+    def correct(self, raw, output, pixels=slice(None)):
+        """Correct the pixels (a slice over the flattened frame) of raw into output, both of the frame shape.
+        Disjoint slices can be corrected in parallel threads, the numpy ufuncs release the GIL."""
+        raw = raw.reshape(-1)[pixels]
+        output = output.reshape(-1)[pixels]
+
+        # np.take is considerably faster than fancy indexing for these gathers.
+        map_index = np.take(GAIN_BITS_TO_INDEX, raw >> GAIN_SHIFT).astype(np.intp)
+        map_index *= self.n_pixels
+        map_index += self._pixel_index[pixels]
+
+        energy = (raw & ADC_MASK).astype('float32')
+        energy -= np.take(self._pedestal, map_index)
+        energy *= np.take(self._inverse_gain, map_index)
+
+        if self.output_dtype == OUTPUT_DTYPES[OUTPUT_PHOTONS]:
+            np.rint(energy, out=energy)
+            np.clip(energy, 0, np.iinfo(self.output_dtype).max, out=energy)
+        output[:] = energy
+
+    def get_pixel_blocks(self, n_blocks):
+        """Contiguous slices over the flattened frame, one per thread."""
+        bounds = np.linspace(0, self.n_pixels, n_blocks + 1).astype(int)
+        return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,129 @@
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import numpy as np
+from std_buffer.image_metadata_pb2 import ImageMetadata, ImageMetadataDtype
+import zmq
+from zmq import Again
+
+from std_daq_service.compression.worker import N_IMAGE_SLOTS
+from std_daq_service.config import load_daq_config, get_roi_stream_address, get_corrected_stream_address, IPC_BASE
+from std_daq_service.correction.jungfrau import JungfrauCorrector, get_correction_config, get_output_dtype, \
+    get_correction_channel_name, load_maps
+from std_daq_service.image_accounting import ImageIdAccounting
+from std_daq_service.ram_buffer import RamBuffer, RamBufferCursors, attach_consumer_cursor
+from std_daq_service.roi.extractor import get_rois, get_roi_shape, get_roi_channel_name
+
+_logger = logging.getLogger("Correction")
+
+
+def start_correction(config_file):
+    daq_config = load_daq_config(config_file)
+    detector_name = daq_config['detector_name']
+    backend = daq_config.get('ram_buffer_backend')
+
+    correction_config = get_correction_config(daq_config)
+    if not correction_config:
+        raise RuntimeError(f"No 'jungfrau_correction' in the DAQ config of {detector_name}.")
+
+    # Corrections run after the ROI stage, on the smaller images.
+    image_shape = [daq_config['image_pixel_height'], daq_config['image_pixel_width']]
+    rois = get_rois(daq_config)
+    if rois:
+        shape = get_roi_shape(rois)
+        input_channel_name, image_metadata_address = get_roi_channel_name(detector_name), \
+            get_roi_stream_address(detector_name)
+    else:
+        shape = image_shape
+        input_channel_name, image_metadata_address = detector_name, f"{IPC_BASE}/{detector_name}-image"
+
+    pedestal, gain = load_maps(correction_config['pedestal_file'], correction_config['gain_file'], image_shape,
+                               rois=rois)
+    corrector = JungfrauCorrector(pedestal, gain, output=correction_config.get('output', 'float32'),
+                                 photon_energy=correction_config.get('photon_energy'))
+    output_dtype = get_output_dtype(correction_config)
+
+    n_threads = int(correction_config.get('n_threads', 1))
+    pixel_blocks = corrector.get_pixel_blocks(n_threads)
+    executor = ThreadPoolExecutor(max_workers=n_threads)
+    _logger.info(f"Correcting {detector_name} images of shape {shape} to {output_dtype} with {n_threads} threads.")
+
+    ctx = zmq.Context()
+    image_metadata_receiver = ctx.socket(zmq.SUB)
+    image_metadata_receiver.connect(image_metadata_address)
+    image_metadata_receiver.setsockopt_string(zmq.SUBSCRIBE, "")
+    image_metadata_receiver.setsockopt(zmq.RCVTIMEO, 200)
+
+    image_metadata_sender = ctx.socket(zmq.PUB)
+    image_metadata_sender.bind(get_corrected_stream_address(detector_name))
+
+    output_n_bytes = corrector.n_pixels * np.dtype(output_dtype).itemsize
+    input_buffer = RamBuffer(channel_name=input_channel_name, data_n_bytes=corrector.n_pixels * 2,
+                             n_slots=N_IMAGE_SLOTS, backend=backend)
+    output_buffer = RamBuffer(channel_name=get_correction_channel_name(detector_name), data_n_bytes=output_n_bytes,
+                              n_slots=N_IMAGE_SLOTS, create=True, backend=backend)
+
+    input_cursors, input_cursor = attach_consumer_cursor(input_buffer.buffer_name, 'correction', backend=backend)
+    output_cursors = RamBufferCursors(output_buffer.buffer_name, capacity=N_IMAGE_SLOTS, backend=backend, create=True)
+
+    accounting = ImageIdAccounting('correction')
+    image_meta = ImageMetadata()
+    n_images = 0
+    start_time = time()
+    try:
+        while True:
+            try:
+                meta_raw = image_metadata_receiver.recv()
+            except Again:
+                meta_raw = None
+
+            if meta_raw is not None:
+                image_meta.ParseFromString(meta_raw)
+                accounting.record(image_meta.image_id)
+
+                raw = input_buffer.get_data(image_meta.image_id, shape=shape, dtype='uint16')
+                output = output_buffer.get_data(image_meta.image_id, shape=shape, dtype=output_dtype)
+                if n_threads == 1:
+                    corrector.correct(raw, output)
+                else:
+                    list(executor.map(lambda pixels: corrector.correct(raw, output, pixels), pixel_blocks))
+
+                if input_cursors:
+                    head_image_id, capacity = input_cursors.get_head()
+                    accounting.check_window(image_meta.image_id, head_image_id, capacity or input_buffer.n_slots)
+                    input_cursors.publish_cursor(input_cursor, image_meta.image_id)
+                output_cursors.publish_head(image_meta.image_id)
+
+                image_meta.dtype = ImageMetadataDtype.Value(output_dtype)
+                image_meta.size = output_n_bytes
+                image_metadata_sender.send(image_meta.SerializeToString())
+                n_images += 1
+
+            if time() - start_time > 1:
+                start_time = time()
+                print(f'Frequency {n_images} Hz; Image ids {accounting.get_stats()}')
+                n_images = 0
+
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        _logger.exception("Error in correction loop.")
+        raise
+    finally:
+        executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Jungfrau pedestal and gain correction')
+    parser.add_argument("config_file", type=str, help="Path to the config file managed by this instance.")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start_correction(config_file=args.config_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@ import os
 from collections import OrderedDict
 
 import cv2
-import h5py as h5py
 import numpy as np
 import redis
 import json
@@ -13,6 +12,7 @@ from io import BytesIO
 
 from std_daq_service.rest_v2.redis_storage import StdDaqRedisStorage
 from std_daq_service.rest_v2.utils import SwitchUser
+from std_daq_service.writer.swmr import SwmrReader
 
 _logger = logging.getLogger("FileValidator")
 
@@ -49,16 +49,17 @@ def validate_file(log, user_id, detector_name):
     readable = False
     n_images = None
     image_id_range = None
+    gif_bytes = None
 
     with SwitchUser(user_id):
-        with h5py.File(output_file, 'r') as out_f:
+        # Files written in SWMR mode can be validated while they are still written.
+        with SwmrReader(output_file, source_id) as reader:
             readable = True
-            data_shape = out_f[source_id]['data'].shape
-
-            n_images = data_shape[0]
-            image_id_range = [int(out_f[source_id]['image_id'][0]), int(out_f[source_id]['image_id'][-1])]
-
-            gif_bytes = create_gif(out_f[source_id]['data'], N_GIF_IMAGES)
+            n_images = reader.refresh()
+            # Open-ended acquisitions stopped before the first image leave an empty file.
+            if n_images:
+                image_id_range = [int(reader.image_id[0]), int(reader.image_id[n_images - 1])]
+                gif_bytes = create_gif(reader.data, N_GIF_IMAGES)
 
     return {
         'readable': readable,
@@ -97,7 +98,8 @@ def start_validator(config_file, redis_url):
                 'report': report
             })
 
-            storage.add_gif(last_log_id, gif_bytes)
+            if gif_bytes is not None:
+                storage.add_gif(last_log_id, gif_bytes)
 
         except KeyboardInterrupt:
             break
@@ -0,0 +1,72 @@
+import logging
+
+_logger = logging.getLogger("ImageIdAccounting")
+
+# Counters every stage reports, in the stats and in the acquisition log.
+IMAGE_ID_STATS_FIELDS = ['n_missing_images', 'n_duplicate_images', 'n_out_of_order_images', 'n_overrun_images']
+
+
+def is_in_window(image_id, head_image_id, capacity):
+    """True if image_id is still among the last capacity images of a ring whose producer is at head_image_id.
+    Without a known capacity every image is considered in the window."""
+    return not capacity or head_image_id - image_id < capacity
+
+
+class ImageIdAccounting(object):
+    """Tracks the continuity of the image_ids a pipeline stage sees and the frames it read too late.
+
+    A gap counts every skipped image_id as missing. An image_id equal to the last one is a duplicate, an older
+    one is out of order (it was already counted as missing). Overruns are frames that were overwritten in the
+    ring before or while the stage read them.
+    """
+    def __init__(self, stage_name):
+        self.stage_name = stage_name
+        self.reset()
+
+    def reset(self):
+        self.last_image_id = None
+        self.n_images = 0
+        self.stats = dict.fromkeys(IMAGE_ID_STATS_FIELDS, 0)
+
+    def record(self, image_id):
+        """Account for image_id arriving at the stage. Returns the number of image_ids missing before it."""
+        self.n_images += 1
+
+        if self.last_image_id is None:
+            self.last_image_id = image_id
+            return 0
+
+        if image_id == self.last_image_id:
+            self.stats['n_duplicate_images'] += 1
+            _logger.warning(f"{self.stage_name} received image_id {image_id} twice.")
+            return 0
+
+        if image_id < self.last_image_id:
+            self.stats['n_out_of_order_images'] += 1
+            _logger.warning(f"{self.stage_name} received image_id {image_id} after {self.last_image_id}.")
+            return 0
+
+        n_missing = image_id - self.last_image_id - 1
+        if n_missing:
+            self.stats['n_missing_images'] += n_missing
+            _logger.warning(f"{self.stage_name} missed {n_missing} image_ids between {self.last_image_id} "
+                            f"and {image_id}.")
+
+        self.last_image_id = image_id
+        return n_missing
+
+    def record_overrun(self, image_id):
+        self.stats['n_overrun_images'] += 1
+        _logger.error(f"{self.stage_name} read image_id {image_id} after it was overwritten in the ring.")
+
+    def check_window(self, image_id, head_image_id, capacity):
+        """Record an overrun if image_id is no longer among the last capacity images before head_image_id.
+        Call it after reading the frame, so an overwrite during the read is also caught. Returns True if intact."""
+        if is_in_window(image_id, head_image_id, capacity):
+            return True
+
+        self.record_overrun(image_id)
+        return False
+
+    def get_stats(self):
+        return dict(self.stats)
@@ -6,7 +6,7 @@ import logging
 import zmq
 from tifffile import tifffile
 
-from std_daq_service.ram_buffer import RamBuffer
+from std_daq_service.ram_buffer import RamBuffer, RamBufferCursors
 from std_daq_service.rest_v2.utils import set_ipc_rights
 from std_buffer.image_metadata_pb2 import ImageMetadata, ImageMetadataStatus, GFImageMetadata, JFImageMetadata, EGImageMetadata
 
@@ -73,7 +73,10 @@ def main():
     metadata_sender.bind(metadata_address)
     set_ipc_rights(metadata_address)
 
-    ram_buffer = RamBuffer(channel_name=detector_name, data_n_bytes=image_n_bytes, n_slots=N_RAM_BUFFER_SLOTS)
+    ram_buffer = RamBuffer(channel_name=detector_name, data_n_bytes=image_n_bytes, n_slots=N_RAM_BUFFER_SLOTS,
+                           backend=config.get('ram_buffer_backend'))
+    cursors = RamBufferCursors(ram_buffer.buffer_name, capacity=N_RAM_BUFFER_SLOTS,
+                               backend=config.get('ram_buffer_backend'), create=True)
 
     i_image = 0
     try:
@@ -82,6 +85,7 @@ def main():
             meta.image_id = i_image
 
             ram_buffer.write(i_image, image_bytes)
+            cursors.publish_head(i_image)
             metadata_sender.send(meta.SerializeToString())
 
             i_image += 1
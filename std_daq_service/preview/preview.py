@@ -0,0 +1,132 @@
+import logging
+
+import numpy as np
+
+from std_daq_service.ram_buffer import RamBuffer, RamBufferCursors
+from std_daq_service.roi.extractor import get_rois, get_roi_shape
+
+_logger = logging.getLogger("Preview")
+
+PREVIEW_N_SLOTS = 16
+DEFAULT_PREVIEW_RATE = 5
+DEFAULT_PREVIEW_MAX_HEIGHT = 600
+DEFAULT_PREVIEW_MAX_WIDTH = 800
+PREVIEW_BIT_DEPTHS = [8, 16]
+
+
+def get_preview_config(daq_config):
+    """The optional 'preview' DAQ config entry with defaults filled in, for example:
+        {"rate": 5, "max_height": 600, "max_width": 800, "bit_depth": 8}
+    rate is in previews per second. Returns None if not configured."""
+    preview_config = daq_config.get('preview')
+    if not preview_config:
+        return None
+
+    preview_config = {'rate': float(preview_config.get('rate', DEFAULT_PREVIEW_RATE)),
+                      'max_height': int(preview_config.get('max_height', DEFAULT_PREVIEW_MAX_HEIGHT)),
+                      'max_width': int(preview_config.get('max_width', DEFAULT_PREVIEW_MAX_WIDTH)),
+                      'bit_depth': int(preview_config.get('bit_depth', 8))}
+    if preview_config['bit_depth'] not in PREVIEW_BIT_DEPTHS:
+        raise ValueError(f"Preview bit_depth must be one of {PREVIEW_BIT_DEPTHS}, not {preview_config['bit_depth']}.")
+
+    return preview_config
+
+
+def get_preview_image_shape(daq_config):
+    """Shape of the images the preview stage bins: the stacked ROIs if an ROI is configured."""
+    rois = get_rois(daq_config)
+    return get_roi_shape(rois) if rois else [daq_config['image_pixel_height'], daq_config['image_pixel_width']]
+
+
+def get_bin_factor(image_shape, max_height, max_width):
+    """Smallest integer binning that fits image_shape into max_height x max_width."""
+    return max(1, -(-image_shape[0] // max_height), -(-image_shape[1] // max_width))
+
+
+def make_preview(image, bin_factor, bit_depth=8, output=None):
+    """Bin image by bin_factor in both directions and flip it vertically for display.
+
+    8-bit previews are scaled to the full range between the frame minimum and maximum. 16-bit previews keep the
+    binned mean, clipped to 16 bits. Rows and columns that do not fill a whole bin are dropped.
+    """
+    height, width = image.shape[0] // bin_factor, image.shape[1] // bin_factor
+    binned = image[:height * bin_factor, :width * bin_factor]
+    if bin_factor > 1:
+        binned = binned.reshape(height, bin_factor, width, bin_factor).sum(axis=(1, 3), dtype='float32')
+        binned /= bin_factor * bin_factor
+    else:
+        binned = binned.astype('float32')
+
+    if bit_depth == 8:
+        min_value = binned.min()
+        binned -= min_value
+        binned *= 255.0 / (binned.max() or 1)
+    np.clip(binned, 0, 2 ** bit_depth - 1, out=binned)
+
+    if output is None:
+        output = np.empty((height, width), dtype=f'uint{bit_depth}')
+    output[:] = binned[::-1]
+    return output
+
+
+def to_display(preview):
+    """8-bit previews are display-ready, 16-bit previews keep the binned values and are scaled to 8 bits."""
+    if preview.dtype == np.uint8:
+        return preview
+
+    min_value = preview.min()
+    return ((preview - min_value) * (255.0 / ((preview.max() - min_value) or 1))).astype(np.uint8)
+
+
+class PreviewBuffer(object):
+    """Small ring of display-ready previews in shared memory, written once by the preview stage and read by every
+    live viewer. Slots are keyed by the detector image_id, the cursors head points at the latest preview."""
+    def __init__(self, detector_name, image_shape, preview_config, create=False, backend=None):
+        self.bin_factor = get_bin_factor(image_shape, preview_config['max_height'], preview_config['max_width'])
+        self.shape = (image_shape[0] // self.bin_factor, image_shape[1] // self.bin_factor)
+        self.bit_depth = preview_config['bit_depth']
+        self.dtype = f'uint{self.bit_depth}'
+
+        data_n_bytes = self.shape[0] * self.shape[1] * self.bit_depth // 8
+        self.buffer = RamBuffer(channel_name=f'{detector_name}-preview', data_n_bytes=data_n_bytes,
+                                n_slots=PREVIEW_N_SLOTS, create=create, slot_header=True, backend=backend)
+        self.cursors = RamBufferCursors(self.buffer.buffer_name, capacity=PREVIEW_N_SLOTS, backend=backend,
+                                        create=create)
+
+    def write(self, image_id, image):
+        output = self.buffer.reserve(image_id, self.buffer.data_bytes)
+        make_preview(image, self.bin_factor, self.bit_depth, output=output.view(self.dtype).reshape(self.shape))
+        self.buffer.commit(image_id, self.buffer.data_bytes)
+        self.cursors.publish_head(image_id)
+
+    def get_latest(self):
+        """Returns (image_id, preview copy) of the latest preview, or (None, None) if there is none (yet)."""
+        image_id, _ = self.cursors.get_head()
+        data, sequence = self.buffer.get_data_checked(image_id, shape=self.shape, dtype=self.dtype)
+        if data is None:
+            return None, None
+
+        preview = data.copy()
+        if not self.buffer.is_unchanged(image_id, sequence):
+            return None, None
+
+        return image_id, preview
+
+    def unlink(self):
+        self.buffer.shm.unlink()
+        self.cursors.shm.unlink()
+
+
+def attach_preview_buffer(daq_config):
+    """Attach a live viewer to the preview buffer of the detector.
+    Returns None if no preview is configured or the preview stage has not created the buffer yet."""
+    preview_config = get_preview_config(daq_config)
+    if not preview_config:
+        return None
+
+    try:
+        return PreviewBuffer(daq_config['detector_name'], get_preview_image_shape(daq_config), preview_config,
+                             backend=daq_config.get('ram_buffer_backend'))
+    except FileNotFoundError:
+        _logger.warning(f"No preview buffer for {daq_config['detector_name']}, is the preview stage running?")
+        return None
@@ -0,0 +1,101 @@
+import argparse
+import logging
+from time import time
+
+from std_buffer.image_metadata_pb2 import ImageMetadata
+import zmq
+from zmq import Again
+
+from std_daq_service.compression.worker import get_image_geometry, get_input_channel, N_IMAGE_SLOTS
+from std_daq_service.config import load_daq_config
+from std_daq_service.image_accounting import ImageIdAccounting
+from std_daq_service.preview.preview import PreviewBuffer, get_preview_config
+from std_daq_service.ram_buffer import RamBuffer, RamBufferCursors
+
+_logger = logging.getLogger("Preview")
+
+
+def start_preview(config_file):
+    daq_config = load_daq_config(config_file)
+    detector_name = daq_config['detector_name']
+    backend = daq_config.get('ram_buffer_backend')
+
+    preview_config = get_preview_config(daq_config)
+    if not preview_config:
+        raise RuntimeError(f"No 'preview' in the DAQ config of {detector_name}.")
+
+    # Previews show the images as they go into compression, after the ROI and correction stages.
+    shape, dtype, image_n_bytes = get_image_geometry(daq_config)
+    input_channel_name, image_metadata_address = get_input_channel(daq_config)
+
+    ctx = zmq.Context()
+    image_metadata_receiver = ctx.socket(zmq.SUB)
+    image_metadata_receiver.connect(image_metadata_address)
+    image_metadata_receiver.setsockopt_string(zmq.SUBSCRIBE, "")
+    image_metadata_receiver.setsockopt(zmq.RCVTIMEO, 200)
+
+    input_buffer = RamBuffer(channel_name=input_channel_name, data_n_bytes=image_n_bytes, n_slots=N_IMAGE_SLOTS,
+                             backend=backend)
+    preview_buffer = PreviewBuffer(detector_name, shape, preview_config, create=True, backend=backend)
+    # Only the producer head is read, the preview does not keep up with every image and publishes no cursor.
+    try:
+        input_cursors = RamBufferCursors(input_buffer.buffer_name, backend=backend)
+    except FileNotFoundError:
+        _logger.warning(f"No cursors for {input_buffer.buffer_name}, overruns will not be detected.")
+        input_cursors = None
+    _logger.info(f"Writing {preview_buffer.shape} previews of {detector_name} at {preview_config['rate']} Hz "
+                 f"(bin_factor={preview_buffer.bin_factor}).")
+
+    preview_interval = 1 / preview_config['rate']
+    accounting = ImageIdAccounting('preview')
+    image_meta = ImageMetadata()
+    n_previews = 0
+    last_preview_time = 0
+    start_time = time()
+    while True:
+        try:
+            try:
+                meta_raw = image_metadata_receiver.recv()
+            except Again:
+                meta_raw = None
+
+            if meta_raw is not None:
+                image_meta.ParseFromString(meta_raw)
+                accounting.record(image_meta.image_id)
+
+                # Frames between previews are only accounted for, never touched.
+                current_time = time()
+                if current_time - last_preview_time >= preview_interval:
+                    last_preview_time = current_time
+
+                    image = input_buffer.get_data(image_meta.image_id, shape=shape, dtype=dtype)
+                    preview_buffer.write(image_meta.image_id, image)
+                    if input_cursors:
+                        head_image_id, capacity = input_cursors.get_head()
+                        accounting.check_window(image_meta.image_id, head_image_id, capacity or input_buffer.n_slots)
+                    n_previews += 1
+
+            if time() - start_time > 1:
+                start_time = time()
+                print(f'Previews {n_previews} Hz; Image ids {accounting.get_stats()}')
+                n_previews = 0
+
+        except KeyboardInterrupt:
+            break
+        except Exception:
+            _logger.exception("Error in preview loop.")
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preview buffer for live viewers')
+    parser.add_argument("config_file", type=str, help="Path to the config file managed by this instance.")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start_preview(config_file=args.config_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,9 @@ image_metadata_dtype_mapping = {
 
 image_metadata_encoding_mapping = {
     0: 'raw',
-    1: 'bshuffle_lz4'
+    1: 'bshuffle_lz4',
+    2: 'blosc2',
+    3: 'bshuffle_zstd'
 }
 
 
@@ -1,40 +1,643 @@
+import ctypes
 import logging
+import mmap
+import os
+import platform
 from multiprocessing.shared_memory import SharedMemory
+from time import time_ns
 
 import numpy as np
 
 _logger = logging.getLogger("RamBuffer")
 
+SHM_PATH = '/dev/shm'
+HUGETLBFS_PATH = '/dev/hugepages'
+HUGEPAGE_N_BYTES = 2 * 1024 * 1024
+
+# mbind is not exported by glibc, call it directly. Values from linux/mempolicy.h and the syscall tables.
+SYS_MBIND = {'x86_64': 237, 'aarch64': 235, 'ppc64le': 259}
+MPOL_BIND = 2
+MPOL_MF_MOVE = 2
+
+# Per-slot header, stored after the data region so the data layout stays compatible with headerless buffers.
+# The sequence is a seqlock counter: odd while a write is in progress, incremented to even when the write completes.
+SLOT_HEADER_DTYPE = np.dtype([('sequence', '<u8'),
+                              ('image_id', '<u8'),
+                              ('size', '<u8'),
+                              ('flags', '<u8')])
+SLOT_FLAG_WRITE_COMPLETE = 1
+
+
+class MmapSharedMemory:
+    """SharedMemory replacement backed by an explicit mmap, with optional hugepages, prefaulting and NUMA binding.
+
+    With hugepages=None or 'thp' the segment lives in /dev/shm and is interchangeable with SharedMemory.
+    With hugepages='hugetlbfs' it lives on the hugetlbfs mount and all processes must use this backend.
+    Prefaulting and NUMA binding only apply when creating the segment.
+    """
+    def __init__(self, name, create=False, size=0, hugepages=None, prefault=False, numa_node=None):
+        if hugepages not in (None, 'thp', 'hugetlbfs'):
+            raise ValueError(f"Unknown hugepages mode {hugepages}. Use None, 'thp' or 'hugetlbfs'.")
+
+        self.name = name
+        self._path = os.path.join(HUGETLBFS_PATH if hugepages == 'hugetlbfs' else SHM_PATH, name)
+        self._mmap = None
+        self.buf = None
+
+        if create:
+            if hugepages == 'hugetlbfs':
+                size += -size % HUGEPAGE_N_BYTES
+            # No O_EXCL: a restarted producer takes over the segment left behind by its predecessor.
+            fd = os.open(self._path, os.O_CREAT | os.O_RDWR, 0o666)
+        else:
+            fd = os.open(self._path, os.O_RDWR)
+
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            else:
+                size = os.fstat(fd).st_size
+
+            flags = mmap.MAP_SHARED
+            # MAP_POPULATE would fault pages before mbind, so with NUMA binding we touch the pages explicitly.
+            if create and prefault and numa_node is None:
+                flags |= mmap.MAP_POPULATE
+            self._mmap = mmap.mmap(fd, size, flags=flags)
+        finally:
+            os.close(fd)
+
+        self.size = size
+
+        if hugepages == 'thp':
+            self._mmap.madvise(mmap.MADV_HUGEPAGE)
+
+        if create and numa_node is not None:
+            self._bind_numa_node(numa_node)
+
+        self.buf = memoryview(self._mmap)
+
+        if create and prefault and numa_node is not None:
+            self._touch_pages()
+
+    def _bind_numa_node(self, numa_node):
+        syscall_number = SYS_MBIND.get(platform.machine())
+        if syscall_number is None:
+            _logger.warning(f"NUMA binding not supported on {platform.machine()}.")
+            return
+
+        c_buffer = ctypes.c_char.from_buffer(self._mmap)
+        address = ctypes.addressof(c_buffer)
+        del c_buffer
+
+        node_mask = ctypes.c_ulong(1 << numa_node)
+        libc = ctypes.CDLL(None, use_errno=True)
+        result = libc.syscall(ctypes.c_long(syscall_number), ctypes.c_void_p(address), ctypes.c_ulong(self.size),
+                              ctypes.c_int(MPOL_BIND), ctypes.byref(node_mask), ctypes.c_ulong(64),
+                              ctypes.c_uint(MPOL_MF_MOVE))
+        if result != 0:
+            errno = ctypes.get_errno()
+            _logger.warning(f"Binding {self.name} to NUMA node {numa_node} failed: {os.strerror(errno)}.")
+
+    def _touch_pages(self):
+        page_n_bytes = mmap.PAGESIZE
+        pages = np.ndarray((self.size // page_n_bytes,), dtype='uint8', buffer=self.buf, strides=(page_n_bytes,))
+        # Write to every page without changing its content - the write fault is what allocates the page.
+        pages |= 0
+
+    def close(self):
+        if self.buf is not None:
+            self.buf.release()
+            self.buf = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def unlink(self):
+        os.unlink(self._path)
+
+
+def open_shared_memory(name, create, size, backend=None):
+    """Open the shared memory segment for a buffer. backend is the optional 'ram_buffer_backend' from the DAQ config,
+    for example {"type": "mmap", "hugepages": "thp", "prefault": true, "numa_node": 0}."""
+    if not backend or backend.get('type', 'shm') == 'shm':
+        return SharedMemory(name=name, create=create, size=size)
+
+    if backend['type'] != 'mmap':
+        raise ValueError(f"Unknown ram buffer backend type {backend['type']}.")
+
+    return MmapSharedMemory(name=name, create=create, size=size,
+                            hugepages=backend.get('hugepages'),
+                            prefault=backend.get('prefault', False),
+                            numa_node=backend.get('numa_node'))
+
 
 class RamBuffer:
-    def __init__(self, channel_name, data_n_bytes, n_slots, compression=None, create=False):
+    def __init__(self, channel_name, data_n_bytes, n_slots, compression=None, create=False, slot_header=False,
+                 backend=None):
         compression_text = 'image' if compression is None else 'compressed'
         self.buffer_name = f'{channel_name}-{compression_text}'
 
         self.n_slots = n_slots
         self.data_bytes = data_n_bytes
         self.buffer_bytes = self.data_bytes * self.n_slots
+        self.slot_header = slot_header
+        self.header_bytes = SLOT_HEADER_DTYPE.itemsize * self.n_slots if slot_header else 0
 
         _logger.info(f"Opening buffer_name {self.buffer_name} with n_slots {self.n_slots} "
-                     f"for data_bytes {self.data_bytes}")
+                     f"for data_bytes {self.data_bytes} (slot_header={self.slot_header})")
 
         self.shm = None
+        self._headers = None
 
         try:
-            self.shm = SharedMemory(name=self.buffer_name, create=create, size=self.buffer_bytes)
+            self.shm = open_shared_memory(self.buffer_name, create=create, size=self.buffer_bytes + self.header_bytes,
+                                          backend=backend)
         except FileNotFoundError:
             _logger.error("SharedMemory failed: %s not found", self.buffer_name)
             raise
 
+        if self.slot_header:
+            if self.shm.size < self.buffer_bytes + self.header_bytes:
+                raise RuntimeError(f"Buffer {self.buffer_name} has {self.shm.size} bytes, but slot headers need "
+                                   f"{self.buffer_bytes + self.header_bytes}. Was it created without slot_header?")
+
+            self._headers = np.ndarray((self.n_slots,), dtype=SLOT_HEADER_DTYPE,
+                                       buffer=self.shm.buf, offset=self.buffer_bytes)
+            self._sequence = self._headers['sequence']
+            self._image_id = self._headers['image_id']
+            self._size = self._headers['size']
+            self._flags = self._headers['flags']
+
+            if create:
+                self._headers.fill(0)
+
     def __del__(self):
+        # Views into the shared memory must be released before it can be closed.
+        self._headers = None
+        self._sequence = self._image_id = self._size = self._flags = None
+
         if self.shm:
             self.shm.close()
 
+    def _check_slot_header(self):
+        if not self.slot_header:
+            raise RuntimeError(f"Buffer {self.buffer_name} was opened without slot_header.")
+
+    def _begin_write(self, slot, image_id):
+        self._sequence[slot] += 1
+        self._flags[slot] = 0
+        self._image_id[slot] = image_id
+
+    def _end_write(self, slot, n_bytes):
+        self._size[slot] = n_bytes
+        self._flags[slot] = SLOT_FLAG_WRITE_COMPLETE
+        self._sequence[slot] += 1
+
     def write(self, image_id, data):
-        offset = (image_id % self.n_slots) * self.data_bytes
+        slot = image_id % self.n_slots
+        if self.slot_header:
+            self._begin_write(slot, image_id)
+
+        offset = slot * self.data_bytes
         output_buffer = np.ndarray(data.shape, dtype=data.dtype, buffer=self.shm.buf, offset=offset)
         output_buffer[:] = data
 
+        if self.slot_header:
+            self._end_write(slot, data.nbytes)
+
+    def reserve(self, image_id, max_bytes):
+        """Writable uint8 view into the slot of image_id. The write is published with commit()."""
+        if max_bytes > self.data_bytes:
+            raise ValueError(f"Cannot reserve {max_bytes} bytes in slots of {self.data_bytes} bytes.")
+
+        slot = image_id % self.n_slots
+        if self.slot_header:
+            self._begin_write(slot, image_id)
+
+        return np.ndarray((max_bytes,), dtype='uint8', buffer=self.shm.buf, offset=slot * self.data_bytes)
+
+    def commit(self, image_id, n_bytes):
+        if self.slot_header:
+            self._end_write(image_id % self.n_slots, n_bytes)
+
+    def abort(self, image_id):
+        """Cancel the reservation for image_id. The slot stays marked as incomplete."""
+        if self.slot_header:
+            self._sequence[image_id % self.n_slots] += 1
+
     def get_data(self, image_id, shape, dtype):
         offset = (image_id % self.n_slots) * self.data_bytes
         return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+
+    def get_range(self, start_image_id, count, shape, dtype, concatenate=False):
+        """Views over count consecutive images, each of shape (n_images, *shape).
+
+        Returns one view, or two if the range wraps around the end of the ring. With concatenate=True a single
+        array is returned, which is a copy only when the range wraps.
+        """
+        if count > self.n_slots:
+            raise ValueError(f"Cannot get {count} images from a buffer with {self.n_slots} slots.")
+
+        dtype = np.dtype(dtype)
+        image_strides = tuple(np.empty((0,) + tuple(shape), dtype=dtype).strides[1:])
+
+        views = []
+        start_slot = start_image_id % self.n_slots
+        while count > 0:
+            n_images = min(count, self.n_slots - start_slot)
+            views.append(np.ndarray((n_images,) + tuple(shape), dtype=dtype, buffer=self.shm.buf,
+                                    offset=start_slot * self.data_bytes, strides=(self.data_bytes,) + image_strides))
+            count -= n_images
+            start_slot = 0
+
+        if concatenate:
+            return views[0] if len(views) == 1 else np.concatenate(views)
+        return views
+
+    def get_data_checked(self, image_id, shape, dtype):
+        """Seqlock read: returns (data, sequence), or (None, sequence) if the slot does not hold image_id.
+
+        The returned data is a view into the buffer. Once the consumer is done with it, call
+        is_unchanged(image_id, sequence) to verify the producer did not overwrite the slot in the meantime.
+        """
+        self._check_slot_header()
+
+        slot = image_id % self.n_slots
+        sequence = int(self._sequence[slot])
+
+        if sequence & 1 or self._image_id[slot] != image_id or not self._flags[slot] & SLOT_FLAG_WRITE_COMPLETE:
+            return None, sequence
+
+        return self.get_data(image_id, shape, dtype), sequence
+
+    def is_unchanged(self, image_id, sequence):
+        self._check_slot_header()
+
+        slot = image_id % self.n_slots
+        return int(self._sequence[slot]) == sequence and self._image_id[slot] == image_id
+
+    def get_slot_info(self, image_id):
+        self._check_slot_header()
+
+        slot = image_id % self.n_slots
+        return {'image_id': int(self._image_id[slot]),
+                'generation': int(self._sequence[slot]) // 2,
+                'size': int(self._size[slot]),
+                'write_complete': bool(self._flags[slot] & SLOT_FLAG_WRITE_COMPLETE)}
+
+
+# Each partition of a PackedRamBuffer has its own head, so one producer process per partition can write lock-free.
+PACKED_MAX_PARTITIONS = 64
+# Control block at the start of a PackedRamBuffer, padded to cache lines.
+PACKED_CONTROL_DTYPE = np.dtype([('ring_n_bytes', '<u8'),
+                                 ('n_slots', '<u8'),
+                                 ('n_partitions', '<u8'),
+                                 ('partition_n_bytes', '<u8'),
+                                 ('padding', 'V32'),
+                                 ('head', '<u8', (PACKED_MAX_PARTITIONS,))])
+PACKED_CONTROL_N_BYTES = PACKED_CONTROL_DTYPE.itemsize
+# Index entry per image_id % n_slots. The offset is logical (monotonic) within the partition,
+# the physical offset is partition * partition_n_bytes + offset % partition_n_bytes.
+PACKED_INDEX_DTYPE = np.dtype([('sequence', '<u8'),
+                               ('image_id', '<u8'),
+                               ('partition', '<u8'),
+                               ('offset', '<u8'),
+                               ('size', '<u8')])
+# Payloads start on cache line boundaries.
+PACKED_ALIGNMENT = 64
+
+
+class PackedRamBuffer:
+    """Byte ring for variable-length payloads (compressed images), laid out back to back.
+
+    Only the producer needs to specify the geometry, consumers read it from the control block.
+    The ring can be split into n_partitions, each with a single producer process; consumers find the partition
+    of an image in the index.
+    """
+    def __init__(self, channel_name, ring_n_bytes=None, n_slots=None, create=False, backend=None, n_partitions=1):
+        self.buffer_name = f'{channel_name}-compressed'
+        self.shm = None
+        self._control = None
+        self._index = None
+        self._data = None
+        self._reserved_start = None
+
+        if create:
+            if ring_n_bytes is None or n_slots is None:
+                raise ValueError("ring_n_bytes and n_slots are needed to create a PackedRamBuffer.")
+            if not 0 < n_partitions <= PACKED_MAX_PARTITIONS:
+                raise ValueError(f"n_partitions must be between 1 and {PACKED_MAX_PARTITIONS}.")
+
+            partition_n_bytes = ring_n_bytes // n_partitions
+            partition_n_bytes -= partition_n_bytes % PACKED_ALIGNMENT
+            ring_n_bytes = partition_n_bytes * n_partitions
+            buffer_bytes = PACKED_CONTROL_N_BYTES + PACKED_INDEX_DTYPE.itemsize * n_slots + ring_n_bytes
+        else:
+            buffer_bytes = 0
+
+        try:
+            self.shm = open_shared_memory(self.buffer_name, create=create, size=buffer_bytes, backend=backend)
+        except FileNotFoundError:
+            _logger.error("SharedMemory failed: %s not found", self.buffer_name)
+            raise
+
+        self._control = np.ndarray((1,), dtype=PACKED_CONTROL_DTYPE, buffer=self.shm.buf)
+        if create:
+            self._control['ring_n_bytes'] = ring_n_bytes
+            self._control['n_slots'] = n_slots
+            self._control['n_partitions'] = n_partitions
+            self._control['partition_n_bytes'] = partition_n_bytes
+            self._control['head'] = 0
+
+        self.ring_n_bytes = int(self._control['ring_n_bytes'][0])
+        self.n_slots = int(self._control['n_slots'][0])
+        self.n_partitions = int(self._control['n_partitions'][0])
+        self.partition_n_bytes = int(self._control['partition_n_bytes'][0])
+        self._head = self._control['head'][0]
+
+        _logger.info(f"Opening packed buffer_name {self.buffer_name} with n_slots {self.n_slots} "
+                     f"for ring_n_bytes {self.ring_n_bytes} in n_partitions {self.n_partitions}")
+
+        self._index = np.ndarray((self.n_slots,), dtype=PACKED_INDEX_DTYPE,
+                                 buffer=self.shm.buf, offset=PACKED_CONTROL_N_BYTES)
+        if create:
+            self._index.fill(0)
+        self._sequence = self._index['sequence']
+        self._image_id = self._index['image_id']
+        self._partition = self._index['partition']
+        self._offset = self._index['offset']
+        self._size = self._index['size']
+
+        self._data_offset = PACKED_CONTROL_N_BYTES + self._index.nbytes
+        self._data = np.ndarray((self.ring_n_bytes,), dtype='uint8', buffer=self.shm.buf, offset=self._data_offset)
+
+    def __del__(self):
+        # Views into the shared memory must be released before it can be closed.
+        self._control = self._head = None
+        self._index = self._sequence = self._image_id = self._partition = self._offset = self._size = None
+        self._data = None
+
+        if self.shm:
+            self.shm.close()
+
+    def _get_physical_offset(self, partition, offset):
+        return partition * self.partition_n_bytes + offset % self.partition_n_bytes
+
+    def _claim(self, partition, n_bytes):
+        if n_bytes > self.partition_n_bytes:
+            raise ValueError(f"Payload of {n_bytes} bytes does not fit into partition of "
+                             f"{self.partition_n_bytes} bytes.")
+
+        start = int(self._head[partition])
+        # Payloads are never split - skip the tail of the partition if the payload does not fit.
+        if start % self.partition_n_bytes + n_bytes > self.partition_n_bytes:
+            start += self.partition_n_bytes - start % self.partition_n_bytes
+
+        # Claim the region before touching it, so readers see older payloads in it as overwritten.
+        end = start + n_bytes
+        self._head[partition] = end + (-end % PACKED_ALIGNMENT)
+
+        return start
+
+    def reserve(self, image_id, max_bytes, partition=0):
+        """Claim max_bytes at the head of the partition and return a writable uint8 view for image_id.
+        The slot is published by commit(), which also returns the unused part of the claim to the ring."""
+        if not 0 <= partition < self.n_partitions:
+            raise ValueError(f"Partition {partition} does not exist in {self.n_partitions} partitions.")
+
+        slot = image_id % self.n_slots
+
+        # _claim validates the size before it moves the head, so a failed reserve leaves the buffer untouched.
+        self._reserved_head = int(self._head[partition])
+        self._reserved_start = self._claim(partition, max_bytes)
+        self._reserved_entry = self._index[slot].copy()
+
+        self._sequence[slot] += 1
+        self._image_id[slot] = image_id
+        self._partition[slot] = partition
+
+        physical_offset = self._get_physical_offset(partition, self._reserved_start)
+        return self._data[physical_offset:physical_offset + max_bytes]
+
+    def commit(self, image_id, n_bytes):
+        slot = image_id % self.n_slots
+        partition = int(self._partition[slot])
+
+        end = self._reserved_start + n_bytes
+        self._head[partition] = end + (-end % PACKED_ALIGNMENT)
+
+        self._offset[slot] = self._reserved_start
+        self._size[slot] = n_bytes
+        self._sequence[slot] += 1
+
+    def abort(self, image_id):
+        """Cancel the reservation for image_id. Only valid if nothing was written into the reserved view:
+        the head is moved back, so payloads overlapping the reservation are considered intact again."""
+        slot = image_id % self.n_slots
+        partition = int(self._partition[slot])
+
+        self._head[partition] = self._reserved_head
+        for field in ('image_id', 'partition', 'offset', 'size'):
+            self._index[field][slot] = self._reserved_entry[field]
+        # Back to even, but with a new value so readers of the previous image retry.
+        self._sequence[slot] += 1
+
+    def write(self, image_id, data, partition=0):
+        data = np.frombuffer(data, dtype='uint8') if isinstance(data, bytes) else data.view('uint8').reshape(-1)
+
+        output_buffer = self.reserve(image_id, data.nbytes, partition=partition)
+        output_buffer[:] = data
+        self.commit(image_id, data.nbytes)
+
+    def get_data(self, image_id, shape, dtype):
+        slot = image_id % self.n_slots
+        physical_offset = self._get_physical_offset(int(self._partition[slot]), int(self._offset[slot]))
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=self._data_offset + physical_offset)
+
+    def _is_intact(self, slot, image_id):
+        return self._image_id[slot] == image_id and \
+               int(self._head[int(self._partition[slot])]) <= int(self._offset[slot]) + self.partition_n_bytes
+
+    def get_data_checked(self, image_id, shape, dtype):
+        """Same contract as RamBuffer.get_data_checked. Raises ValueError if shape and dtype need more bytes
+        than were committed for image_id."""
+        slot = image_id % self.n_slots
+        sequence = int(self._sequence[slot])
+
+        if sequence & 1 or not self._is_intact(slot, image_id):
+            return None, sequence
+
+        n_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if n_bytes > int(self._size[slot]):
+            raise ValueError(f"Image_id {image_id} has {int(self._size[slot])} bytes, cannot read {n_bytes}.")
+
+        return self.get_data(image_id, shape, dtype), sequence
+
+    def is_unchanged(self, image_id, sequence):
+        slot = image_id % self.n_slots
+        return int(self._sequence[slot]) == sequence and self._is_intact(slot, image_id)
+
+    def get_slot_info(self, image_id):
+        slot = image_id % self.n_slots
+        return {'image_id': int(self._image_id[slot]),
+                'generation': int(self._sequence[slot]) // 2,
+                'size': int(self._size[slot]),
+                'write_complete': not int(self._sequence[slot]) & 1}
+
+    def estimate_capacity(self, average_n_bytes, n_partitions=None):
+        """Number of images the ring holds before overwriting, for payloads of average_n_bytes written
+        round-robin into the first n_partitions partitions (all of them by default)."""
+        ring_n_bytes = self.ring_n_bytes if n_partitions is None else self.partition_n_bytes * n_partitions
+        aligned_n_bytes = average_n_bytes + PACKED_ALIGNMENT / 2
+        return int(min(self.n_slots, ring_n_bytes // aligned_n_bytes))
+
+
+CURSORS_MAX_CONSUMERS = 16
+# Producer record, padded to a cache line. capacity is the number of images the ring holds before overwriting.
+CURSORS_PRODUCER_DTYPE = np.dtype([('image_id', '<u8'),
+                                   ('time_ns', '<u8'),
+                                   ('capacity', '<u8'),
+                                   ('images_per_second', '<f8'),
+                                   ('padding', 'V32')])
+CURSORS_CONSUMER_DTYPE = np.dtype([('name', 'S32'),
+                                   ('image_id', '<u8'),
+                                   ('time_ns', '<u8'),
+                                   ('padding', 'V16')])
+# How often the producer refreshes its images_per_second estimate, in nanoseconds.
+CURSORS_RATE_INTERVAL_NS = 1000 * 1000 * 1000
+
+
+class RamBufferCursors:
+    """Shared control segment next to a buffer: the producer publishes its head and each named consumer its cursor.
+
+    Only the producer (create=True) creates the segment, it takes over an existing one on restart.
+    Consumers and monitors attach to it and get FileNotFoundError until the producer has started.
+    """
+    def __init__(self, buffer_name, capacity=None, backend=None, create=False):
+        self.cursors_name = f'{buffer_name}-cursors'
+        n_bytes = CURSORS_PRODUCER_DTYPE.itemsize + CURSORS_CONSUMER_DTYPE.itemsize * CURSORS_MAX_CONSUMERS
+
+        self.shm = None
+        self._producer = None
+        self._consumers = None
+
+        try:
+            self.shm = self._attach(backend)
+        except FileNotFoundError:
+            if not create:
+                raise
+            try:
+                self.shm = open_shared_memory(self.cursors_name, create=True, size=n_bytes, backend=backend)
+            except FileExistsError:
+                # Another process created it between our attach and create.
+                self.shm = self._attach(backend)
+
+        self._producer = np.ndarray((1,), dtype=CURSORS_PRODUCER_DTYPE, buffer=self.shm.buf)
+        self._consumers = np.ndarray((CURSORS_MAX_CONSUMERS,), dtype=CURSORS_CONSUMER_DTYPE, buffer=self.shm.buf,
+                                     offset=CURSORS_PRODUCER_DTYPE.itemsize)
+        self._consumer_image_id = self._consumers['image_id']
+        self._consumer_time_ns = self._consumers['time_ns']
+
+        if capacity is not None:
+            self._producer['capacity'] = capacity
+
+        self._rate_image_id = None
+        self._rate_time_ns = None
+
+    def _attach(self, backend):
+        # Attach through mmap also for the default SharedMemory backend: before Python 3.13 SharedMemory registers
+        # attached segments with the resource tracker, which unlinks them when the attaching process exits.
+        return MmapSharedMemory(self.cursors_name, hugepages=backend.get('hugepages') if backend else None)
+
+    def __del__(self):
+        # Views into the shared memory must be released before it can be closed.
+        self._producer = self._consumers = self._consumer_image_id = self._consumer_time_ns = None
+
+        if self.shm:
+            self.shm.close()
+
+    def publish_head(self, image_id, capacity=None):
+        current_time_ns = time_ns()
+        producer = self._producer[0]
+        producer['image_id'] = image_id
+        producer['time_ns'] = current_time_ns
+
+        if capacity is not None:
+            producer['capacity'] = capacity
+
+        if self._rate_time_ns is None:
+            self._rate_image_id, self._rate_time_ns = image_id, current_time_ns
+        elif current_time_ns - self._rate_time_ns > CURSORS_RATE_INTERVAL_NS:
+            producer['images_per_second'] = (image_id - self._rate_image_id) / \
+                                            (current_time_ns - self._rate_time_ns) * 10**9
+            self._rate_image_id, self._rate_time_ns = image_id, current_time_ns
+
+    def get_head(self):
+        """Returns (image_id, capacity) as last published by the producer. capacity is 0 if never published."""
+        producer = self._producer[0].copy()
+        return int(producer['image_id']), int(producer['capacity'])
+
+    def register_consumer(self, name):
+        """Returns the consumer index to use with publish_cursor. Re-registering a name reuses its entry."""
+        encoded_name = name.encode()[:CURSORS_CONSUMER_DTYPE['name'].itemsize]
+
+        names = list(self._consumers['name'])
+        if encoded_name in names:
+            return names.index(encoded_name)
+        if b'' not in names:
+            raise RuntimeError(f"No free consumer cursor in {self.cursors_name} for {name}: {names}.")
+
+        consumer_index = names.index(b'')
+        self._consumers[consumer_index] = (encoded_name, 0, 0, b'')
+        return consumer_index
+
+    def publish_cursor(self, consumer_index, image_id):
+        self._consumer_image_id[consumer_index] = image_id
+        self._consumer_time_ns[consumer_index] = time_ns()
+
+    def get_lag(self):
+        """Lag of each registered consumer behind the producer, in images and seconds, plus the estimated time
+        until the producer overwrites the image the consumer is currently at."""
+        producer = self._producer[0].copy()
+        head_image_id = int(producer['image_id'])
+        capacity = int(producer['capacity'])
+        images_per_second = float(producer['images_per_second'])
+
+        lags = {}
+        for consumer in self._consumers.copy():
+            if not consumer['name']:
+                continue
+
+            lag_images = head_image_id - int(consumer['image_id'])
+            lag_seconds = None
+            time_to_overwrite = None
+            if images_per_second > 0:
+                lag_seconds = lag_images / images_per_second
+                time_to_overwrite = (capacity - lag_images) / images_per_second if capacity else None
+
+            cursor_age = None
+            if consumer['time_ns']:
+                cursor_age = max(0, int(producer['time_ns']) - int(consumer['time_ns'])) / 10**9
+
+            lags[consumer['name'].decode()] = {
+                'head_image_id': head_image_id,
+                'image_id': int(consumer['image_id']),
+                'lag_images': lag_images,
+                'lag_seconds': lag_seconds,
+                'time_to_overwrite_seconds': time_to_overwrite,
+                'cursor_age_seconds': cursor_age
+            }
+
+        return lags
+
+
+def attach_consumer_cursor(buffer_name, consumer_name, backend=None):
+    """Attach to the cursors of buffer_name and register consumer_name.
+    Returns (cursors, consumer_index), or (None, None) if the producer does not publish cursors."""
+    try:
+        cursors = RamBufferCursors(buffer_name, backend=backend)
+    except FileNotFoundError:
+        _logger.warning(f"No cursors for {buffer_name}, lag of {consumer_name} will not be published.")
+        return None, None
+
+    return cursors, cursors.register_consumer(consumer_name)
@@ -2,11 +2,11 @@ import logging
 import os
 from collections import OrderedDict
 
-import h5py
 import numpy as np
 
 from std_daq_service.config import update_config
 from std_daq_service.rest_v2.utils import SwitchUser
+from std_daq_service.writer.swmr import SwmrReader
 
 _logger = logging.getLogger("DaqRestManager")
 # milliseconds
@@ -46,11 +46,10 @@ class DaqRestManager(object):
         log = self.storage.get_log(log_id)
         filename = log['info']['output_file']
 
-        with SwitchUser(user_id):
-            file = h5py.File(filename, 'r')
-            dataset_name = list(file)[0]
-            dataset = file[dataset_name + '/data']
-            data = dataset[i_image]
+        # The file may still be written in SWMR mode.
+        with SwitchUser(user_id), SwmrReader(filename) as reader:
+            reader.refresh()
+            data = reader.data[i_image]
 
             # Scale image to 8 bits with full range.
             min_val = data.min()
@@ -67,17 +66,17 @@ class DaqRestManager(object):
         with SwitchUser(user_id):
             file_stats = os.stat(filename)
 
-            file = h5py.File(filename)
-            dataset_name = list(file)[0]
-            dataset = file[dataset_name + '/data']
-
-            return OrderedDict({
-                'filename': filename,
-                'file_size': file_stats.st_size,
-                'log_id': log_id,
-                'dataset_name': dataset_name,
-                'n_images': dataset.shape[0],
-                'image_pixel_height': dataset.shape[1],
-                'image_pixel_width': dataset.shape[2],
-                'dtype': str(dataset.dtype)
-            })
+            with SwmrReader(filename) as reader:
+                n_images = reader.refresh()
+                dataset = reader.data
+
+                return OrderedDict({
+                    'filename': filename,
+                    'file_size': file_stats.st_size,
+                    'log_id': log_id,
+                    'dataset_name': reader.detector_name,
+                    'n_images': n_images,
+                    'image_pixel_height': dataset.shape[1],
+                    'image_pixel_width': dataset.shape[2],
+                    'dtype': str(dataset.dtype)
+                })
@@ -10,6 +10,8 @@ import numpy as np
 from flask_cors import CORS
 from zmq import Again
 
+from std_daq_service.preview.preview import attach_preview_buffer, to_display
+
 app = Flask(__name__)
 CORS(app)
 
@@ -17,52 +19,33 @@ STREAM_WIDTH = 800
 STREAM_HEIGHT = 600
 # milliseconds
 RECV_TIMEOUT = 500
+# seconds
+PREVIEW_POLL_INTERVAL = 0.05
 LIVE_STREAM_URL = 'tcp://localhost:20000'
 
 _logger = logging.getLogger('MJpegLiveStream')
 
 
 class MJpegLiveStream(object):
-    def __init__(self, ctx, live_stream_url):
+    """Encodes the live images as MJPEG. With a daq_config that has a 'preview' entry the frames come from the
+    shared preview buffer, already binned, scaled and flipped, else from the full frames of the zmq live stream."""
+    def __init__(self, ctx, live_stream_url, daq_config=None):
         self.ctx = ctx
         self.live_stream_url = live_stream_url
+        self.daq_config = daq_config
 
     def generate_frames(self):
-        receiver = self.ctx.socket(zmq.SUB)
-        receiver.connect(self.live_stream_url)
-        receiver.setsockopt_string(zmq.SUBSCRIBE, "")
-        receiver.setsockopt(zmq.RCVTIMEO, RECV_TIMEOUT)
+        # Attached per viewer, so viewers started before the preview stage pick it up on reconnect.
+        preview = attach_preview_buffer(self.daq_config) if self.daq_config else None
+        if preview is not None:
+            _logger.info("Live stream from preview buffer started.")
+            frames = self._read_preview(preview)
+        else:
+            _logger.info("Live stream started.")
+            frames = self._receive_live_stream()
 
         full_circle = True
-        meta = None
-
-        _logger.info("Live stream started.")
-        n_timeouts = 0
-
-        while True:
-            try:
-                raw_meta, raw_data = receiver.recv_multipart()
-                meta = json.loads(raw_meta.decode('utf-8'))
-                new_frame = np.frombuffer(raw_data, dtype=meta['type']).reshape(meta['shape'])
-
-                # Scale image to 8 bits with full range.
-                min_val = new_frame.min()
-                max_val = new_frame.max() or 1
-
-                frame = ((new_frame - min_val) * (255.0 / (max_val - min_val))).clip(0, 255).astype(np.uint8)
-                image_id = meta["frame"]
-                frame = cv2.flip(frame, 0)
-
-                n_timeouts = 0
-
-            except Again:
-                if n_timeouts < 3:
-                    n_timeouts += 1
-                    continue
-
-                frame = np.zeros(shape=(STREAM_HEIGHT, STREAM_WIDTH), dtype=np.uint8)
-                image_id = None
-
+        for frame, image_id, metadata_text in frames:
             image = cv2.resize(frame, (STREAM_WIDTH, STREAM_HEIGHT))
             # apply a color scheme to the grayscale image
             image = cv2.applyColorMap(image, cv2.COLORMAP_HOT)
@@ -73,8 +56,6 @@ class MJpegLiveStream(object):
                 text = 'Frame {}'.format(image_id)
                 text_color = (0, 255, 0)
 
-                shape, dtype = meta['shape'], meta['type']
-                metadata_text = f'{shape} ({dtype})'
                 metadata_text_size = cv2.getTextSize(metadata_text, font, 1, 2)[0]
                 cv2.putText(image, metadata_text, (10, metadata_text_size[1] + 20),
                             font, 1, text_color, 2)
@@ -96,6 +77,60 @@ class MJpegLiveStream(object):
             # yield the frame for the MJPG stream
             yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + image_bytes + b'\r\n'
 
+    def _receive_live_stream(self):
+        """(frame, image_id, metadata_text) from the full frames of the live stream, scaled and flipped here."""
+        receiver = self.ctx.socket(zmq.SUB)
+        receiver.connect(self.live_stream_url)
+        receiver.setsockopt_string(zmq.SUBSCRIBE, "")
+        receiver.setsockopt(zmq.RCVTIMEO, RECV_TIMEOUT)
+
+        n_timeouts = 0
+        while True:
+            try:
+                raw_meta, raw_data = receiver.recv_multipart()
+                meta = json.loads(raw_meta.decode('utf-8'))
+                new_frame = np.frombuffer(raw_data, dtype=meta['type']).reshape(meta['shape'])
+
+                # Scale image to 8 bits with full range.
+                min_val = new_frame.min()
+                max_val = new_frame.max() or 1
+
+                frame = ((new_frame - min_val) * (255.0 / (max_val - min_val))).clip(0, 255).astype(np.uint8)
+                frame = cv2.flip(frame, 0)
+
+                n_timeouts = 0
+                yield frame, meta["frame"], f"{meta['shape']} ({meta['type']})"
+
+            except Again:
+                if n_timeouts < 3:
+                    n_timeouts += 1
+                    continue
+
+                yield np.zeros(shape=(STREAM_HEIGHT, STREAM_WIDTH), dtype=np.uint8), None, None
+
+    def _read_preview(self, preview):
+        """(frame, image_id, metadata_text) from the preview buffer, polled until a new preview is published."""
+        last_image_id = None
+        n_polls_without_preview = 0
+        while True:
+            image_id, frame = preview.get_latest()
+
+            if image_id is None or image_id == last_image_id:
+                n_polls_without_preview += 1
+                if n_polls_without_preview * PREVIEW_POLL_INTERVAL * 1000 < 3 * RECV_TIMEOUT:
+                    sleep(PREVIEW_POLL_INTERVAL)
+                    continue
+
+                n_polls_without_preview = 0
+                yield np.zeros(shape=(STREAM_HEIGHT, STREAM_WIDTH), dtype=np.uint8), None, None
+                continue
+
+            last_image_id = image_id
+            n_polls_without_preview = 0
+
+            frame = to_display(frame)
+            yield frame, image_id, f'{list(frame.shape)} (preview x{preview.bin_factor})'
+
 
 @app.route('/')
 def live_stream():
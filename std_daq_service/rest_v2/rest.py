@@ -97,7 +97,8 @@ def register_rest_interface(app, writer_manager: WriterRestManager, daq_manager:
 
         writer_status = writer_manager.write_sync(write_request.output_file,
                                                   write_request.n_images,
-                                                  write_request.run_id)
+                                                  write_request.run_id,
+                                                  timeout=write_request.timeout)
 
         return {"status": "ok", "message": "Writing finished.", 'writer': writer_status}
 
@@ -110,7 +111,8 @@ def register_rest_interface(app, writer_manager: WriterRestManager, daq_manager:
 
         writer_status = writer_manager.write_async(write_request.output_file,
                                                    write_request.n_images,
-                                                   write_request.run_id)
+                                                   write_request.run_id,
+                                                   timeout=write_request.timeout)
 
         return {"status": "ok", "message": "Writing started.", 'writer': writer_status}
 
@@ -6,7 +6,10 @@ from pydantic import BaseModel, Field, validator
 
 
 class WriteRequest(BaseModel):
-    n_images: int = Field(..., description="Number of images to acquire", example=100, ge=1)
+    n_images: int = Field(..., description="Number of images to acquire, 0 to acquire until stopped", example=100,
+                          ge=0)
+    timeout: Optional[float] = Field(None, description="Stop the acquisition when no image arrived for this many "
+                                                       "seconds", example=10, gt=0)
     output_file: str = Field(..., description="Output file (absolute path or null if no acquisition happened)",
                              example="/tmp/test.h5")
     run_id: int = Field(default_factory=lambda: time_ns(), example=1684930336122153839,
@@ -27,10 +30,21 @@ class WriteRequest(BaseModel):
 class AcquisitionStats(BaseModel):
     n_write_completed: int = Field(..., description="Number of completed writes", example=100)
     n_write_requested: int = Field(..., description="Number of requested writers from the driver", example=100)
+    n_write_completed_per_writer: List[int] = Field([], description="Number of completed writes of each writer "
+                                                                    "instance", example=[50, 50])
     start_time: Optional[float] = Field(None, description="Start time of request as seen by writer driver "
                                                           "(Unix timestamp)", example=1684930336.1252322)
     stop_time: Optional[float] = Field(None, description="Stop time of request as seen by writer driver "
                                                          "(Unix timestamp)", example=1684930345.2723851)
+    start_to_first_write_ms: Optional[float] = Field(None, description="Time from the start request to the first "
+                                                                       "completed write", example=12.5)
+    stop_to_ready_ms: Optional[float] = Field(None, description="Time from the stop request until all writers are "
+                                                                "ready", example=3.1)
+    n_missing_images: int = Field(0, description="Image ids skipped in the stream seen by the writer driver",
+                                  example=0)
+    n_duplicate_images: int = Field(0, description="Image ids received more than once", example=0)
+    n_out_of_order_images: int = Field(0, description="Image ids received after a newer one", example=0)
+    n_overrun_images: int = Field(0, description="Images overwritten in the ring before they were read", example=0)
 
 
 class AcquisitionState(str, Enum):
@@ -16,6 +16,7 @@ from std_daq_service.rest_v2.redis_storage import StdDaqRedisStorage
 from std_daq_service.rest_v2.stats import StatsLogger
 from std_daq_service.rest_v2.writer import WriterRestManager, StatusLogger
 from std_daq_service.rest_v2.rest import register_rest_interface
+from std_daq_service.writer.striping import get_n_writers
 from std_daq_service.writer_driver import WriterDriver
 
 _logger = logging.getLogger(__name__)
@@ -57,7 +58,7 @@ def start_api(config_file, rest_port, sim_url_base, redis_url, live_stream_url):
         ctx = zmq.Context()
 
         writer_driver = WriterDriver(ctx, command_address, in_status_address, out_status_address,
-                                     compressed_image_metadata_address)
+                                     compressed_image_metadata_address, n_writers=get_n_writers(daq_config))
         writer_manager = WriterRestManager(writer_driver=writer_driver)
 
         status_logger = StatusLogger(ctx=ctx, storage=storage, writer_status_url=out_status_address)
@@ -68,7 +69,7 @@ def start_api(config_file, rest_port, sim_url_base, redis_url, live_stream_url):
 
         daq_manager = DaqRestManager(storage=storage)
 
-        mjpeg_streamer = MJpegLiveStream(ctx, live_stream_url=live_stream_url)
+        mjpeg_streamer = MJpegLiveStream(ctx, live_stream_url=live_stream_url, daq_config=daq_config)
         register_rest_interface(app, writer_manager=writer_manager, daq_manager=daq_manager, sim_url_base=sim_url_base,
                                 streamer=mjpeg_streamer, storage=storage)
 
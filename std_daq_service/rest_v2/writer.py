@@ -20,12 +20,12 @@ class WriterRestManager(object):
     def __init__(self, writer_driver: WriterDriver):
         self.writer_driver = writer_driver
 
-    def write_sync(self, output_file, n_images, run_id):
+    def write_sync(self, output_file, n_images, run_id, timeout=None):
         self.writer_driver.start({
             'run_id': run_id,
             'output_file': output_file,
             'n_images': n_images
-        })
+        }, timeout=timeout)
 
         start_time = time()
         while True:
@@ -40,12 +40,12 @@ class WriterRestManager(object):
                                    f"Sync acquisition limit of {SYNC_WAIT_TIMEOUT} seconds exceeded. "
                                    f"Use async write call for long acquisitions.")
 
-    def write_async(self, output_file, n_images, user_id):
+    def write_async(self, output_file, n_images, user_id, timeout=None):
         self.writer_driver.start({
             'run_id': user_id,
             'output_file': output_file,
             'n_images': n_images
-        })
+        }, timeout=timeout)
 
         return self.get_status()
 
@@ -0,0 +1,63 @@
+import numpy as np
+
+ROI_FIELDS = ['x', 'y', 'width', 'height']
+
+
+def get_rois(daq_config):
+    """Regions from the optional 'roi' DAQ config entry, a dict or a list of dicts with x, y, width and height.
+    Returns an empty list if no ROI is configured."""
+    rois = daq_config.get('roi') or []
+    if isinstance(rois, dict):
+        rois = [rois]
+
+    image_height, image_width = daq_config['image_pixel_height'], daq_config['image_pixel_width']
+    for roi in rois:
+        missing_fields = [field for field in ROI_FIELDS if field not in roi]
+        if missing_fields:
+            raise ValueError(f"ROI {roi} is missing {missing_fields}.")
+
+        if roi['x'] < 0 or roi['y'] < 0 or roi['width'] <= 0 or roi['height'] <= 0 or \
+                roi['x'] + roi['width'] > image_width or roi['y'] + roi['height'] > image_height:
+            raise ValueError(f"ROI {roi} does not fit into the image of {image_height}x{image_width} pixels.")
+
+    if len(set(roi['width'] for roi in rois)) > 1:
+        raise ValueError(f"All ROIs must have the same width, they are stacked into one image: {rois}.")
+
+    return [{field: int(roi[field]) for field in ROI_FIELDS} for roi in rois]
+
+
+def get_roi_shape(rois):
+    """Shape of the image with all rois stacked top to bottom."""
+    return [sum(roi['height'] for roi in rois), rois[0]['width']]
+
+
+def get_roi_channel_name(detector_name):
+    return f'{detector_name}-roi'
+
+
+class RoiExtractor(object):
+    """Copies the rois of an image into one smaller image, stacked top to bottom in the configured order."""
+    def __init__(self, rois):
+        if not rois:
+            raise ValueError("RoiExtractor needs at least one ROI.")
+
+        self.rois = rois
+        self.shape = get_roi_shape(rois)
+
+        # Precomputed (output rows, input window) pairs, each ROI is one strided copy.
+        self._windows = []
+        output_y = 0
+        for roi in rois:
+            self._windows.append((slice(output_y, output_y + roi['height']),
+                                  (slice(roi['y'], roi['y'] + roi['height']),
+                                   slice(roi['x'], roi['x'] + roi['width']))))
+            output_y += roi['height']
+
+    def extract(self, image, output=None):
+        if output is None:
+            output = np.empty(self.shape, dtype=image.dtype)
+
+        for output_rows, input_window in self._windows:
+            np.copyto(output[output_rows], image[input_window])
+
+        return output
@@ -0,0 +1,104 @@
+import argparse
+import logging
+from time import time
+
+from std_buffer.image_metadata_pb2 import ImageMetadata
+import zmq
+from zmq import Again
+
+from std_daq_service.compression.worker import N_IMAGE_SLOTS
+from std_daq_service.config import load_daq_config, get_roi_stream_address, IPC_BASE
+from std_daq_service.image_accounting import ImageIdAccounting
+from std_daq_service.ram_buffer import RamBuffer, RamBufferCursors, attach_consumer_cursor
+from std_daq_service.roi.extractor import RoiExtractor, get_rois, get_roi_channel_name
+
+_logger = logging.getLogger("Roi")
+
+
+def start_roi(config_file):
+    daq_config = load_daq_config(config_file)
+    detector_name = daq_config['detector_name']
+    backend = daq_config.get('ram_buffer_backend')
+
+    rois = get_rois(daq_config)
+    if not rois:
+        raise RuntimeError(f"No 'roi' in the DAQ config of {detector_name}.")
+    extractor = RoiExtractor(rois)
+
+    image_shape = [daq_config['image_pixel_height'], daq_config['image_pixel_width']]
+    dtype = f'uint{daq_config["bit_depth"]}'
+    element_n_bytes = daq_config['bit_depth'] // 8
+    roi_n_bytes = extractor.shape[0] * extractor.shape[1] * element_n_bytes
+    _logger.info(f"Extracting {rois} from {detector_name} images of shape {image_shape} "
+                 f"into images of shape {extractor.shape}.")
+
+    ctx = zmq.Context()
+    image_metadata_receiver = ctx.socket(zmq.SUB)
+    image_metadata_receiver.connect(f"{IPC_BASE}/{detector_name}-image")
+    image_metadata_receiver.setsockopt_string(zmq.SUBSCRIBE, "")
+    image_metadata_receiver.setsockopt(zmq.RCVTIMEO, 200)
+
+    image_metadata_sender = ctx.socket(zmq.PUB)
+    image_metadata_sender.bind(get_roi_stream_address(detector_name))
+
+    input_buffer = RamBuffer(channel_name=detector_name, data_n_bytes=image_shape[0] * image_shape[1] * element_n_bytes,
+                             n_slots=N_IMAGE_SLOTS, backend=backend)
+    output_buffer = RamBuffer(channel_name=get_roi_channel_name(detector_name), data_n_bytes=roi_n_bytes,
+                              n_slots=N_IMAGE_SLOTS, create=True, backend=backend)
+
+    input_cursors, input_cursor = attach_consumer_cursor(input_buffer.buffer_name, 'roi', backend=backend)
+    output_cursors = RamBufferCursors(output_buffer.buffer_name, capacity=N_IMAGE_SLOTS, backend=backend, create=True)
+
+    accounting = ImageIdAccounting('roi')
+    image_meta = ImageMetadata()
+    n_images = 0
+    start_time = time()
+    while True:
+        try:
+            try:
+                meta_raw = image_metadata_receiver.recv()
+            except Again:
+                meta_raw = None
+
+            if meta_raw is not None:
+                image_meta.ParseFromString(meta_raw)
+                accounting.record(image_meta.image_id)
+
+                image = input_buffer.get_data(image_meta.image_id, shape=image_shape, dtype=dtype)
+                extractor.extract(image, output=output_buffer.get_data(image_meta.image_id, shape=extractor.shape,
+                                                                       dtype=dtype))
+                if input_cursors:
+                    head_image_id, capacity = input_cursors.get_head()
+                    accounting.check_window(image_meta.image_id, head_image_id, capacity or input_buffer.n_slots)
+                    input_cursors.publish_cursor(input_cursor, image_meta.image_id)
+                output_cursors.publish_head(image_meta.image_id)
+
+                image_meta.height, image_meta.width = extractor.shape
+                image_meta.size = roi_n_bytes
+                image_metadata_sender.send(image_meta.SerializeToString())
+                n_images += 1
+
+            if time() - start_time > 1:
+                start_time = time()
+                print(f'Frequency {n_images} Hz; Image ids {accounting.get_stats()}')
+                n_images = 0
+
+        except KeyboardInterrupt:
+            break
+        except Exception:
+            _logger.exception("Error in roi loop.")
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract regions of interest from the image stream')
+    parser.add_argument("config_file", type=str, help="Path to the config file managed by this instance.")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start_roi(config_file=args.config_file)
+
+
+if __name__ == "__main__":
+    main()
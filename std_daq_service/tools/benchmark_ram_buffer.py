@@ -0,0 +1,94 @@
+import argparse
+import json
+import uuid
+from time import perf_counter
+
+import numpy as np
+
+from std_daq_service.ram_buffer import RamBuffer
+
+BACKENDS = {
+    'shm': None,
+    'mmap': {'type': 'mmap'},
+    'mmap_prefault': {'type': 'mmap', 'prefault': True},
+    'mmap_thp_prefault': {'type': 'mmap', 'hugepages': 'thp', 'prefault': True},
+    'mmap_hugetlbfs_prefault': {'type': 'mmap', 'hugepages': 'hugetlbfs', 'prefault': True},
+}
+
+
+def measure_pass(n_slots, operation):
+    start_time = perf_counter()
+    for i_slot in range(n_slots):
+        operation(i_slot)
+    return perf_counter() - start_time
+
+
+def benchmark_backend(backend, image_n_bytes, n_slots, numa_node):
+    if backend is not None and numa_node is not None:
+        backend = dict(backend, numa_node=numa_node)
+
+    channel_name = f'benchmark-{uuid.uuid4().hex[:8]}'
+    image = np.random.randint(0, 255, size=image_n_bytes, dtype='uint8')
+    output = np.empty_like(image)
+
+    start_time = perf_counter()
+    buffer = RamBuffer(channel_name, data_n_bytes=image_n_bytes, n_slots=n_slots, create=True, backend=backend)
+    create_time = perf_counter() - start_time
+
+    def write(i_slot):
+        buffer.write(i_slot, image)
+
+    def read(i_slot):
+        output[:] = buffer.get_data(i_slot, shape=(image_n_bytes,), dtype='uint8')
+
+    try:
+        # The first pass over the ring includes the page faults on non prefaulted memory.
+        first_write_time = measure_pass(n_slots, write)
+        write_time = measure_pass(n_slots, write)
+        read_time = measure_pass(n_slots, read)
+    finally:
+        buffer.shm.unlink()
+        del buffer
+
+    n_bytes = image_n_bytes * n_slots
+    return {
+        'create_s': create_time,
+        'first_write_MBps': n_bytes / first_write_time / 1024 / 1024,
+        'write_MBps': n_bytes / write_time / 1024 / 1024,
+        'read_MBps': n_bytes / read_time / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RamBuffer backend write and read bandwidth')
+    parser.add_argument('--image_n_bytes', type=int, default=2016 * 2016 * 2, help='Bytes per slot.')
+    parser.add_argument('--n_slots', type=int, default=1000, help='Number of slots in the ring.')
+    parser.add_argument('--numa_node', type=int, default=None, help='Bind mmap backends to this NUMA node.')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--json', action='store_true', help='Output results as JSON.')
+
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.backends:
+        try:
+            results[name] = benchmark_backend(BACKENDS[name], args.image_n_bytes, args.n_slots, args.numa_node)
+        except OSError as e:
+            results[name] = {'error': str(e)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:<26} {:>10} {:>18} {:>12} {:>12}".format('BACKEND', 'CREATE_S', 'FIRST_WRITE_MB/s',
+                                                      'WRITE_MB/s', 'READ_MB/s'))
+    for name, result in results.items():
+        if 'error' in result:
+            print("{:<26} {}".format(name, result['error']))
+            continue
+        print("{:<26} {:>10.3f} {:>18.1f} {:>12.1f} {:>12.1f}".format(
+            name, result['create_s'], result['first_write_MBps'], result['write_MBps'], result['read_MBps']))
+
+
+if __name__ == "__main__":
+    main()
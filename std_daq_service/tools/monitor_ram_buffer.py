@@ -0,0 +1,87 @@
+import argparse
+from time import sleep, time_ns
+
+from std_daq_service.config import load_daq_config
+from std_daq_service.ram_buffer import RamBufferCursors
+
+
+def get_buffer_names(detector_name):
+    return [f'{detector_name}-image', f'{detector_name}-compressed']
+
+
+def format_lag_stats(detector_name, buffer_name, lags, timestamp_ns):
+    # InfluxDB line protocol, one line per consumer.
+    stats_output = ''
+    for consumer_name, lag in lags.items():
+        fields = [f'lag_images={lag["lag_images"]}i']
+        for field_name in ('lag_seconds', 'time_to_overwrite_seconds', 'cursor_age_seconds'):
+            if lag[field_name] is not None:
+                fields.append(f'{field_name}={lag[field_name]}')
+
+        stats_output += f'ram_buffer_lag,detector_name={detector_name},buffer_name={buffer_name},' \
+                        f'consumer={consumer_name} {",".join(fields)} {timestamp_ns}\n'
+
+    return stats_output
+
+
+def print_lag_table(lags_per_buffer):
+    print("{:<28} {:<16} {:>12} {:>12} {:>12} {:>12}".format(
+        'BUFFER', 'CONSUMER', 'HEAD', 'LAG_IMAGES', 'LAG_S', 'OVERWRITE_S'))
+
+    for buffer_name, lags in lags_per_buffer.items():
+        for consumer_name, lag in lags.items():
+            lag_seconds = '-' if lag['lag_seconds'] is None else f"{lag['lag_seconds']:.3f}"
+            time_to_overwrite = '-' if lag['time_to_overwrite_seconds'] is None \
+                else f"{lag['time_to_overwrite_seconds']:.3f}"
+
+            print("{:<28} {:<16} {:>12} {:>12} {:>12} {:>12}".format(
+                buffer_name, consumer_name, lag['head_image_id'], lag['lag_images'], lag_seconds, time_to_overwrite))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monitor consumer lag on the RamBuffers of a detector.')
+    parser.add_argument("config_file", type=str, help="Path to the DAQ config file.")
+    parser.add_argument('--interval', type=float, default=1, help='Seconds between samples.')
+    parser.add_argument('--stats_file', type=str, default=None,
+                        help='Append samples in InfluxDB line protocol to this file instead of printing them.')
+
+    args = parser.parse_args()
+
+    daq_config = load_daq_config(args.config_file)
+    detector_name = daq_config['detector_name']
+    backend = daq_config.get('ram_buffer_backend')
+
+    # The monitor only attaches, the cursors are created by the producers. Retry until they started.
+    cursors = {}
+
+    stats_file = open(args.stats_file, 'a', buffering=1) if args.stats_file else None
+    try:
+        while True:
+            for buffer_name in get_buffer_names(detector_name):
+                if buffer_name not in cursors:
+                    try:
+                        cursors[buffer_name] = RamBufferCursors(buffer_name, backend=backend)
+                    except FileNotFoundError:
+                        pass
+
+            lags_per_buffer = {buffer_name: buffer_cursors.get_lag()
+                               for buffer_name, buffer_cursors in cursors.items()}
+
+            if stats_file:
+                timestamp_ns = time_ns()
+                for buffer_name, lags in lags_per_buffer.items():
+                    stats_file.write(format_lag_stats(detector_name, buffer_name, lags, timestamp_ns))
+            else:
+                print_lag_table(lags_per_buffer)
+                print()
+
+            sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stats_file:
+            stats_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter
+
+import bitshuffle.h5
+import h5py
+import numpy as np
+
+from std_daq_service.compression.benchmark import FRAME_MODELS, generate_frames
+from std_daq_service.compression.codecs import CODECS, create_codec
+from std_daq_service.writer.chunks import ChunkPacker, get_frames_per_chunk
+from std_daq_service.writer.io_profile import IO_PROFILE_DEFAULT, IO_PROFILES, create_io_profile, get_file_kwargs
+
+FRAMES_PER_CHUNK = [1, 2, 4, 8, 16, 32]
+
+
+def compress_frames(codec, frames):
+    compressed_frames = []
+    for frame in frames:
+        output = np.empty(codec.get_max_n_bytes(frame.size, frame.itemsize), dtype='uint8')
+        compressed_frames.append(output[:codec.compress_into(frame, output)])
+
+    return compressed_frames
+
+
+def write_frames(output_file, codec, compressed_frames, shape, dtype, frames_per_chunk, n_frames, io_profile=None):
+    """Write n_frames through the writer chunk path, returns the per-chunk write latencies in seconds."""
+    packer = ChunkPacker(codec, shape, dtype, frames_per_chunk)
+    latencies = []
+
+    with h5py.File(output_file, 'w', **get_file_kwargs(io_profile or {})) as file:
+        dataset = file.create_dataset('data', tuple([n_frames] + list(shape)), dtype=dtype,
+                                      chunks=tuple([frames_per_chunk] + list(shape)), allow_unknown_filter=True,
+                                      **codec.get_hdf5_filter())
+
+        for i_frame in range(n_frames):
+            if packer.add(compressed_frames[i_frame % len(compressed_frames)]):
+                start_time = perf_counter()
+                dataset.id.write_direct_chunk((i_frame + 1 - frames_per_chunk, 0, 0), packer.get_chunk())
+                latencies.append(perf_counter() - start_time)
+
+        if packer.n_frames:
+            dataset.id.write_direct_chunk((n_frames - packer.n_frames, 0, 0), packer.get_chunk())
+
+    return np.array(latencies)
+
+
+def sync_file(output_file):
+    """Flush the file from the page cache to the disk, so the rate is the sustained disk rate."""
+    fd = os.open(output_file, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def benchmark(model, shape, bit_depth, codec_config, frames_per_chunk, n_frames=1000, output_dir=None,
+              io_profile=IO_PROFILE_DEFAULT, fsync=False, seed=0):
+    codec = create_codec(codec_config)
+    io_profile = create_io_profile(io_profile)
+    dtype = f'uint{bit_depth}'
+    frames = generate_frames(model, shape, bit_depth, seed=seed)
+    compressed_frames = compress_frames(codec, frames)
+
+    # The effective value, 1 if the codec cannot join frames of this shape.
+    frames_per_chunk = get_frames_per_chunk({'writer_frames_per_chunk': frames_per_chunk}, codec, shape, dtype,
+                                            n_frames)
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as temp_dir:
+        output_file = os.path.join(temp_dir, 'benchmark.h5')
+
+        start_time = perf_counter()
+        latencies = write_frames(output_file, codec, compressed_frames, shape, dtype, frames_per_chunk, n_frames,
+                                 io_profile)
+        if fsync:
+            sync_file(output_file)
+        elapsed_time = perf_counter() - start_time
+
+        # Allocated, not apparent size: aligned layouts leave holes between chunks that take no disk space.
+        n_file_bytes = os.stat(output_file).st_blocks * 512
+
+    n_compressed_bytes = sum(compressed_frames[i % len(compressed_frames)].nbytes for i in range(n_frames))
+    return {
+        'model': model,
+        'bit_depth': bit_depth,
+        'codec': codec.name,
+        'frames_per_chunk': frames_per_chunk,
+        'io_profile': io_profile['name'],
+        'frames_per_s': n_frames / elapsed_time,
+        'written_MBps': n_compressed_bytes / elapsed_time / 1024 / 1024,
+        'input_MBps': frames[0].nbytes * n_frames / elapsed_time / 1024 / 1024,
+        'file_overhead': n_file_bytes / n_compressed_bytes - 1,
+        'chunk_p99_ms': float(np.percentile(latencies, 99)) * 1000 if len(latencies) else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HDF5 write rate against frames per chunk and I/O profile')
+    parser.add_argument('--height', type=int, default=512, help='Frame height in pixels.')
+    parser.add_argument('--width', type=int, default=1024, help='Frame width in pixels.')
+    parser.add_argument('--models', nargs='+', default=['gigafrost_noise'], choices=list(FRAME_MODELS))
+    parser.add_argument('--bit_depth', type=int, default=16, choices=[8, 16, 32])
+    parser.add_argument('--codecs', nargs='+', default=['bshuffle_lz4'], choices=list(CODECS))
+    parser.add_argument('--frames_per_chunk', nargs='+', default=FRAMES_PER_CHUNK,
+                        help="Frames per chunk to compare, or 'auto'.")
+    parser.add_argument('--io_profiles', nargs='+', default=[IO_PROFILE_DEFAULT], choices=list(IO_PROFILES))
+    parser.add_argument('--fsync', action='store_true', help='Include flushing the file to disk in the time.')
+    parser.add_argument('--n_frames', type=int, default=1000, help='Frames written per run.')
+    parser.add_argument('--output_dir', type=str, default=None,
+                        help='Directory on the filesystem to benchmark, the system temp directory by default.')
+    parser.add_argument('--json', action='store_true', help='Output results as JSON.')
+
+    args = parser.parse_args()
+
+    results = []
+    for model in args.models:
+        for codec_name in args.codecs:
+            for frames_per_chunk in args.frames_per_chunk:
+                frames_per_chunk = frames_per_chunk if frames_per_chunk == 'auto' else int(frames_per_chunk)
+                for io_profile in args.io_profiles:
+                    results.append(benchmark(model, (args.height, args.width), args.bit_depth, codec_name,
+                                             frames_per_chunk, n_frames=args.n_frames, output_dir=args.output_dir,
+                                             io_profile=io_profile, fsync=args.fsync))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("{:<16} {:<14} {:>6} {:<12} {:>10} {:>10} {:>10} {:>9} {:>10}".format(
+        'MODEL', 'CODEC', 'FRAMES', 'IO_PROFILE', 'FRAMES/s', 'OUT_MB/s', 'IN_MB/s', 'OVERHEAD', 'CHUNK_P99'))
+    for result in results:
+        print("{:<16} {:<14} {:>6} {:<12} {:>10.0f} {:>10.1f} {:>10.1f} {:>9.4f} {:>10.3f}".format(
+            result['model'], result['codec'], result['frames_per_chunk'], result['io_profile'], result['frames_per_s'],
+            result['written_MBps'], result['input_MBps'], result['file_overhead'], result['chunk_p99_ms']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import redirect_stdout
+from time import monotonic_ns, sleep
+
+import numpy as np
+from std_buffer.image_metadata_pb2 import ImageMetadata, ImageMetadataDtype, ImageMetadataStatus
+import zmq
+
+from std_daq_service.compression.benchmark import FRAME_MODELS, generate_frames
+from std_daq_service.compression.codecs import CODECS, create_codec
+from std_daq_service.compression.worker import N_COMPRESSED_SLOTS, N_IMAGE_SLOTS
+from std_daq_service.config import get_compressed_stream_address
+from std_daq_service.ram_buffer import PackedRamBuffer, RamBufferCursors
+from std_daq_service.writer.benchmark import compress_frames
+from std_daq_service.writer.io_profile import IO_PROFILE_DEFAULT, IO_PROFILES
+from std_daq_service.writer.layout import IMAGE_ID_DATASET
+from std_daq_service.writer.raw import RAW_EXTENSION
+from std_daq_service.writer.start import write_stream
+
+# Time for the writer to connect to the image stream before the first image is published.
+STARTUP_WAIT_TIME = 0.5
+# In seconds. The writer stops when no image arrived for this long, images it did not get by then are lost.
+WRITER_TIMEOUT = 1
+FIRST_IMAGE_ID = 1
+# Rate search: the rate is doubled until images are lost, then bisected between the last good and first bad rate.
+N_BISECT_STEPS = 3
+# The publisher cannot keep up with the requested rate below this fraction of it.
+MIN_PUBLISHED_FRACTION = 0.9
+# Output file extension of each writer backend.
+OUTPUT_FORMATS = {'hdf5': '.h5', 'raw': RAW_EXTENSION}
+
+
+def publish_images(daq_config, compressed_frames, n_images, rate, ring_n_images, ready_event, stop_event,
+                   publish_times):
+    """Stand-in for the detector and compression: cycles compressed_frames through the compressed buffer of the
+    detector and announces each image on its stream, at rate images per second or as fast as possible with rate=0.
+    Like the compression stage it never waits for the writer. The publish time of image i goes to publish_times[i].
+    """
+    detector_name = daq_config['detector_name']
+    backend = daq_config.get('ram_buffer_backend')
+    codec = create_codec(daq_config['compression_codec'])
+    max_n_bytes = max(frame.nbytes for frame in compressed_frames)
+
+    buffer = PackedRamBuffer(channel_name=detector_name, ring_n_bytes=max_n_bytes * ring_n_images,
+                             n_slots=N_COMPRESSED_SLOTS, create=True, backend=backend)
+    cursors = RamBufferCursors(buffer.buffer_name, capacity=ring_n_images, backend=backend, create=True)
+
+    ctx = zmq.Context()
+    image_metadata_sender = ctx.socket(zmq.PUB)
+    image_metadata_sender.bind(get_compressed_stream_address(detector_name))
+
+    image_meta = ImageMetadata()
+    image_meta.height, image_meta.width = daq_config['image_pixel_height'], daq_config['image_pixel_width']
+    image_meta.dtype = ImageMetadataDtype.Value(f'uint{daq_config["bit_depth"]}')
+    image_meta.compression = codec.encoding
+    image_meta.status = ImageMetadataStatus.compressed_image
+
+    try:
+        ready_event.set()
+        sleep(STARTUP_WAIT_TIME)
+
+        start_time = monotonic_ns()
+        for i_image in range(n_images):
+            if rate:
+                delay_ns = start_time + i_image * 1e9 / rate - monotonic_ns()
+                if delay_ns > 0:
+                    sleep(delay_ns / 1e9)
+
+            image_id = FIRST_IMAGE_ID + i_image
+            frame = compressed_frames[i_image % len(compressed_frames)]
+            buffer.write(image_id, frame)
+            cursors.publish_head(image_id, capacity=buffer.estimate_capacity(frame.nbytes))
+
+            image_meta.image_id = image_id
+            image_meta.size = frame.nbytes
+            publish_times[i_image] = monotonic_ns()
+            image_metadata_sender.send(image_meta.SerializeToString())
+
+        # The writer may still be reading from the buffer.
+        stop_event.wait()
+    finally:
+        image_metadata_sender.close(linger=0)
+        ctx.term()
+        cursors.shm.unlink()
+        buffer.shm.unlink()
+
+
+def benchmark_rate(model, shape, bit_depth, codec_config, frames_per_chunk, rate, n_images=2000, output_dir=None,
+                   io_profile=IO_PROFILE_DEFAULT, ring_n_images=N_IMAGE_SLOTS, swmr_flush_interval=None,
+                   output_format='hdf5', seed=0):
+    """Publish n_images at rate images per second (0 for as fast as possible) and write them with the writer
+    backend of output_format, in SWMR mode if swmr_flush_interval is given."""
+    codec = create_codec(codec_config)
+    compressed_frames = compress_frames(codec, generate_frames(model, shape, bit_depth, seed=seed))
+
+    publish_times = multiprocessing.Array('Q', n_images, lock=False)
+    written_times = np.zeros(n_images, dtype='uint64')
+
+    def on_written(_, metadata):
+        written_time = monotonic_ns()
+        i_images = metadata[IMAGE_ID_DATASET].astype('int64') - FIRST_IMAGE_ID
+        written_times[i_images[(i_images >= 0) & (i_images < n_images)]] = written_time
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as temp_dir:
+        daq_config = {'detector_name': f'benchmark-{uuid.uuid4().hex[:8]}',
+                      'image_pixel_height': shape[0], 'image_pixel_width': shape[1], 'bit_depth': bit_depth,
+                      'compression_codec': codec_config, 'writer_frames_per_chunk': frames_per_chunk,
+                      'writer_io_profiles': {temp_dir: io_profile}}
+        if swmr_flush_interval:
+            daq_config['writer_swmr'] = {'flush_interval': swmr_flush_interval}
+
+        ready_event, stop_event = multiprocessing.Event(), multiprocessing.Event()
+        publisher = multiprocessing.Process(target=publish_images,
+                                            args=(daq_config, compressed_frames, n_images, rate, ring_n_images,
+                                                  ready_event, stop_event, publish_times))
+        publisher.start()
+        try:
+            if not ready_event.wait(timeout=10):
+                raise RuntimeError("Image publisher did not start.")
+
+            # The writer prints its progress, keep stdout for the results.
+            with redirect_stdout(sys.stderr):
+                output_file = os.path.join(temp_dir, 'benchmark' + OUTPUT_FORMATS[output_format])
+                _, image_id_stats = write_stream(daq_config, output_file, n_images, timeout=WRITER_TIMEOUT,
+                                                 on_written=on_written)
+        finally:
+            stop_event.set()
+            publisher.join()
+
+    publish_times = np.frombuffer(publish_times, dtype='uint64')
+    written = written_times > 0
+    n_written = int(written.sum())
+    elapsed_s = (written_times.max() - publish_times[0]) / 1e9 if n_written else float('nan')
+    latencies_ms = (written_times[written] - publish_times[written]) / 1e6
+    n_written_bytes = sum(compressed_frames[i_image % len(compressed_frames)].nbytes
+                          for i_image in np.flatnonzero(written))
+
+    return {
+        'output_format': output_format,
+        'codec': codec.name,
+        'frames_per_chunk': frames_per_chunk,
+        'io_profile': io_profile,
+        'rate_Hz': rate,
+        'published_Hz': (n_images - 1) / ((publish_times[-1] - publish_times[0]) / 1e9) if n_images > 1 else 0,
+        'written_Hz': n_written / elapsed_s,
+        'written_MBps': n_written_bytes / elapsed_s / 1024 / 1024,
+        'n_lost': n_images - n_written,
+        'n_overrun': image_id_stats['n_overrun_images'],
+        'latency_p50_ms': float(np.percentile(latencies_ms, 50)) if n_written else float('nan'),
+        'latency_p99_ms': float(np.percentile(latencies_ms, 99)) if n_written else float('nan'),
+        'latency_max_ms': float(latencies_ms.max()) if n_written else float('nan'),
+    }
+
+
+def has_drops(result):
+    return result['n_lost'] > 0 or result['n_overrun'] > 0
+
+
+def find_max_rate(start_rate, n_bisect_steps=N_BISECT_STEPS, **benchmark_kwargs):
+    """Highest rate in images per second the writer sustains without losing images. Returns (max_rate, results),
+    max_rate is limited by the publisher if the writer never lost an image."""
+    results = []
+    good_rate, bad_rate, rate = 0, None, start_rate
+    while bad_rate is None:
+        result = benchmark_rate(rate=rate, **benchmark_kwargs)
+        results.append(result)
+        if has_drops(result):
+            bad_rate = rate
+        else:
+            good_rate = rate
+            if result['published_Hz'] < MIN_PUBLISHED_FRACTION * rate:
+                return good_rate, results
+            rate *= 2
+
+    for _ in range(n_bisect_steps):
+        rate = (good_rate + bad_rate) / 2
+        result = benchmark_rate(rate=rate, **benchmark_kwargs)
+        results.append(result)
+        if has_drops(result):
+            bad_rate = rate
+        else:
+            good_rate = rate
+
+    return good_rate, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Writer throughput from a synthetic image stream, no detector needed')
+    parser.add_argument('--height', type=int, default=512, help='Frame height in pixels.')
+    parser.add_argument('--width', type=int, default=1024, help='Frame width in pixels.')
+    parser.add_argument('--model', default='gigafrost_noise', choices=list(FRAME_MODELS))
+    parser.add_argument('--bit_depth', type=int, default=16, choices=[8, 16, 32])
+    parser.add_argument('--codec', default='bshuffle_lz4', choices=list(CODECS))
+    parser.add_argument('--frames_per_chunk', default=1, help="Frames per chunk, or 'auto'.")
+    parser.add_argument('--io_profile', default=IO_PROFILE_DEFAULT, choices=list(IO_PROFILES))
+    parser.add_argument('--output_formats', nargs='+', default=['hdf5'], choices=list(OUTPUT_FORMATS),
+                        help='Writer backends to compare.')
+    parser.add_argument('--n_images', type=int, default=2000, help='Images published per run.')
+    parser.add_argument('--rates', type=float, nargs='+', default=[0],
+                        help='Publish rates in images per second, 0 for as fast as possible.')
+    parser.add_argument('--find_max_rate', action='store_true',
+                        help='Search for the highest rate without lost images, starting from the first rate.')
+    parser.add_argument('--ring_n_images', type=int, default=N_IMAGE_SLOTS,
+                        help='Images the compressed buffer holds before the writer loses them.')
+    parser.add_argument('--swmr_flush_interval', type=float, default=None,
+                        help='Write in SWMR mode, flushing for readers every this many seconds.')
+    parser.add_argument('--output_dir', type=str, default=None,
+                        help='Directory on the filesystem to benchmark, the system temp directory by default.')
+    parser.add_argument('--json', action='store_true', help='Output results as JSON.')
+
+    args = parser.parse_args()
+    frames_per_chunk = args.frames_per_chunk if args.frames_per_chunk == 'auto' else int(args.frames_per_chunk)
+    benchmark_kwargs = dict(model=args.model, shape=(args.height, args.width), bit_depth=args.bit_depth,
+                            codec_config=args.codec, frames_per_chunk=frames_per_chunk, n_images=args.n_images,
+                            output_dir=args.output_dir, io_profile=args.io_profile, ring_n_images=args.ring_n_images,
+                            swmr_flush_interval=args.swmr_flush_interval)
+
+    if args.find_max_rate and not args.rates[0]:
+        raise ValueError("The rate search needs a start rate above 0.")
+
+    results, max_rates = [], {}
+    for output_format in args.output_formats:
+        if args.find_max_rate:
+            max_rates[output_format], format_results = find_max_rate(args.rates[0], output_format=output_format,
+                                                                     **benchmark_kwargs)
+            results.extend(format_results)
+        else:
+            results.extend(benchmark_rate(rate=rate, output_format=output_format, **benchmark_kwargs)
+                           for rate in args.rates)
+
+    if args.json:
+        print(json.dumps({'results': results, 'max_rate_Hz': max_rates}, indent=2))
+        return
+
+    print("{:<6} {:>10} {:>12} {:>10} {:>10} {:>7} {:>9} {:>8} {:>8} {:>8}".format(
+        'FORMAT', 'RATE_Hz', 'PUBLISHED_Hz', 'WRITTEN_Hz', 'MB/s', 'LOST', 'OVERRUN', 'P50_ms', 'P99_ms', 'MAX_ms'))
+    for result in results:
+        print("{:<6} {:>10.0f} {:>12.0f} {:>10.0f} {:>10.1f} {:>7} {:>9} {:>8.2f} {:>8.2f} {:>8.2f}".format(
+            result['output_format'], result['rate_Hz'], result['published_Hz'], result['written_Hz'],
+            result['written_MBps'], result['n_lost'], result['n_overrun'], result['latency_p50_ms'],
+            result['latency_p99_ms'], result['latency_max_ms']))
+
+    for output_format, max_rate in max_rates.items():
+        print(f"Max rate without lost images for {output_format}: {max_rate:.0f} Hz")
+
+
+if __name__ == "__main__":
+    main()
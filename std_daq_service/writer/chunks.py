@@ -0,0 +1,84 @@
+import logging
+
+import numpy as np
+
+_logger = logging.getLogger("WriterChunks")
+
+# Uncompressed chunk size the automatic frames_per_chunk aims for.
+AUTO_CHUNK_N_BYTES = 4 * 1024 * 1024
+MAX_FRAMES_PER_CHUNK = 256
+
+
+def get_frames_per_chunk(daq_config, codec, shape, dtype, n_images=None):
+    """Images per HDF5 chunk from the optional 'writer_frames_per_chunk' DAQ config entry: a number, or 'auto' to
+    fill chunks of about AUTO_CHUNK_N_BYTES uncompressed. Falls back to 1 if the codec cannot join the images."""
+    frames_per_chunk = daq_config.get('writer_frames_per_chunk', 1)
+    n_elements, element_n_bytes = shape[0] * shape[1], np.dtype(dtype).itemsize
+
+    if frames_per_chunk == 'auto':
+        frames_per_chunk = min(max(1, AUTO_CHUNK_N_BYTES // (n_elements * element_n_bytes)), MAX_FRAMES_PER_CHUNK)
+    elif int(frames_per_chunk) < 1:
+        raise ValueError(f"writer_frames_per_chunk must be 'auto' or at least 1, not {frames_per_chunk}.")
+    frames_per_chunk = int(frames_per_chunk)
+
+    if frames_per_chunk > 1 and not codec.can_join(n_elements, element_n_bytes):
+        _logger.warning(f"Codec {codec.name} cannot join images of shape {shape} into one chunk, "
+                        f"writing 1 image per chunk instead of {frames_per_chunk}.")
+        frames_per_chunk = 1
+
+    # Chunks of fixed size datasets cannot be larger than the dataset.
+    if n_images:
+        frames_per_chunk = min(frames_per_chunk, n_images)
+
+    return frames_per_chunk
+
+
+class ChunkPacker(object):
+    """Joins frames_per_chunk consecutive compressed images into one HDF5 chunk of shape (frames_per_chunk, H, W).
+
+    Images are copied out of the buffer as they are added. A chunk that is flushed before it is full is padded with
+    compressed empty images, so every chunk decompresses to the full chunk shape.
+    """
+    def __init__(self, codec, shape, dtype, frames_per_chunk):
+        self.codec = codec
+        self.frames_per_chunk = frames_per_chunk
+
+        n_elements, element_n_bytes = shape[0] * shape[1], np.dtype(dtype).itemsize
+        frame_max_n_bytes = codec.get_max_n_bytes(n_elements, element_n_bytes)
+        self._chunk_max_n_bytes = frame_max_n_bytes * frames_per_chunk
+
+        self._header = np.empty(0, dtype='uint8')
+        if frames_per_chunk > 1:
+            self._header = codec.get_join_header(n_elements * element_n_bytes * frames_per_chunk, element_n_bytes)
+
+            empty_frame = np.empty(frame_max_n_bytes, dtype='uint8')
+            n_bytes = codec.compress_into(np.zeros(shape, dtype=dtype), empty_frame)
+            self._empty_payload = codec.get_join_payload(empty_frame[:n_bytes]).copy()
+
+        self._new_buffer()
+
+    def add(self, data):
+        """Copy the compressed image data into the chunk. Returns True once the chunk is full."""
+        self._append(data if self.frames_per_chunk == 1 else self.codec.get_join_payload(data))
+        return self.n_frames == self.frames_per_chunk
+
+    def get_chunk(self):
+        """The chunk of the images added so far, padded to frames_per_chunk. Starts a new chunk in a new buffer,
+        so the returned chunk can be queued for writing."""
+        while self.n_frames < self.frames_per_chunk:
+            self._append(self._empty_payload)
+
+        chunk = self._buffer[:self._n_bytes]
+        self._new_buffer()
+        return chunk
+
+    def _new_buffer(self):
+        self._buffer = np.empty(self._chunk_max_n_bytes, dtype='uint8')
+        self._buffer[:self._header.nbytes] = self._header
+        self._n_bytes = self._header.nbytes
+        self.n_frames = 0
+
+    def _append(self, payload):
+        self._buffer[self._n_bytes:self._n_bytes + payload.nbytes] = payload
+        self._n_bytes += payload.nbytes
+        self.n_frames += 1
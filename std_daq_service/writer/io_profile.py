@@ -0,0 +1,83 @@
+import logging
+
+import h5py
+
+_logger = logging.getLogger("WriterIoProfile")
+
+# h5py defaults, as the writer always used them.
+IO_PROFILE_DEFAULT = 'default'
+# GPFS and Lustre: data chunks aligned to the block or stripe size, metadata packed into large pages.
+IO_PROFILE_PARALLEL_FS = 'parallel_fs'
+
+IO_PROFILES = {
+    IO_PROFILE_DEFAULT: {},
+    IO_PROFILE_PARALLEL_FS: {
+        'libver': 'latest',
+        # Filesystem block or stripe size. Chunks of at least alignment_threshold bytes start on a multiple of it.
+        'alignment': 4 * 1024 * 1024,
+        'alignment_threshold': 2 * 1024 * 1024,
+        # Paged aggregation: file space is managed in pages, metadata of many chunks goes out in one page write.
+        # Chunks smaller than a page are packed into pages instead of aligned, so pages are stripe sized too.
+        'page_size': 4 * 1024 * 1024,
+        'meta_block_size': 4 * 1024 * 1024,
+        # O_DIRECT through the HDF5 direct driver, only if this HDF5 build has it.
+        'direct_io': False,
+    },
+}
+IO_PROFILE_FIELDS = list(IO_PROFILES[IO_PROFILE_PARALLEL_FS])
+
+
+def get_io_profile(daq_config, output_file):
+    """I/O profile for output_file from the optional 'writer_io_profiles' DAQ config entry, which maps path
+    prefixes to a profile name or to a dict with the profile name and overrides, for example:
+        {"/gpfs/": "parallel_fs", "/sf/": {"profile": "parallel_fs", "alignment": 16777216}}
+    The longest matching prefix wins, paths without a match use the default profile."""
+    io_profiles = daq_config.get('writer_io_profiles') or {}
+    matches = [prefix for prefix in io_profiles if output_file.startswith(prefix)]
+    if not matches:
+        return dict(IO_PROFILES[IO_PROFILE_DEFAULT], name=IO_PROFILE_DEFAULT)
+
+    return create_io_profile(io_profiles[max(matches, key=len)])
+
+
+def create_io_profile(profile_config):
+    """Profile settings from a profile name, or a dict with the name and overrides of its settings."""
+    if isinstance(profile_config, str):
+        profile_config = {'profile': profile_config}
+
+    overrides = dict(profile_config)
+    name = overrides.pop('profile', IO_PROFILE_DEFAULT)
+    if name not in IO_PROFILES:
+        raise ValueError(f"Unknown writer I/O profile {name}. Available profiles: {list(IO_PROFILES)}.")
+
+    unknown_fields = [field for field in overrides if field not in IO_PROFILE_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"Unknown writer I/O profile settings {unknown_fields}, use {IO_PROFILE_FIELDS}.")
+
+    return dict(IO_PROFILES[name], **overrides, name=name)
+
+
+def get_file_kwargs(io_profile):
+    """Keyword arguments for h5py.File that apply the profile."""
+    kwargs = {}
+    if io_profile.get('libver'):
+        kwargs['libver'] = io_profile['libver']
+    if io_profile.get('alignment'):
+        kwargs['alignment_interval'] = io_profile['alignment']
+        kwargs['alignment_threshold'] = io_profile.get('alignment_threshold') or io_profile['alignment']
+    if io_profile.get('page_size'):
+        kwargs['fs_strategy'] = 'page'
+        kwargs['fs_page_size'] = io_profile['page_size']
+    if io_profile.get('meta_block_size'):
+        kwargs['meta_block_size'] = io_profile['meta_block_size']
+
+    if io_profile.get('direct_io'):
+        if 'direct' in h5py.registered_drivers():
+            # The direct driver needs buffers and transfers aligned to the filesystem block.
+            block_n_bytes = io_profile.get('alignment') or 4096
+            kwargs.update(driver='direct', alignment=block_n_bytes, block_size=block_n_bytes,
+                          cbuf_size=16 * block_n_bytes)
+        else:
+            _logger.warning("The HDF5 library has no direct driver, writing without O_DIRECT.")
+
+    return kwargs
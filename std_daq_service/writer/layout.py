@@ -0,0 +1,53 @@
+import numpy as np
+
+# Same layout as the detector writer, which file_validator and the REST file endpoints read.
+DATA_DATASET = 'data'
+IMAGE_ID_DATASET = 'image_id'
+STATUS_DATASET = 'status'
+METADATA_DTYPES = {IMAGE_ID_DATASET: 'uint64', STATUS_DATASET: 'uint32'}
+METADATA_CHUNK_N_IMAGES = 1024
+
+# Open-ended acquisitions grow the datasets by at least this many images at a time.
+GROW_N_IMAGES = 1000
+
+
+def get_grow_n_images(frames_per_chunk):
+    """Growth increment of open-ended datasets, rounded up to whole chunks."""
+    return -(-GROW_N_IMAGES // frames_per_chunk) * frames_per_chunk
+
+
+def create_datasets(file, detector_name, shape, dtype, codec, frames_per_chunk, n_images):
+    """The data and per-image metadata datasets in the group detector_name. With n_images=0 the datasets are
+    extendable, they start at one growth increment and are grown and trimmed by the writer.
+    Returns the data dataset and a dict of the metadata datasets."""
+    group = file.create_group(detector_name)
+    initial_n_images = n_images or get_grow_n_images(frames_per_chunk)
+    max_n_images = n_images or None
+
+    # Chunks are written as they come out of the compressed buffer, the filter only tells readers how to
+    # decompress them.
+    data = group.create_dataset(DATA_DATASET, tuple([initial_n_images] + list(shape)),
+                                maxshape=tuple([max_n_images] + list(shape)), dtype=dtype,
+                                chunks=tuple([frames_per_chunk] + list(shape)), allow_unknown_filter=True,
+                                **codec.get_hdf5_filter())
+
+    metadata = {}
+    for name, metadata_dtype in METADATA_DTYPES.items():
+        metadata[name] = group.create_dataset(name, (initial_n_images,), maxshape=(max_n_images,),
+                                              dtype=metadata_dtype,
+                                              chunks=(min(initial_n_images, METADATA_CHUNK_N_IMAGES),))
+
+    return data, metadata
+
+
+def resize_datasets(data, metadata, n_images):
+    data.resize(n_images, axis=0)
+    for dataset in metadata.values():
+        dataset.resize(n_images, axis=0)
+
+
+def get_chunk_metadata(chunk_images):
+    """Per-image metadata of one chunk from its list of (image_id, status)."""
+    image_ids, statuses = zip(*chunk_images)
+    return {IMAGE_ID_DATASET: np.array(image_ids, dtype=METADATA_DTYPES[IMAGE_ID_DATASET]),
+            STATUS_DATASET: np.array(statuses, dtype=METADATA_DTYPES[STATUS_DATASET])}
@@ -0,0 +1,197 @@
+import logging
+from threading import Thread
+
+import h5py
+
+from std_daq_service.writer.io_profile import get_file_kwargs
+from std_daq_service.writer.layout import create_datasets, get_chunk_metadata, get_grow_n_images, resize_datasets
+from std_daq_service.writer.rollover import create_master_file, get_part_file_name
+from std_daq_service.writer.write_thread import ChunkWriteThread
+
+_logger = logging.getLogger("OutputFile")
+
+
+class OutputFile(object):
+    """One HDF5 output file: its datasets and the thread writing their chunks.
+    With n_images=0 the datasets are open-ended, they grow while writing and are trimmed at close.
+
+    With an swmr config the file is readable while it is written. The datasets are then always open-ended, so
+    their shape tells SWMR readers how many images were flushed."""
+    def __init__(self, filename, detector_name, shape, dtype, codec, frames_per_chunk, n_images, io_profile,
+                 max_queue_n_bytes, on_written=None, swmr=None):
+        self.filename = filename
+        self.open_ended = not n_images or bool(swmr)
+        self.n_bytes = 0
+
+        file_kwargs = get_file_kwargs(io_profile)
+        if swmr:
+            # SWMR needs the latest file format.
+            file_kwargs['libver'] = 'latest'
+
+        self.file = h5py.File(filename, 'w', **file_kwargs)
+        try:
+            self.dataset, self.metadata_datasets = create_datasets(self.file, detector_name, shape, dtype, codec,
+                                                                   frames_per_chunk, 0 if swmr else n_images)
+            if swmr:
+                # All objects exist now, from here on readers can open the file.
+                resize_datasets(self.dataset, self.metadata_datasets, 0)
+                self.file.swmr_mode = True
+
+            # The receiver copies images out of the buffer into chunks, the write thread takes the filesystem latency.
+            self.write_thread = ChunkWriteThread(
+                self.dataset, max_queue_n_bytes, self.metadata_datasets,
+                grow_n_images=get_grow_n_images(frames_per_chunk) if self.open_ended else None,
+                on_written=on_written, flush_interval=swmr['flush_interval'] if swmr else None)
+        except Exception:
+            self.file.close()
+            raise
+
+    def put(self, i_image, chunk, metadata):
+        """Queue the chunk that starts at i_image of this file."""
+        self.write_thread.put((i_image, 0, 0), chunk, metadata)
+        self.n_bytes += chunk.nbytes
+
+    def close(self, n_images):
+        """Write the queued chunks, trim open-ended datasets to n_images and close the file."""
+        try:
+            self.write_thread.close()
+            if self.open_ended:
+                resize_datasets(self.dataset, self.metadata_datasets, n_images)
+        finally:
+            self.file.close()
+
+
+class OutputFiles(object):
+    """The files of one acquisition: output_file itself, or with rollover a part file per rollover interval and,
+    at close, a master output_file with virtual datasets over the parts.
+
+    A full part is closed in a background thread while the next part is already being written, so it can be
+    validated or transferred while the acquisition continues. on_written and swmr are passed on to every file.
+    """
+    def __init__(self, output_file, n_images, rollover, detector_name, shape, dtype, codec, frames_per_chunk,
+                 io_profile, max_queue_n_bytes, on_written=None, swmr=None):
+        self.output_file = output_file
+        self.n_images = n_images
+        self.rollover = rollover
+        self.detector_name = detector_name
+        self.shape = shape
+        self.dtype = dtype
+        self.codec = codec
+        self.frames_per_chunk = frames_per_chunk
+        self.io_profile = io_profile
+        self.max_queue_n_bytes = max_queue_n_bytes
+        self.on_written = on_written
+        self.swmr = swmr
+
+        self.current = None
+        self.part_start = 0
+        self.parts = []
+        self._closing_threads = []
+
+        # Later parts are only opened once their first chunk arrives.
+        self._open(0)
+
+    def put(self, i_image, chunk, chunk_images):
+        """Queue the chunk that starts at image i_image of the acquisition, chunk_images are its (image_id, status)."""
+        if self.current is None:
+            self._open(i_image)
+
+        self.current.put(i_image - self.part_start, chunk, get_chunk_metadata(chunk_images))
+
+        part_n_images = i_image + len(chunk_images) - self.part_start
+        if self.rollover and ((self.rollover['n_images'] and part_n_images >= self.rollover['n_images']) or
+                              (self.rollover['n_bytes'] and self.current.n_bytes >= self.rollover['n_bytes'])):
+            self._close_current(part_n_images, background=True)
+
+    def get_stats(self):
+        return self.current.write_thread.get_stats() if self.current else {}
+
+    def close(self, n_images):
+        """Close the files after n_images of the acquisition, with rollover create the master file."""
+        if self.current is not None:
+            self._close_current(n_images - self.part_start)
+        for thread in self._closing_threads:
+            thread.join()
+
+        if self.rollover:
+            create_master_file(self.output_file, self.detector_name, self.parts, self.shape, self.dtype)
+            _logger.info(f"Wrote master file {self.output_file} over {len(self.parts)} files.")
+
+    def _open(self, i_image):
+        self.part_start = i_image
+        if not self.rollover:
+            self.current = self._create_file(self.output_file, self.n_images)
+            return
+
+        # Parts of open-ended acquisitions or with a rollover by size only are open-ended too, and so is a last part
+        # shorter than a chunk: fixed size datasets cannot be smaller than their chunks.
+        part_n_images = 0
+        if self.rollover['n_images'] and self.n_images:
+            part_n_images = min(self.rollover['n_images'], self.n_images - i_image)
+            if part_n_images < self.frames_per_chunk:
+                part_n_images = 0
+
+        filename = get_part_file_name(self.output_file, len(self.parts))
+        self.current = self._create_file(filename, part_n_images)
+        self.parts.append((filename, 0))
+
+    def _create_file(self, filename, n_images):
+        _logger.info(f"Writing {filename} with the {self.io_profile['name']} I/O profile.")
+        return OutputFile(filename, self.detector_name, self.shape, self.dtype, self.codec, self.frames_per_chunk,
+                          n_images, self.io_profile, self.max_queue_n_bytes, on_written=self.on_written,
+                          swmr=self.swmr)
+
+    def _close_current(self, n_images, background=False):
+        output_file, self.current = self.current, None
+        if self.rollover:
+            self.parts[-1] = (output_file.filename, n_images)
+
+        if not background:
+            output_file.close(n_images)
+            return
+
+        thread = Thread(target=self._close_part, args=(output_file, n_images), name='ClosePart')
+        thread.start()
+        self._closing_threads.append(thread)
+
+    @staticmethod
+    def _close_part(output_file, n_images):
+        try:
+            output_file.close(n_images)
+            _logger.info(f"Closed {output_file.filename} with {n_images} images.")
+        except Exception:
+            _logger.exception(f"Error while closing {output_file.filename}.")
+
+
+class ChunkedOutput(object):
+    """Joins the images of an acquisition into chunks of frames_per_chunk images for the HDF5 output files."""
+    def __init__(self, output_files, packer):
+        self.output_files = output_files
+        self.packer = packer
+        self.encoding = packer.codec.encoding
+
+        self.n_images = 0
+        self._chunk_images = []
+
+    def put(self, image_id, status, encoding, data):
+        """Add the compressed image data of the next image, a full chunk is queued for writing."""
+        chunk_full = self.packer.add(data)
+        self._chunk_images.append((image_id, status))
+        self.n_images += 1
+
+        if chunk_full:
+            self.output_files.put(self.n_images - self.packer.frames_per_chunk, self.packer.get_chunk(),
+                                  self._chunk_images)
+            self._chunk_images = []
+
+    def get_stats(self):
+        return self.output_files.get_stats()
+
+    def close(self):
+        try:
+            # The last chunk of a stopped or short acquisition is padded with empty images.
+            if self.packer.n_frames:
+                self.output_files.put(self.n_images - self.packer.n_frames, self.packer.get_chunk(),
+                                      self._chunk_images)
+        finally:
+            self.output_files.close(self.n_images)
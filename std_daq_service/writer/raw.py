@@ -0,0 +1,234 @@
+import argparse
+import json
+import logging
+import os
+
+import bitshuffle.h5
+import h5py
+import numpy as np
+
+from std_daq_service.compression.codecs import create_codec, get_decoder
+from std_daq_service.writer.layout import IMAGE_ID_DATASET, METADATA_DTYPES, STATUS_DATASET, create_datasets, \
+    resize_datasets
+
+_logger = logging.getLogger("RawOutput")
+
+# Output files with this extension are written as raw segments and an index instead of HDF5.
+RAW_EXTENSION = '.raw'
+RAW_FORMAT_VERSION = 1
+
+DEFAULT_SEGMENT_GB = 4
+# Index records are appended to the index file in batches of this many images.
+INDEX_BATCH_N_IMAGES = 1000
+# One record per image, in acquisition order. size and encoding as in the ImageMetadata of the image.
+RAW_INDEX_DTYPE = np.dtype([('image_id', '<u8'),
+                            ('offset', '<u8'),
+                            ('size', '<u8'),
+                            ('segment', '<u4'),
+                            ('encoding', '<u4'),
+                            ('status', '<u4')])
+
+
+def is_raw_output(output_file):
+    return os.path.splitext(output_file)[1] == RAW_EXTENSION
+
+
+def get_raw_config(daq_config):
+    """The optional 'writer_raw' DAQ config entry, for example {"segment_gb": 4}: raw output is written into
+    preallocated segment files of segment_gb GB."""
+    raw_config = daq_config.get('writer_raw') or {}
+    segment_n_bytes = int(float(raw_config.get('segment_gb', DEFAULT_SEGMENT_GB)) * 1024 ** 3)
+    if segment_n_bytes <= 0:
+        raise ValueError(f"writer_raw segment_gb must be above 0, not {raw_config['segment_gb']}.")
+
+    return {'segment_n_bytes': segment_n_bytes}
+
+
+def get_segment_file_name(output_file, i_segment):
+    """/data/run.raw -> /data/run_00000.bin"""
+    return f'{os.path.splitext(output_file)[0]}_{i_segment:05d}.bin'
+
+
+def get_index_file_name(output_file):
+    """/data/run.raw -> /data/run.idx"""
+    return f'{os.path.splitext(output_file)[0]}.idx'
+
+
+class RawOutput(object):
+    """Appends compressed images back to back to preallocated segment files, without HDF5 chunk bookkeeping.
+
+    Each image is written straight from the buffer with one pwrite, the page cache and the ring buffer absorb
+    filesystem stalls. An index record per image gives its segment, offset, size and encoding. output_file itself
+    is a JSON manifest with the image geometry, the codec and the segment and index files, relative to it.
+    Images do not span segments, the last segment is truncated to its data at close.
+    """
+    # Images of any encoding are accepted, the encoding is recorded per image.
+    encoding = None
+
+    def __init__(self, output_file, detector_name, shape, dtype, codec_config, raw_config, on_written=None):
+        self.output_file = output_file
+        self.detector_name = detector_name
+        self.shape = list(shape)
+        self.dtype = dtype
+        self.codec_config = codec_config
+        self.segment_n_bytes = raw_config['segment_n_bytes']
+        self.on_written = on_written
+
+        self.segments = []
+        self._segment_fd = None
+        self._segment_offset = 0
+        self.n_bytes = 0
+
+        self._index = np.zeros(INDEX_BATCH_N_IMAGES, dtype=RAW_INDEX_DTYPE)
+        self._n_batch_images = 0
+        self.n_images = 0
+        self._index_file = open(get_index_file_name(output_file), 'wb')
+
+        self._open_segment()
+
+    def put(self, image_id, status, encoding, data):
+        """Write the compressed image data, a uint8 array, at the end of the current segment."""
+        if data.nbytes > self.segment_n_bytes:
+            raise ValueError(f"Image_id {image_id} of {data.nbytes} bytes does not fit into segments of "
+                             f"{self.segment_n_bytes} bytes.")
+        if self._segment_offset + data.nbytes > self.segment_n_bytes:
+            self._close_segment()
+            self._open_segment()
+
+        offset = self._segment_offset
+        n_written = os.pwrite(self._segment_fd, data, offset)
+        while n_written < data.nbytes:
+            n_written += os.pwrite(self._segment_fd, data[n_written:], offset + n_written)
+        self._segment_offset += data.nbytes
+        self.n_bytes += data.nbytes
+
+        self._index[self._n_batch_images] = (image_id, offset, data.nbytes, len(self.segments) - 1, encoding, status)
+        self._n_batch_images += 1
+        self.n_images += 1
+        if self._n_batch_images == INDEX_BATCH_N_IMAGES:
+            self._write_index()
+
+        if self.on_written:
+            self.on_written((self.n_images - 1, 0, 0),
+                            {IMAGE_ID_DATASET: np.array([image_id], dtype=METADATA_DTYPES[IMAGE_ID_DATASET])})
+
+    def get_stats(self):
+        return {'n_images': self.n_images, 'n_segments': len(self.segments), 'written_mb': self.n_bytes / 1024 / 1024}
+
+    def close(self):
+        try:
+            self._write_index()
+            self._close_segment()
+        finally:
+            self._index_file.close()
+        self._write_manifest()
+
+    def _open_segment(self):
+        filename = get_segment_file_name(self.output_file, len(self.segments))
+        self._segment_fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self._segment_offset = 0
+        self.segments.append(filename)
+
+        try:
+            os.posix_fallocate(self._segment_fd, 0, self.segment_n_bytes)
+        except OSError as e:
+            _logger.warning(f"Cannot preallocate {filename}, writing it without: {e}")
+
+        # Written with every new segment and at close, so readers can follow the run.
+        self._write_manifest()
+
+    def _close_segment(self):
+        try:
+            os.ftruncate(self._segment_fd, self._segment_offset)
+        finally:
+            os.close(self._segment_fd)
+            self._segment_fd = None
+
+    def _write_index(self):
+        self._index_file.write(self._index[:self._n_batch_images].tobytes())
+        self._index_file.flush()
+        self._n_batch_images = 0
+
+    def _write_manifest(self):
+        manifest = {'version': RAW_FORMAT_VERSION,
+                    'detector_name': self.detector_name,
+                    'shape': self.shape,
+                    'dtype': self.dtype,
+                    'codec': self.codec_config,
+                    'index': os.path.basename(get_index_file_name(self.output_file)),
+                    'segments': [os.path.basename(segment) for segment in self.segments],
+                    'n_images': self.n_images}
+        with open(self.output_file, 'w') as output_file:
+            json.dump(manifest, output_file, indent=2)
+
+
+class RawReader(object):
+    """Reads the images of a raw output file through its manifest and index."""
+    def __init__(self, raw_file):
+        with open(raw_file, 'r') as input_file:
+            self.manifest = json.load(input_file)
+        if self.manifest['version'] != RAW_FORMAT_VERSION:
+            raise ValueError(f"Unsupported raw format version {self.manifest['version']} in {raw_file}.")
+
+        directory = os.path.dirname(raw_file)
+        self.detector_name = self.manifest['detector_name']
+        self.shape = tuple(self.manifest['shape'])
+        self.dtype = self.manifest['dtype']
+        self.index = np.fromfile(os.path.join(directory, self.manifest['index']), dtype=RAW_INDEX_DTYPE)
+        # Empty segments cannot be mapped.
+        self._segments = [np.memmap(path, dtype='uint8', mode='r') if os.path.getsize(path) else np.empty(0, 'uint8')
+                          for path in (os.path.join(directory, segment) for segment in self.manifest['segments'])]
+
+    @property
+    def n_images(self):
+        return len(self.index)
+
+    def get_compressed(self, i_image):
+        """The image as written, a uint8 view into its segment."""
+        record = self.index[i_image]
+        return self._segments[record['segment']][record['offset']:record['offset'] + record['size']]
+
+    def get_image(self, i_image):
+        return get_decoder(int(self.index[i_image]['encoding'])).decompress(self.get_compressed(i_image),
+                                                                           self.shape, self.dtype)
+
+
+def export_to_hdf5(raw_file, output_file):
+    """Convert raw output into an HDF5 file with the writer layout. The compressed images are copied as chunks,
+    without decompressing them, so all images need the encoding of the manifest codec."""
+    reader = RawReader(raw_file)
+    codec = create_codec(reader.manifest['codec'])
+    encodings = np.unique(reader.index['encoding'])
+    if len(encodings) and (len(encodings) > 1 or encodings[0] != codec.encoding):
+        raise ValueError(f"Images of {raw_file} have encodings {list(encodings)}, only encoding {codec.encoding} "
+                         f"of the codec {codec.name} can be exported.")
+
+    with h5py.File(output_file, 'w') as file:
+        data, metadata = create_datasets(file, reader.detector_name, reader.shape, reader.dtype, codec, 1,
+                                         reader.n_images)
+        if not reader.n_images:
+            # Created open-ended at one growth increment.
+            resize_datasets(data, metadata, 0)
+
+        for i_image in range(reader.n_images):
+            data.id.write_direct_chunk((i_image, 0, 0), reader.get_compressed(i_image))
+        metadata[IMAGE_ID_DATASET][:] = reader.index['image_id']
+        metadata[STATUS_DATASET][:] = reader.index['status']
+
+    _logger.info(f"Exported {reader.n_images} images from {raw_file} to {output_file}.")
+    return reader.n_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export raw writer output to HDF5')
+    parser.add_argument("raw_file", type=str, help="Manifest of the raw output, the output_file of the run.")
+    parser.add_argument("output_file", type=str, help="HDF5 file to create.")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    export_to_hdf5(args.raw_file, args.output_file)
+
+
+if __name__ == "__main__":
+    main()
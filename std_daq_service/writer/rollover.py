@@ -0,0 +1,49 @@
+import os
+
+import h5py
+
+from std_daq_service.writer.layout import DATA_DATASET, METADATA_DTYPES
+
+
+def get_rollover_config(daq_config, frames_per_chunk):
+    """The optional 'writer_rollover' DAQ config entry, for example {"n_images": 10000, "n_gb": 50}: a new file is
+    started after n_images images or n_gb GB of compressed data, whichever comes first. Files always end on a
+    whole chunk, so n_images is rounded up to whole chunks. Returns None if not configured."""
+    rollover_config = daq_config.get('writer_rollover')
+    if not rollover_config:
+        return None
+
+    n_images = int(rollover_config.get('n_images') or 0)
+    n_bytes = int(float(rollover_config.get('n_gb') or 0) * 1024 ** 3)
+    if n_images < 0 or n_bytes < 0 or not (n_images or n_bytes):
+        raise ValueError(f"writer_rollover needs a positive n_images or n_gb, not {rollover_config}.")
+
+    return {'n_images': -(-n_images // frames_per_chunk) * frames_per_chunk, 'n_bytes': n_bytes}
+
+
+def get_part_file_name(output_file, i_part):
+    """File of the i_part rollover file, next to the master output_file: /data/run.h5 -> /data/run_00000.h5."""
+    root, extension = os.path.splitext(output_file)
+    return f'{root}_{i_part:05d}{extension}'
+
+
+def create_master_file(output_file, detector_name, parts, shape, dtype):
+    """Master file at output_file exposing the rollover files, a list of (part file, n_images), as one continuous
+    set of datasets through virtual datasets. Part files are referenced relative to the master file."""
+    n_images = sum(part_n_images for _, part_n_images in parts)
+    datasets = {DATA_DATASET: dtype, **METADATA_DTYPES}
+
+    with h5py.File(output_file, 'w', libver='latest') as file:
+        group = file.create_group(detector_name)
+        for name, dataset_dtype in datasets.items():
+            image_shape = tuple(shape) if name == DATA_DATASET else ()
+            layout = h5py.VirtualLayout(shape=(n_images,) + image_shape, dtype=dataset_dtype)
+
+            i_image = 0
+            for part_file, part_n_images in parts:
+                source = h5py.VirtualSource(os.path.basename(part_file), f'{detector_name}/{name}',
+                                            shape=(part_n_images,) + image_shape)
+                layout[i_image:i_image + part_n_images] = source
+                i_image += part_n_images
+
+            group.create_virtual_dataset(name, layout)
@@ -3,68 +3,120 @@ import logging
 import os
 from time import sleep, time
 
-import bitshuffle
 import bitshuffle.h5
-import h5py
 import numpy as np
 from std_buffer.image_metadata_pb2 import ImageMetadata
 import zmq
 from zmq import Again
 
-from std_daq_service.config import load_daq_config
-from std_daq_service.ram_buffer import RamBuffer
+from std_daq_service.compression.codecs import get_codec
+from std_daq_service.compression.worker import get_image_geometry
+from std_daq_service.config import load_daq_config, get_compressed_stream_address
+from std_daq_service.image_accounting import ImageIdAccounting
+from std_daq_service.ram_buffer import PackedRamBuffer, attach_consumer_cursor
+from std_daq_service.writer.chunks import ChunkPacker, get_frames_per_chunk
+from std_daq_service.writer.io_profile import get_io_profile
+from std_daq_service.writer.output_file import ChunkedOutput, OutputFiles
+from std_daq_service.writer.raw import RawOutput, get_raw_config, is_raw_output
+from std_daq_service.writer.rollover import get_rollover_config
+from std_daq_service.writer.swmr import get_swmr_config
+from std_daq_service.writer.write_thread import get_queue_n_bytes
 
 _logger = logging.getLogger("Compression")
 
 
-def start_writing(config_file, output_file, n_images):
+def start_writing(config_file, output_file, n_images, timeout=None):
+    """Write n_images to output_file, or with n_images=0 until interrupted. With a timeout in seconds the writing
+    also ends when no image arrived for that long."""
     daq_config = load_daq_config(config_file)
+    write_stream(daq_config, output_file, n_images, timeout=timeout, user_id=daq_config['writer_user_id'])
+
+
+def write_stream(daq_config, output_file, n_images, timeout=None, user_id=None, on_written=None):
+    """Write the images announced on the compressed stream of the detector to output_file, see start_writing.
+    An output_file with the .raw extension is written as raw segments and an index instead of HDF5.
+    The files are written as user_id if given. on_written(offset, metadata) is called after each chunk is written.
+    Returns the number of images written and the image id stats."""
     detector_name = daq_config['detector_name']
-    shape = [daq_config['image_pixel_height'], daq_config['image_pixel_width']]
-    dtype = f'uint{daq_config["bit_depth"]}'
-    image_n_bytes = int(daq_config['bit_depth'] / 8 *
-                        daq_config['image_pixel_height'] * daq_config['image_pixel_width'])
-    block_size = 0
+    # The ROI shape if an ROI is configured.
+    shape, dtype, _ = get_image_geometry(daq_config)
+    codec = get_codec(daq_config)
+    frames_per_chunk = get_frames_per_chunk(daq_config, codec, shape, dtype, n_images)
 
-    image_metadata_address = f"ipc:///tmp/{detector_name}-image"
+    # Images are announced on the compressed stream only once they are in the compressed buffer.
+    image_metadata_address = get_compressed_stream_address(detector_name)
 
-    # Receive the image metadata stream from the detector.
+    # Receive the compressed image metadata stream.
     ctx = zmq.Context()
     image_metadata_receiver = ctx.socket(zmq.SUB)
     # image_metadata_receiver.setsockopt(zmq.CONFLATE, 1)
     image_metadata_receiver.connect(image_metadata_address)
     image_metadata_receiver.setsockopt_string(zmq.SUBSCRIBE, "")
+    image_metadata_receiver.setsockopt(zmq.RCVTIMEO, 200)
 
-    buffer = RamBuffer(channel_name=detector_name, data_n_bytes=image_n_bytes, n_slots=1000, compression=True)
+    buffer = PackedRamBuffer(channel_name=detector_name, backend=daq_config.get('ram_buffer_backend'))
+    cursors, cursor = attach_consumer_cursor(buffer.buffer_name, 'writer', backend=daq_config.get('ram_buffer_backend'))
 
+    accounting = ImageIdAccounting('writer')
     image_meta = ImageMetadata()
+    i_image = 0
     try:
-        os.seteuid(daq_config['writer_user_id'])
-        # Initialize HDF5 file and dataset here.
-        with h5py.File(output_file, 'w') as file:
-            dataset = file.create_dataset(detector_name, tuple([n_images] + shape),
-                                          # compression=bitshuffle.h5.H5FILTER,
-                                          # compression_opts=(block_size, bitshuffle.h5.H5_COMPRESS_LZ4),
-                                          dtype=dtype, chunks=tuple([1] + shape))
-
-            i_image = 0
-            start_time = time()
+        if user_id is not None:
+            os.seteuid(user_id)
+        if is_raw_output(output_file):
+            output = RawOutput(output_file, detector_name, shape, dtype, daq_config.get('compression_codec'),
+                               get_raw_config(daq_config), on_written=on_written)
+        else:
+            output = ChunkedOutput(
+                OutputFiles(output_file, n_images, get_rollover_config(daq_config, frames_per_chunk), detector_name,
+                            shape, dtype, codec, frames_per_chunk, get_io_profile(daq_config, output_file),
+                            get_queue_n_bytes(daq_config), on_written=on_written, swmr=get_swmr_config(daq_config)),
+                ChunkPacker(codec, shape, dtype, frames_per_chunk))
+
+        start_time = last_image_time = time()
+        try:
             while True:
-                if i_image == n_images:
+                if n_images and i_image == n_images:
+                    break
+
+                if timeout and time() - last_image_time > timeout:
+                    _logger.info(f"No image for {timeout} seconds, stop writing.")
                     break
 
                 if time() - start_time > 1:
                     start_time = time()
-                    print(i_image)
+                    print(f'Written {i_image}; Image ids {accounting.get_stats()}; Writes {output.get_stats()}')
 
                 try:
-                    meta_raw = image_metadata_receiver.recv(flags=zmq.NOBLOCK)
+                    meta_raw = image_metadata_receiver.recv()
                     if meta_raw:
+                        last_image_time = time()
                         image_meta.ParseFromString(meta_raw)
-                        data = buffer.get_data(image_meta.image_id, shape=(image_meta.size,), dtype='uint8')
-                        # data = bitshuffle.compress_lz4(data, block_size)
-                        dataset.id.write_direct_chunk((i_image, 0, 0), data)
-                        # dataset[i_image] = data
+                        accounting.record(image_meta.image_id)
+                        if output.encoding is not None and image_meta.compression != output.encoding:
+                            _logger.error(f"Image_id {image_meta.image_id} has encoding {image_meta.compression}, "
+                                          f"but the dataset filter is for {codec.name}.")
+                            continue
+
+                        # The buffer index, not the metadata, is authoritative for the compressed size.
+                        n_bytes = buffer.get_slot_info(image_meta.image_id)['size']
+                        if n_bytes != image_meta.size:
+                            _logger.warning(f"Image_id {image_meta.image_id} metadata size {image_meta.size} "
+                                            f"does not match buffer size {n_bytes}.")
+
+                        data, sequence = buffer.get_data_checked(image_meta.image_id, shape=(n_bytes,),
+                                                                 dtype='uint8')
+                        if data is None:
+                            accounting.record_overrun(image_meta.image_id)
+                            continue
+
+                        output.put(image_meta.image_id, image_meta.status, image_meta.compression, data)
+                        if not buffer.is_unchanged(image_meta.image_id, sequence):
+                            _logger.error(f"Image_id {image_meta.image_id} overwritten while being written "
+                                          f"to i_image {i_image}.")
+                            accounting.record_overrun(image_meta.image_id)
+                        if cursors:
+                            cursors.publish_cursor(cursor, image_meta.image_id)
                         i_image += 1
 
                 except Again:
@@ -74,22 +126,34 @@ def start_writing(config_file, output_file, n_images):
                 except Exception:
                     _logger.exception("Error in validator loop.")
                     break
+        finally:
+            output.close()
+
+        _logger.info(f"Wrote {i_image} images to {output_file}, image ids {accounting.get_stats()}.")
     except Exception as e:
         _logger.exception(f"Failed to write to file: {e}")
     finally:
-        os.seteuid(0)
+        if user_id is not None:
+            os.seteuid(0)
+        image_metadata_receiver.close()
+        ctx.term()
+
+    return i_image, accounting.get_stats()
 
 
 def main():
     parser = argparse.ArgumentParser(description='Stream writer')
     parser.add_argument("config_file", type=str, help="Path to the config file managed by this instance.")
     parser.add_argument("output_file", type=str, help="Absolute path filename to write the data to.")
-    parser.add_argument("n_images", type=int, help="Number of images to write.")
+    parser.add_argument("n_images", type=int, help="Number of images to write, 0 to write until interrupted.")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Stop writing when no image arrived for this many seconds.")
 
     args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
 
-    start_writing(config_file=args.config_file, output_file=args.output_file, n_images=args.n_images)
+    start_writing(config_file=args.config_file, output_file=args.output_file, n_images=args.n_images,
+                  timeout=args.timeout)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+import os
+
+import h5py
+
+
+def get_n_writers(daq_config):
+    """Number of writer instances from the optional 'writer_n_writers' DAQ config entry, 1 if not configured."""
+    n_writers = int(daq_config.get('writer_n_writers') or 1)
+    if n_writers < 1:
+        raise ValueError(f"writer_n_writers must be at least 1, not {n_writers}.")
+    return n_writers
+
+
+def get_stripe_file_name(output_file, i_writer):
+    """File written by writer i_writer of a striped acquisition: /data/run.h5 -> /data/run_w00.h5."""
+    root, extension = os.path.splitext(output_file)
+    return f'{root}_w{i_writer:02d}{extension}'
+
+
+def get_stripe_n_images(n_images, i_writer, n_writers):
+    """Images of an acquisition of n_images that go to writer i_writer, which gets every n_writers-th image."""
+    return max(0, (n_images - i_writer + n_writers - 1) // n_writers)
+
+
+def create_striped_master_file(output_file, stripe_files, n_images):
+    """Master file at output_file that interleaves the stripe files back into acquisition order with virtual
+    datasets: image i is image i // n_writers of stripe file i % n_writers. Datasets, shapes and dtypes are taken
+    from the first stripe file, stripe files are referenced relative to the master file."""
+    n_writers = len(stripe_files)
+
+    with h5py.File(stripe_files[0], 'r') as stripe_file:
+        datasets = {}
+        stripe_file.visititems(lambda name, item: datasets.update({name: (item.shape[1:], item.dtype)})
+                               if isinstance(item, h5py.Dataset) else None)
+
+    with h5py.File(output_file, 'w', libver='latest') as file:
+        for name, (image_shape, dtype) in datasets.items():
+            layout = h5py.VirtualLayout(shape=(n_images,) + image_shape, dtype=dtype)
+
+            for i_writer, stripe_file in enumerate(stripe_files):
+                stripe_n_images = get_stripe_n_images(n_images, i_writer, n_writers)
+                if not stripe_n_images:
+                    continue
+                source = h5py.VirtualSource(os.path.basename(stripe_file), name,
+                                            shape=(stripe_n_images,) + image_shape)
+                layout[i_writer::n_writers] = source
+
+            file.create_virtual_dataset(name, layout)
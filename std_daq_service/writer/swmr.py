@@ -0,0 +1,75 @@
+import h5py
+
+from std_daq_service.writer.layout import DATA_DATASET, IMAGE_ID_DATASET, STATUS_DATASET
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+def get_swmr_config(daq_config):
+    """The optional 'writer_swmr' DAQ config entry, for example {"flush_interval": 0.5}: files are written in HDF5
+    single writer multiple reader mode and flushed for readers every flush_interval seconds.
+    Returns None if not configured."""
+    swmr_config = daq_config.get('writer_swmr')
+    if not swmr_config:
+        return None
+    if swmr_config is True:
+        swmr_config = {}
+
+    flush_interval = float(swmr_config.get('flush_interval', DEFAULT_FLUSH_INTERVAL))
+    if flush_interval <= 0:
+        raise ValueError(f"writer_swmr flush_interval must be above 0, not {flush_interval}.")
+
+    return {'flush_interval': flush_interval}
+
+
+def open_swmr_file(filename):
+    """Open an output file for reading, in SWMR mode so it can still be written. Files written without SWMR are
+    opened normally."""
+    try:
+        return h5py.File(filename, 'r', libver='latest', swmr=True)
+    except OSError:
+        return h5py.File(filename, 'r')
+
+
+class SwmrReader(object):
+    """Reads the datasets of one detector from an output file while the writer may still be flushing to it.
+
+    In SWMR mode the writer keeps the datasets trimmed to the images it flushed, so after refresh() the first
+    n_images images can be read. Finished files and files written without SWMR read the same way.
+    """
+    def __init__(self, filename, detector_name=None):
+        self.file = open_swmr_file(filename)
+        try:
+            self.detector_name = detector_name or list(self.file)[0]
+            group = self.file[self.detector_name]
+            self.data = group[DATA_DATASET]
+            self.image_id = group[IMAGE_ID_DATASET]
+            self.status = group[STATUS_DATASET] if STATUS_DATASET in group else None
+        except Exception:
+            self.file.close()
+            raise
+
+    @property
+    def datasets(self):
+        return [dataset for dataset in (self.data, self.image_id, self.status) if dataset is not None]
+
+    @property
+    def n_images(self):
+        return min(dataset.shape[0] for dataset in self.datasets)
+
+    def refresh(self):
+        """Pick up the images the writer flushed since the last refresh, returns n_images."""
+        if self.file.swmr_mode:
+            for dataset in self.datasets:
+                dataset.refresh()
+
+        return self.n_images
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,168 @@
+import logging
+import threading
+from collections import deque
+from time import perf_counter_ns, monotonic
+
+from std_daq_service.writer.layout import resize_datasets
+
+_logger = logging.getLogger("WriteThread")
+
+DEFAULT_QUEUE_MB = 512
+
+
+def get_queue_n_bytes(daq_config):
+    """Bytes of compressed chunks the writer can hold in memory while the filesystem stalls, from the optional
+    'writer_queue_mb' DAQ config entry."""
+    return int(daq_config.get('writer_queue_mb', DEFAULT_QUEUE_MB)) * 1024 * 1024
+
+
+class ChunkWriteThread(object):
+    """Writes chunks to an HDF5 dataset from a dedicated thread, so the receiver keeps draining the compressed
+    buffer while a write blocks. h5py releases the GIL in write_direct_chunk.
+
+    The queue is bounded by max_queue_n_bytes. When it is full, put blocks and the time is counted as I/O stall.
+    The thread writes everything queued since its last wake-up in one pass, the per-image metadata of each chunk
+    together with it. With grow_n_images the datasets are grown in steps of that many images when a chunk falls
+    outside of them. on_written(offset, metadata) is called from the thread after each chunk is written.
+
+    With flush_interval in seconds the file is flushed at that cadence for SWMR readers, also when no new chunk
+    arrives. Grown datasets are trimmed to the images written before each flush, so their shape is what readers
+    can read.
+    """
+    def __init__(self, dataset, max_queue_n_bytes, metadata_datasets=None, grow_n_images=None, on_written=None,
+                 flush_interval=None):
+        self.dataset = dataset
+        self.max_queue_n_bytes = max_queue_n_bytes
+        self.metadata_datasets = metadata_datasets or {}
+        self.grow_n_images = grow_n_images
+        self.on_written = on_written
+        self.flush_interval = flush_interval
+
+        self._queue = deque()
+        self._queue_n_bytes = 0
+        self._condition = threading.Condition()
+        self._closing = False
+        self._error = None
+
+        self._n_written_images = 0
+        self._unflushed = False
+        self._last_flush_time = monotonic()
+
+        self._reset_stats()
+        self._thread = threading.Thread(target=self._run, name='ChunkWriteThread', daemon=True)
+        self._thread.start()
+
+    def _reset_stats(self):
+        self._max_queue_depth = len(self._queue)
+        self._stall_ns = 0
+        self._write_ns = 0
+        self._n_chunks = 0
+        self._max_batch = 0
+        self._n_flushes = 0
+
+    def put(self, offset, chunk, metadata=None):
+        """Queue chunk for writing at offset, block while the queue is full.
+        metadata maps metadata dataset names to the values of the images in the chunk."""
+        with self._condition:
+            if self._queue_n_bytes + chunk.nbytes > self.max_queue_n_bytes and self._queue:
+                start_time = perf_counter_ns()
+                self._condition.wait_for(lambda: self._error is not None or not self._queue or
+                                         self._queue_n_bytes + chunk.nbytes <= self.max_queue_n_bytes)
+                self._stall_ns += perf_counter_ns() - start_time
+
+            if self._error is not None:
+                raise RuntimeError("Chunk write thread failed.") from self._error
+
+            self._queue.append((offset, chunk, metadata))
+            self._queue_n_bytes += chunk.nbytes
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._condition.notify_all()
+
+    def close(self):
+        """Write all queued chunks and stop the thread."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+
+        if self._error is not None:
+            raise RuntimeError("Chunk write thread failed.") from self._error
+
+    def get_stats(self):
+        """Queue and write stats since the last call, times in milliseconds."""
+        with self._condition:
+            stats = {'queue_depth': len(self._queue),
+                     'queue_mb': self._queue_n_bytes / 1024 / 1024,
+                     'max_queue_depth': self._max_queue_depth,
+                     'io_stall_ms': self._stall_ns / 1e6,
+                     'write_ms': self._write_ns / 1e6,
+                     'n_chunks': self._n_chunks,
+                     'max_batch': self._max_batch,
+                     'n_flushes': self._n_flushes}
+            self._reset_stats()
+
+        return stats
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    # Wakes up when a flush is due, also if no chunk arrives.
+                    self._condition.wait_for(lambda: self._queue or self._closing, timeout=self._get_flush_timeout())
+                    if not self._queue and self._closing:
+                        return
+                    batch = list(self._queue)
+                    self._max_batch = max(self._max_batch, len(batch))
+
+                for offset, chunk, metadata in batch:
+                    start_time = perf_counter_ns()
+                    if self.grow_n_images and offset[0] >= self.dataset.shape[0]:
+                        self._grow(offset[0])
+
+                    self.dataset.id.write_direct_chunk(offset, chunk)
+                    for name, values in (metadata or {}).items():
+                        self.metadata_datasets[name][offset[0]:offset[0] + len(values)] = values
+                    write_ns = perf_counter_ns() - start_time
+
+                    n_images = len(next(iter(metadata.values()))) if metadata else 0
+                    self._n_written_images = max(self._n_written_images, offset[0] + n_images)
+                    self._unflushed = True
+
+                    # Free the space of each chunk as soon as it is written, the receiver may be waiting for it.
+                    with self._condition:
+                        self._queue.popleft()
+                        self._queue_n_bytes -= chunk.nbytes
+                        self._write_ns += write_ns
+                        self._n_chunks += 1
+                        self._condition.notify_all()
+
+                    if self.on_written:
+                        self.on_written(offset, metadata)
+
+                if self.flush_interval and monotonic() - self._last_flush_time >= self.flush_interval:
+                    self._flush()
+
+        except Exception as e:
+            _logger.exception("Error while writing chunks.")
+            with self._condition:
+                self._error = e
+                self._condition.notify_all()
+
+    def _get_flush_timeout(self):
+        if not self.flush_interval or not self._unflushed:
+            return None
+        return max(0.0, self._last_flush_time + self.flush_interval - monotonic())
+
+    def _flush(self):
+        if self._unflushed:
+            if self.grow_n_images:
+                resize_datasets(self.dataset, self.metadata_datasets, self._n_written_images)
+            self.dataset.file.flush()
+            with self._condition:
+                self._n_flushes += 1
+
+        self._unflushed = False
+        self._last_flush_time = monotonic()
+
+    def _grow(self, i_image):
+        resize_datasets(self.dataset, self.metadata_datasets, (i_image // self.grow_n_images + 1) * self.grow_n_images)
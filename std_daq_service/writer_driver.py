@@ -1,6 +1,6 @@
 import copy
 from collections import deque
-from threading import Thread, Event, Lock, Semaphore
+from threading import Thread, Event, Lock, Semaphore, Condition
 from google.protobuf.json_format import MessageToDict
 from std_buffer.image_metadata_pb2 import ImageMetadata
 from std_buffer.writer_command_pb2 import WriterCommand, CommandType, RunInfo, WriterStatus
@@ -8,7 +8,10 @@ from time import time, sleep, time_ns
 import logging
 import zmq
 
+from std_daq_service.config import get_striped_command_address
+from std_daq_service.image_accounting import ImageIdAccounting, IMAGE_ID_STATS_FIELDS
 from std_daq_service.rest_v2.utils import set_ipc_rights
+from std_daq_service.writer.striping import get_stripe_file_name, get_stripe_n_images, create_striped_master_file
 
 _logger = logging.getLogger(__name__)
 
@@ -19,25 +22,35 @@ RECV_TIMEOUT_MS = 200
 SYNC_WINDOW_SIZE = 20
 N_LOGS = 50
 
-WRITER_STATUS_POLL_INTERVAL = 0.1
-WRITER_STATUS_POLL_N_ATTEMPTS = 50
+# In seconds.
+WRITER_STATE_TIMEOUT = 5
 
 
 class WriterStatusTracker(object):
-    EMPTY_STATS = {"n_write_completed": 0, "n_write_requested": 0, "start_time": None, "stop_time": None}
+    EMPTY_STATS = {"n_write_completed": 0, "n_write_requested": 0, "n_write_completed_per_writer": [],
+                   "start_time": None, "stop_time": None, "start_to_first_write_ms": None, "stop_to_ready_ms": None,
+                   **dict.fromkeys(IMAGE_ID_STATS_FIELDS, 0)}
 
-    def __init__(self, ctx, in_status_address, out_status_address, n_max_active_requests):
+    def __init__(self, ctx, in_status_address, out_status_address, n_max_active_requests, n_writers=1):
         self.ctx = ctx
         self.n_max_active_requests = n_max_active_requests
+        self.n_writers = n_writers
         self.stop_event = Event()
         self.rate_limiter = None
 
         self.status = None
         self.status_lock = Lock()
+        # Notified on every state change, so waiting for a state does not need to poll.
+        self.status_changed = Condition(self.status_lock)
         self.set_unknown_status()
 
         self.last_status_send_time = 0
+        self._start_request_time = None
+        self._stop_request_time = None
         self._current_run_id = None
+        # Run info of the acquisition as requested, the writers of a striped acquisition each report their own file.
+        self._run_info = None
+        self._stopped_writers = set()
 
         self.status_receiver = self.ctx.socket(zmq.PULL)
         self.status_receiver.RCVTIMEO = WRITER_STATUS_TIMEOUT_MS
@@ -53,11 +66,62 @@ class WriterStatusTracker(object):
     def set_unknown_status(self):
         with self.status_lock:
             self.status = {'state': 'UNKNOWN', 'acquisition': None}
+            self.status_changed.notify_all()
 
     def get_status(self):
         with self.status_lock:
             return self.status
 
+    def wait_for_state(self, target_state, timeout=WRITER_STATE_TIMEOUT):
+        """Block until the writers reach target_state, returns the status. Raises ValueError if the acquisition
+        failed and RuntimeError if the state is not reached within timeout seconds."""
+        def is_failed():
+            # The error of an earlier failed acquisition does not fail the wait for the next one.
+            acquisition = self.status['acquisition']
+            return bool(acquisition and acquisition['message'].startswith("ERROR:") and
+                        (acquisition is not initial_acquisition or acquisition['message'] != initial_message))
+
+        with self.status_changed:
+            initial_acquisition = self.status['acquisition']
+            initial_message = initial_acquisition['message'] if initial_acquisition else None
+
+            if not self.status_changed.wait_for(lambda: self.status['state'] == target_state or is_failed(),
+                                                timeout=timeout):
+                raise RuntimeError(f"Cannot reach {target_state}. Writer needs to be restarted.")
+            if self.status['state'] != target_state:
+                raise ValueError(self.status['acquisition']['message'])
+            return self.status
+
+    def set_run_info(self, run_info):
+        """Run info to report for the next acquisition instead of the one in the writers START status."""
+        self._run_info = run_info
+        self._start_request_time = time()
+
+    def log_stop_request(self):
+        self._stop_request_time = time()
+
+    def set_acquisition_error(self, message):
+        """Fail the last acquisition after its writers stopped, for example when its master file cannot be written.
+        Published with the next status update."""
+        with self.status_lock:
+            if self.status['acquisition']:
+                self.status['acquisition']['state'] = 'FAILED'
+                self.status['acquisition']['message'] = message
+                self.status_changed.notify_all()
+
+    def _get_i_writer(self, status):
+        """Index of the writer that sent status, None if it is not a writer of the current acquisition. Writers are not
+        told their stripe index, they are told apart by the stripe file they report in their run_info."""
+        if self.n_writers == 1:
+            return 0
+
+        if self._run_info:
+            for i_writer in range(self.n_writers):
+                if status.run_info.output_file == get_stripe_file_name(self._run_info['output_file'], i_writer):
+                    return i_writer
+
+        return None
+
     def _status_rcv_thread(self):
         status_message = WriterStatus()
 
@@ -92,9 +156,15 @@ class WriterStatusTracker(object):
 
     def _log_write_status(self, status):
         with self.status_lock:
+            stats = self.status['acquisition']['stats']
+            if stats['start_to_first_write_ms'] is None and self._start_request_time:
+                stats['start_to_first_write_ms'] = (time() - self._start_request_time) * 1000
             self.status['state'] = 'WRITING'
             self.status['acquisition']['state'] = 'ACQUIRING_IMAGES'
-            self.status['acquisition']['stats']['n_write_completed'] += 1
+            stats['n_write_completed'] += 1
+            i_writer = self._get_i_writer(status)
+            if i_writer is not None:
+                stats['n_write_completed_per_writer'][i_writer] += 1
 
         self.rate_limiter.release()
 
@@ -105,36 +175,69 @@ class WriterStatusTracker(object):
             self.status_sender.send_json(self.status)
 
     def _log_start_status(self, run_id, status):
+        # Every writer of a striped acquisition reports its start, only the first one starts the acquisition.
+        if run_id == self._current_run_id:
+            return
+
+        run_info = self._run_info if self._run_info and self._run_info.get('run_id') == run_id else \
+            {'output_file': status.run_info.output_file, 'n_images': status.run_info.n_images}
         with self.status_lock:
             self.status = {'state': "WRITING",
                            'acquisition': {'state': 'WAITING_IMAGES',
                                            'message': '',
                                            'stats': dict(self.EMPTY_STATS),
-                                           'info': {'output_file': status.run_info.output_file,
-                                                    'n_images': status.run_info.n_images,
+                                           'info': {'output_file': run_info['output_file'],
+                                                    'n_images': run_info['n_images'],
                                                     'run_id': run_id}}}
             self.status['acquisition']['stats']['start_time'] = time()
+            self.status['acquisition']['stats']['n_write_completed_per_writer'] = [0] * self.n_writers
+            self.status_changed.notify_all()
 
         self.last_status_send_time = 0
         self._current_run_id = run_id
+        self._stopped_writers = set()
         self.rate_limiter = Semaphore(self.n_max_active_requests)
 
         # Send status update as soon as writer starts.
         self.status_sender.send_json(self.status)
 
     def _log_stop_status(self, status):
+        # The acquisition is finished once every writer reported its stop, the first error is kept.
+        # Outside of an acquisition the stop of any writer reports the writers as READY.
+        if self._current_run_id is not None and self.n_writers > 1:
+            i_writer = self._get_i_writer(status)
+            if i_writer is None:
+                _logger.warning(f"Received stop status from an unknown writer: {status}")
+            else:
+                self._stopped_writers.add(i_writer)
+
+            if len(self._stopped_writers) < self.n_writers:
+                with self.status_lock:
+                    if self.status['acquisition'] and status.error_message and \
+                            not self.status['acquisition']['message'].startswith("ERROR:"):
+                        self.status['acquisition']['message'] = status.error_message
+                        self.status_changed.notify_all()
+                return
+
         with self.status_lock:
             self.status['state'] = 'READY'
 
             if self.status['acquisition']:
                 self.status['acquisition']['state'] = 'FINISHED'
                 self.status['acquisition']['stats']['stop_time'] = time()
-                self.status['acquisition']['message'] = status.error_message
-                if status.error_message.startswith("ERROR:"):
+                if not self.status['acquisition']['message'].startswith("ERROR:"):
+                    self.status['acquisition']['message'] = status.error_message
+                if self._stop_request_time:
+                    self.status['acquisition']['stats']['stop_to_ready_ms'] = \
+                        (self.status['acquisition']['stats']['stop_time'] - self._stop_request_time) * 1000
+                if self.status['acquisition']['message'].startswith("ERROR:"):
                     self.status['acquisition']['stats']['start_time'] = self.status['acquisition']['stats']['stop_time']
                     self.status['acquisition']['state'] = 'FAILED'
+            self.status_changed.notify_all()
 
         self._current_run_id = None
+        self._stopped_writers = set()
+        self._stop_request_time = None
 
         # Send status update as soon as writer stops.
         self.status_sender.send_json(self.status)
@@ -150,6 +253,12 @@ class WriterStatusTracker(object):
         with self.status_lock:
             self.status['acquisition']['stats']['n_write_requested'] += 1
 
+    def log_image_id_stats(self, image_id_stats):
+        """Attach the image_id accounting of the driver to the stats of the current acquisition."""
+        with self.status_lock:
+            if self.status['acquisition']:
+                self.status['acquisition']['stats'].update(image_id_stats)
+
     def close(self):
         _logger.info("Closing writer status.")
 
@@ -166,17 +275,21 @@ class WriterDriver(object):
     START_COMMAND = 'START'
     STOP_COMMAND = 'STOP'
 
-    def __init__(self, ctx, command_address, in_status_address, out_status_address, image_metadata_address):
+    def __init__(self, ctx, command_address, in_status_address, out_status_address, image_metadata_address,
+                 n_writers=1):
         _logger.info(f'Starting writer driver with:\n' \
                      f'\t command_address:{command_address}\n' \
+                     f'\t n_writers:{n_writers}\n' \
                      f'\t in_status_address:{in_status_address}\n' \
                      f'\t out_status_address:{out_status_address}\n' \
                      f'\t image_metadata_address:{image_metadata_address}')
         self.out_status_address = out_status_address
+        self.n_writers = n_writers
 
         self.ctx = ctx
         self.stop_event = Event()
-        self.status = WriterStatusTracker(ctx, in_status_address, out_status_address, SYNC_WINDOW_SIZE)
+        self.status = WriterStatusTracker(ctx, in_status_address, out_status_address, SYNC_WINDOW_SIZE,
+                                          n_writers=n_writers)
 
         # Inter-thread communication (send commands from user to communication thread)
         self.user_command_sender = self.ctx.socket(zmq.PUSH)
@@ -186,10 +299,16 @@ class WriterDriver(object):
         self.user_command_receiver = self.ctx.socket(zmq.PULL)
         self.user_command_receiver.connect(self.WRITER_DRIVER_IPC_ADDRESS)
 
-        # Send commands to writer instances.
-        self.writer_command_sender = self.ctx.socket(zmq.PUB)
-        self.writer_command_sender.bind(command_address)
-        set_ipc_rights(command_address)
+        # Send commands to writer instances. With several writers every writer has its own command address and
+        # gets every n_writers-th image of the acquisition.
+        writer_command_addresses = [command_address] if n_writers == 1 else \
+            [get_striped_command_address(command_address, i_writer) for i_writer in range(n_writers)]
+        self.writer_command_senders = []
+        for writer_command_address in writer_command_addresses:
+            writer_command_sender = self.ctx.socket(zmq.PUB)
+            writer_command_sender.bind(writer_command_address)
+            set_ipc_rights(writer_command_address)
+            self.writer_command_senders.append(writer_command_sender)
 
         # Receive the image metadata stream from the detector.
         self.image_metadata_receiver = self.ctx.socket(zmq.SUB)
@@ -197,6 +316,10 @@ class WriterDriver(object):
 
         self.image_meta = ImageMetadata()
         self.writer_command = WriterCommand()
+        # Command of each writer, with the run_info of its stripe when images are striped over several writers.
+        self.writer_commands = [self.writer_command] if n_writers == 1 else \
+            [WriterCommand() for _ in range(n_writers)]
+        self.image_accounting = ImageIdAccounting('writer_driver')
 
         self.communication_t = Thread(target=self._communication_thread)
         self.communication_t.start()
@@ -204,17 +327,20 @@ class WriterDriver(object):
     def get_status(self):
         return self.status.get_status()
 
-    def start(self, run_info):
+    def start(self, run_info, timeout=None):
+        """Start writing run_info['n_images'] images, or with n_images=0 until stop is called. With a timeout in
+        seconds the acquisition also stops when no image arrived for that long."""
         _logger.info(f"Start acquisition requested.")
 
         status = self.get_status()
         if status['state'] != "READY":
             raise RuntimeError(f"Cannot start new acquisition while previous one is running:\n {status}")
 
-        self.user_command_sender.send_json({'COMMAND': self.START_COMMAND, 'run_info': run_info or {}})
+        self.user_command_sender.send_json({'COMMAND': self.START_COMMAND, 'run_info': run_info or {},
+                                            'timeout': timeout})
 
         try:
-            self.wait_for_state("WRITING")
+            self.status.wait_for_state("WRITING")
         except RuntimeError:
             self.status.set_unknown_status()
             raise
@@ -224,7 +350,7 @@ class WriterDriver(object):
         self.user_command_sender.send_json({'COMMAND': self.STOP_COMMAND})
 
         try:
-            self.wait_for_state("READY")
+            self.status.wait_for_state("READY")
         except RuntimeError:
             self.status.set_unknown_status()
             raise
@@ -245,6 +371,9 @@ class WriterDriver(object):
         poller.register(self.image_metadata_receiver, zmq.POLLIN)
 
         i_image = 0
+        # Idle timeout of the running acquisition, None when no acquisition is running or it has no timeout.
+        acquisition_timeout = None
+        last_image_time = None
         while not self.stop_event.is_set():
             try:
                 events = dict(poller.poll(timeout=RECV_TIMEOUT_MS))
@@ -257,9 +386,13 @@ class WriterDriver(object):
 
                         self._execute_start_command(run_info)
                         i_image = 0
+                        self.image_accounting.reset()
+                        acquisition_timeout = command.get('timeout')
+                        last_image_time = time()
 
                     elif command['COMMAND'] == self.STOP_COMMAND:
-                        self._execute_stop_command()
+                        self._execute_stop_command(i_image)
+                        acquisition_timeout = None
 
                     else:
                         _logger.warning(f"Unknown command:{command}.")
@@ -267,13 +400,22 @@ class WriterDriver(object):
                 if self.image_metadata_receiver in events:
                     meta_raw = self.image_metadata_receiver.recv(flags=zmq.NOBLOCK)
                     self.image_meta.ParseFromString(meta_raw)
+                    self.image_accounting.record(self.image_meta.image_id)
+                    self.status.log_image_id_stats(self.image_accounting.get_stats())
 
                     self._execute_write_command(i_image)
                     i_image += 1
+                    last_image_time = time()
 
-                    # Terminate writing.
+                    # Terminate writing. Open-ended acquisitions (n_images=0) run until stop or timeout.
                     if i_image == self.writer_command.run_info.n_images:
-                        self._execute_stop_command()
+                        self._execute_stop_command(i_image)
+                        acquisition_timeout = None
+
+                if acquisition_timeout and time() - last_image_time > acquisition_timeout:
+                    _logger.info(f"No image for {acquisition_timeout} seconds, stopping the acquisition.")
+                    self._execute_stop_command(i_image)
+                    acquisition_timeout = None
 
             except Exception as e:
                 _logger.exception("Error in driver loop.")
@@ -283,16 +425,16 @@ class WriterDriver(object):
         self.writer_command.command_type = CommandType.START_WRITING
         self.writer_command.run_info.CopyFrom(RunInfo(**run_info))
         self.writer_command.metadata.Clear()
+        self.status.set_run_info(run_info)
 
-        _logger.debug(f"Send start command to writer: {self.writer_command}.")
-        self.writer_command_sender.send(self.writer_command.SerializeToString())
+        self._send_to_writers("start")
 
-        self.wait_for_state('WRITING')
+        self.status.wait_for_state('WRITING')
 
         # Subscribe to the ImageMetadata stream.
         self.image_metadata_receiver.setsockopt(zmq.SUBSCRIBE, b'')
 
-    def _execute_stop_command(self):
+    def _execute_stop_command(self, n_images):
         # Stop listening to new image metadata.
         self.image_metadata_receiver.setsockopt(zmq.UNSUBSCRIBE, b'')
 
@@ -305,27 +447,71 @@ class WriterDriver(object):
         self.writer_command.command_type = CommandType.STOP_WRITING
         self.writer_command.metadata.Clear()
 
-        _logger.debug(f"Send stop command to writer: {self.writer_command}.")
-        self.writer_command_sender.send(self.writer_command.SerializeToString())
+        self.status.log_stop_request()
+        self._send_to_writers("stop")
 
-        self.wait_for_state('READY')
+        if not self._wait_for_writers_stopped():
+            return
 
-    def _execute_write_command(self, i_image):
+        if self.n_writers > 1 and n_images:
+            acquisition = self.status.get_status()['acquisition']
+            if not acquisition or acquisition['state'] == 'FAILED':
+                _logger.error(f"Not creating master file {self.writer_command.run_info.output_file}, "
+                              f"the acquisition failed.")
+            else:
+                self._create_master_file(n_images)
+
+    def _send_to_writers(self, command_name):
+        if self.n_writers == 1:
+            _logger.debug(f"Send {command_name} command to writer: {self.writer_command}.")
+            self.writer_command_senders[0].send(self.writer_command.SerializeToString())
+            return
+
+        # Each writer writes its stripe into its own file, they are stitched together on stop. The writers report
+        # the run_info of their commands back, which tells the driver which writer a status is from.
+        for i_writer, writer_command in enumerate(self.writer_commands):
+            writer_command.CopyFrom(self.writer_command)
+            writer_command.run_info.output_file = get_stripe_file_name(self.writer_command.run_info.output_file,
+                                                                       i_writer)
+            writer_command.run_info.n_images = get_stripe_n_images(self.writer_command.run_info.n_images,
+                                                                   i_writer, self.n_writers)
+
+            _logger.debug(f"Send {command_name} command to writer {i_writer}: {writer_command}.")
+            self.writer_command_senders[i_writer].send(writer_command.SerializeToString())
+
+    def _wait_for_writers_stopped(self):
+        """Wait until every writer stopped, also when some of them failed. Returns False if they did not stop."""
+        while True:
+            try:
+                self.status.wait_for_state('READY')
+                return True
+            except ValueError as e:
+                # A failed writer does not stop the others, they still finish their stripes.
+                _logger.error(f"Writer failed during the acquisition: {e}")
+            except RuntimeError:
+                _logger.exception("Writers did not stop.")
+                self.status.set_unknown_status()
+                return False
+
+    def _create_master_file(self, n_images):
+        output_file = self.writer_command.run_info.output_file
+        stripe_files = [get_stripe_file_name(output_file, i_writer) for i_writer in range(self.n_writers)]
+
+        _logger.info(f"Creating master file {output_file} of {n_images} images from {stripe_files}.")
+        try:
+            create_striped_master_file(output_file, stripe_files, n_images)
+        except Exception as e:
+            _logger.exception(f"Cannot create master file {output_file}.")
+            self.status.set_acquisition_error(f"ERROR: Cannot create master file {output_file}: {e}")
 
-        self.writer_command.metadata.CopyFrom(self.image_meta)
-        self.writer_command.command_type = CommandType.WRITE_IMAGE
-        self.writer_command.i_image = i_image
+    def _execute_write_command(self, i_image):
+        # Striped writers get every n_writers-th image and write them densely into their own file.
+        i_writer = i_image % self.n_writers
+        writer_command = self.writer_commands[i_writer]
 
-        self.status.log_write_request(self.writer_command.run_info.run_id, self.image_meta.image_id)
-        self.writer_command_sender.send(self.writer_command.SerializeToString())
+        writer_command.metadata.CopyFrom(self.image_meta)
+        writer_command.command_type = CommandType.WRITE_IMAGE
+        writer_command.i_image = i_image // self.n_writers
 
-    def wait_for_state(self, target_state, poll_interval=WRITER_STATUS_POLL_INTERVAL):
-        for _ in range(WRITER_STATUS_POLL_N_ATTEMPTS):
-            sleep(poll_interval)
-            status = self.get_status()
-            if status['state'] == target_state:
-                return
-            if status['acquisition'] and status['acquisition']['message'].startswith("ERROR:"):
-                raise ValueError(status['acquisition']['message'])
-        else:
-            raise RuntimeError(f"Cannot reach {target_state}. Writer needs to be restarted.")
+        self.status.log_write_request(writer_command.run_info.run_id, self.image_meta.image_id)
+        self.writer_command_senders[i_writer].send(writer_command.SerializeToString())
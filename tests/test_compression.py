@@ -0,0 +1,247 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+import h5py
+import numpy as np
+
+from std_daq_service.compression.benchmark import FRAME_MODELS, BIT_DEPTHS, benchmark, generate_frames
+from std_daq_service.compression.codecs import CODECS, create_codec, get_decoder
+from std_daq_service.compression.controller import CompressionController
+from std_daq_service.compression.pool import CompressionSequencer, get_input_lag, get_worker_cores
+from std_daq_service.compression.stats import CompressionStats
+from std_daq_service.compression.worker import get_worker_cursor_name
+from std_daq_service.ram_buffer import RamBufferCursors
+
+
+class TestCompressionPool(unittest.TestCase):
+
+    def test_sequencer_order(self):
+        sequencer = CompressionSequencer()
+        for image_id in [10, 11, 13, 14]:
+            sequencer.dispatch(image_id)
+
+        # Workers finish out of order.
+        sequencer.complete(11, b'11')
+        self.assertEqual(sequencer.pop_ready(), [])
+
+        sequencer.complete(13, b'13')
+        sequencer.complete(10, b'10')
+        self.assertEqual(sequencer.pop_ready(), [b'10', b'11', b'13'])
+        self.assertEqual(sequencer.n_pending(), 1)
+
+        sequencer.complete(14, b'14')
+        self.assertEqual(sequencer.pop_ready(), [b'14'])
+        self.assertEqual(sequencer.n_pending(), 0)
+
+    def test_sequencer_drops(self):
+        sequencer = CompressionSequencer(timeout=2, max_pending=3)
+        for image_id in [1, 2, 3]:
+            sequencer.dispatch(image_id, dispatch_time=10)
+
+        # A failed image does not stall the images behind it.
+        sequencer.complete(1, None)
+        sequencer.complete(2, b'2')
+        self.assertEqual(sequencer.pop_ready(current_time=10), [b'2'])
+
+        # The result for 3 never arrives.
+        sequencer.dispatch(4, dispatch_time=11)
+        sequencer.complete(4, b'4')
+        self.assertEqual(sequencer.pop_ready(current_time=11), [])
+        self.assertEqual(sequencer.pop_ready(current_time=13), [b'4'])
+        self.assertEqual(sequencer.n_dropped, 2)
+
+        # Late results of dropped images are ignored.
+        sequencer.complete(3, b'3')
+        self.assertEqual(sequencer.completed, {})
+
+        for image_id in range(5, 10):
+            sequencer.dispatch(image_id, dispatch_time=20)
+        self.assertEqual(sequencer.pop_ready(current_time=20), [])
+        self.assertEqual(sequencer.n_pending(), 3)
+
+    def test_worker_cores(self):
+        self.assertEqual(get_worker_cores({}, 2), [None, None])
+        self.assertEqual(get_worker_cores({'compression_cores': [4, 5]}, 3), [4, 5, 4])
+
+    def test_input_lag_of_idle_workers(self):
+        cursors = RamBufferCursors(f'test-{uuid.uuid4().hex[:8]}-image', capacity=1000, create=True)
+        try:
+            self.assertIsNone(get_input_lag(None, 1, [None]))
+
+            # All 4 workers register their cursor at startup, only worker 0 is active and keeps up.
+            consumer_indexes = [cursors.register_consumer(get_worker_cursor_name(i_worker)) for i_worker in range(4)]
+            cursors.publish_head(50000)
+            cursors.publish_cursor(consumer_indexes[0], 49999)
+            last_dispatched_image_ids = [49999, None, None, None]
+            self.assertEqual(get_input_lag(cursors, 1, last_dispatched_image_ids), 0)
+
+            # Worker 1 was removed at image 1000, its stale cursor does not count.
+            cursors.publish_cursor(consumer_indexes[1], 1000)
+            last_dispatched_image_ids[1] = 1000
+            self.assertEqual(get_input_lag(cursors, 1, last_dispatched_image_ids), 0)
+            # Once active again, it only counts while it has images to compress.
+            self.assertEqual(get_input_lag(cursors, 2, last_dispatched_image_ids), 0)
+            last_dispatched_image_ids[1] = 49990
+            self.assertEqual(get_input_lag(cursors, 2, last_dispatched_image_ids), 49000)
+
+            with tempfile.TemporaryDirectory() as output_folder:
+                stats = CompressionStats('test', output_file=os.path.join(output_folder, 'perf.log'))
+                controller = CompressionController({'codecs': ['bshuffle_lz4'], 'min_workers': 1, 'max_workers': 4},
+                                                   n_workers=1, stats=stats)
+                for _ in range(3):
+                    lag_images = get_input_lag(cursors, controller.n_workers, [49999, None, None, None])
+                    self.assertIsNone(controller.update(1, 0.1, 1000, 400, lag_images=lag_images))
+                self.assertEqual(controller.n_workers, 1)
+                stats.close()
+        finally:
+            cursors.shm.unlink()
+
+
+class TestCodecs(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.images = {'noise': rng.integers(0, 2**16, size=(32, 40), dtype='uint16'),
+                       'photons': rng.poisson(0.1, size=(32, 40)).astype('uint16')}
+
+    def test_round_trip(self):
+        for name in CODECS:
+            codec = create_codec(name)
+            for image_name, image in self.images.items():
+                output = np.zeros(codec.get_max_n_bytes(image.size, image.itemsize), dtype='uint8')
+                n_bytes = codec.compress_into(image, output)
+
+                decoder = get_decoder(codec.encoding)
+                np.testing.assert_array_equal(decoder.decompress(output[:n_bytes], image.shape, image.dtype), image,
+                                              err_msg=f'{name} {image_name}')
+
+    def test_hdf5_filter(self):
+        try:
+            import hdf5plugin
+        except ImportError:
+            self.skipTest("hdf5plugin is needed to read filtered datasets.")
+
+        image = self.images['photons']
+        with tempfile.TemporaryDirectory() as output_folder:
+            for codec_config in ['raw', 'bshuffle_lz4', {'name': 'bshuffle_zstd', 'level': 5}, 'blosc2',
+                                 {'name': 'blosc2', 'cname': 'zstd', 'level': 3}]:
+                codec = create_codec(codec_config)
+                output = np.zeros(codec.get_max_n_bytes(image.size, image.itemsize), dtype='uint8')
+                n_bytes = codec.compress_into(image, output)
+
+                output_file = os.path.join(output_folder, f'{codec.name}.h5')
+                with h5py.File(output_file, 'w') as file:
+                    dataset = file.create_dataset('data', (1,) + image.shape, dtype=image.dtype,
+                                                  chunks=(1,) + image.shape, allow_unknown_filter=True,
+                                                  **codec.get_hdf5_filter())
+                    dataset.id.write_direct_chunk((0, 0, 0), output[:n_bytes])
+
+                with h5py.File(output_file, 'r') as file:
+                    np.testing.assert_array_equal(file['data'][0], image, err_msg=str(codec_config))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            create_codec('gzip')
+
+
+class TestCompressionBenchmark(unittest.TestCase):
+
+    def test_frame_models(self):
+        for model in FRAME_MODELS:
+            for bit_depth in BIT_DEPTHS:
+                frames = generate_frames(model, (64, 600), bit_depth, n_frames=2)
+                self.assertEqual(frames[0].dtype, np.dtype(f'uint{bit_depth}'))
+                self.assertEqual(frames[0].shape, (64, 600))
+
+        # Gigafrost frames are 12 bit, counting frames mostly empty.
+        self.assertLess(generate_frames('gigafrost_noise', (64, 64), 16)[0].max(), 2 ** 12)
+        self.assertLess(np.count_nonzero(generate_frames('photon_counting', (64, 64), 16)[0]), 64 * 64 // 10)
+
+    def test_benchmark(self):
+        result = benchmark('photon_counting', (64, 64), 16, {'name': 'bshuffle_lz4', 'block_size': 512},
+                           n_frames=10)
+        self.assertEqual(result['block_size'], 512)
+        self.assertLess(result['ratio'], 1)
+        self.assertGreater(result['input_MBps'], result['output_MBps'])
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class TestCompressionStats(unittest.TestCase):
+
+    def test_write_stats(self):
+        with tempfile.TemporaryDirectory() as output_folder:
+            stats_file = os.path.join(output_folder, 'perf.log')
+            stats = CompressionStats('test', output_file=stats_file)
+
+            for compress_ns in [1000000, 2000000, 3000000, 10000000]:
+                stats.record(1000, 250, compress_ns)
+            stats.record_wait(500000000)
+            stats.record_dropped()
+            interval_stats = stats.write_stats(lag_images=7)
+
+            self.assertEqual(interval_stats['n_frames'], 4)
+            self.assertEqual(interval_stats['n_input_bytes'], 4000)
+            self.assertAlmostEqual(interval_stats['compress_seconds'], 0.016)
+
+            # Counters start over after each write.
+            self.assertEqual(stats.write_stats()['n_frames'], 0)
+            stats.close()
+
+            with open(stats_file) as input_file:
+                lines = input_file.readlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('compression,detector_name=test n_frames=4i,'))
+        fields = dict(field.split('=') for field in lines[0].split(' ')[1].split(','))
+        self.assertEqual(float(fields['ratio']), 0.25)
+        self.assertEqual(float(fields['latency_max_ms']), 10)
+        self.assertEqual(float(fields['wait_metadata_s']), 0.5)
+        self.assertEqual(fields['n_dropped'], '1i')
+        self.assertEqual(fields['lag_images'], '7i')
+        self.assertNotIn('lag_images', lines[1])
+
+
+class TestCompressionController(unittest.TestCase):
+
+    def setUp(self):
+        self.output_folder = tempfile.TemporaryDirectory()
+        self.stats_file = os.path.join(self.output_folder.name, 'perf.log')
+        self.stats = CompressionStats('test', output_file=self.stats_file)
+        self.controller_config = {'codecs': [{'name': 'bshuffle_zstd', 'level': 1},
+                                             {'name': 'bshuffle_zstd', 'level': 5}],
+                                  'min_workers': 1, 'max_workers': 2, 'hold_intervals': 2}
+
+    def tearDown(self):
+        self.stats.close()
+        self.output_folder.cleanup()
+
+    def test_speed_up_and_relax(self):
+        controller = CompressionController(self.controller_config, n_workers=1, stats=self.stats)
+        self.assertEqual(controller.codec.level, 5)
+
+        # Overloaded: first a faster codec, then more workers, then nothing left to do.
+        self.assertEqual(controller.update(1, 0.95, 1000, 400)['action'], 'faster_codec')
+        self.assertEqual(controller.codec.level, 1)
+        self.assertEqual(controller.update(1, 0.5, 1000, 400, lag_images=500)['action'], 'add_worker')
+        self.assertEqual(controller.n_workers, 2)
+        self.assertIsNone(controller.update(1, 1.9, 1000, 400))
+
+        # Relaxes only after hold_intervals quiet intervals.
+        self.assertIsNone(controller.update(1, 0.2, 1000, 400))
+        self.assertEqual(controller.update(1, 0.2, 1000, 400)['action'], 'remove_worker')
+        self.assertIsNone(controller.update(1, 0.2, 1000, 400))
+        self.assertEqual(controller.update(1, 0.2, 1000, 400)['action'], 'better_ratio_codec')
+        self.assertEqual(controller.codec.level, 5)
+
+        with open(self.stats_file) as input_file:
+            lines = input_file.readlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('compression_controller,detector_name=test,action=faster_codec,'))
+
+    def test_single_codec_family(self):
+        self.controller_config['codecs'].append('bshuffle_lz4')
+        with self.assertRaises(ValueError):
+            CompressionController(self.controller_config, stats=self.stats)
+
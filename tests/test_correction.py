@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from std_daq_service.compression.worker import get_image_geometry
+from std_daq_service.correction.jungfrau import JungfrauCorrector, get_correction_config, load_maps
+
+
+def encode_raw(gain_bits, adc):
+    return ((np.asarray(gain_bits, dtype='uint16') << 14) | np.asarray(adc, dtype='uint16')).astype('uint16')
+
+
+class TestJungfrauCorrection(unittest.TestCase):
+
+    def setUp(self):
+        self.pedestal = np.stack([np.full((4, 6), value, dtype='float32') for value in (1000, 2000, 3000)])
+        self.gain = np.stack([np.full((4, 6), value, dtype='float32') for value in (40, -1.5, -0.1)])
+
+    def test_correct(self):
+        corrector = JungfrauCorrector(self.pedestal, self.gain)
+
+        # One pixel per gain stage, plus the invalid gain bits.
+        raw = np.zeros((4, 6), dtype='uint16')
+        raw[0, :4] = encode_raw([0, 1, 3, 2], [1400, 1700, 2990, 5000])
+        output = np.empty((4, 6), dtype='float32')
+        corrector.correct(raw, output)
+
+        np.testing.assert_allclose(output[0, :4], [10, 200, 100, 0], rtol=1e-5)
+
+        # Blocks corrected separately give the same frame.
+        blocks_output = np.empty((4, 6), dtype='float32')
+        for pixels in corrector.get_pixel_blocks(5):
+            corrector.correct(raw, blocks_output, pixels)
+        np.testing.assert_array_equal(blocks_output, output)
+
+    def test_photons(self):
+        corrector = JungfrauCorrector(self.pedestal, self.gain, output='photons', photon_energy=10)
+        raw = np.full((4, 6), 1000, dtype='uint16')
+        raw[1, 1] = encode_raw(0, 1000 + 40 * 31)
+        output = np.empty((4, 6), dtype='uint16')
+        corrector.correct(raw, output)
+
+        self.assertEqual(output[1, 1], 3)
+        self.assertEqual(output.sum(), 3)
+
+    def test_load_maps(self):
+        daq_config = {'detector_name': 'test', 'detector_type': 'jungfrau', 'bit_depth': 16,
+                      'image_pixel_height': 4, 'image_pixel_width': 6,
+                      'roi': {'x': 2, 'y': 1, 'width': 3, 'height': 2}}
+
+        with tempfile.TemporaryDirectory() as output_folder:
+            maps_file = os.path.join(output_folder, 'maps.h5')
+            with h5py.File(maps_file, 'w') as file:
+                file['pedestal'] = np.arange(72, dtype='float32').reshape(3, 4, 6)
+                file['gain'] = self.gain
+
+            daq_config['jungfrau_correction'] = {'pedestal_file': maps_file, 'gain_file': maps_file}
+            pedestal, gain = load_maps(maps_file, maps_file, (4, 6), rois=[daq_config['roi']])
+
+        self.assertEqual(pedestal.shape, (3, 2, 3))
+        np.testing.assert_array_equal(pedestal[1], np.arange(72).reshape(3, 4, 6)[1, 1:3, 2:5])
+        self.assertEqual(get_image_geometry(daq_config), ([2, 3], 'float32', 24))
+
+        daq_config['detector_type'] = 'eiger'
+        with self.assertRaises(ValueError):
+            get_correction_config(daq_config)
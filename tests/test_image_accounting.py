@@ -0,0 +1,36 @@
+import unittest
+
+from std_daq_service.image_accounting import ImageIdAccounting, is_in_window
+
+
+class TestImageIdAccounting(unittest.TestCase):
+
+    def test_continuity(self):
+        accounting = ImageIdAccounting('test')
+
+        self.assertEqual(accounting.record(10), 0)
+        self.assertEqual(accounting.record(11), 0)
+        self.assertEqual(accounting.record(15), 3)
+        accounting.record(15)
+        accounting.record(12)
+        self.assertEqual(accounting.record(16), 0)
+
+        self.assertEqual(accounting.n_images, 6)
+        self.assertEqual(accounting.get_stats(), {'n_missing_images': 3,
+                                                  'n_duplicate_images': 1,
+                                                  'n_out_of_order_images': 1,
+                                                  'n_overrun_images': 0})
+
+        accounting.reset()
+        self.assertEqual(accounting.record(100), 0)
+        self.assertEqual(accounting.get_stats()['n_missing_images'], 0)
+
+    def test_window(self):
+        accounting = ImageIdAccounting('test')
+
+        self.assertTrue(accounting.check_window(image_id=5, head_image_id=14, capacity=10))
+        self.assertFalse(accounting.check_window(image_id=5, head_image_id=15, capacity=10))
+        self.assertEqual(accounting.get_stats()['n_overrun_images'], 1)
+
+        # Without a known capacity nothing counts as overrun.
+        self.assertTrue(is_in_window(5, 1000, 0))
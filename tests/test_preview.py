@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from std_daq_service.preview.preview import PreviewBuffer, attach_preview_buffer, get_bin_factor, \
+    get_preview_config, make_preview, to_display
+
+
+class TestPreview(unittest.TestCase):
+
+    def setUp(self):
+        self.daq_config = {'detector_name': 'test_preview', 'bit_depth': 16,
+                           'image_pixel_height': 40, 'image_pixel_width': 60,
+                           'preview': {'rate': 10, 'max_height': 10, 'max_width': 20}}
+
+    def test_make_preview(self):
+        self.assertEqual(get_bin_factor([40, 60], 10, 20), 4)
+        self.assertEqual(get_bin_factor([5, 5], 10, 20), 1)
+
+        image = np.arange(4 * 6, dtype='uint16').reshape(4, 6)
+        preview = make_preview(image, bin_factor=2, bit_depth=16)
+        self.assertEqual(preview.dtype, np.uint16)
+
+        # Binned means, flipped vertically.
+        expected = image.reshape(2, 2, 3, 2).mean(axis=(1, 3))[::-1]
+        np.testing.assert_array_equal(preview, expected.astype('uint16'))
+
+        preview = make_preview(image, bin_factor=2, bit_depth=8)
+        self.assertEqual(preview.dtype, np.uint8)
+        self.assertEqual(preview.min(), 0)
+        self.assertEqual(preview.max(), 255)
+        self.assertEqual(preview[0, -1], 255)
+        self.assertIs(to_display(preview), preview)
+
+        display = to_display(make_preview(image, bin_factor=2, bit_depth=16))
+        self.assertEqual(display.dtype, np.uint8)
+        np.testing.assert_array_equal(display, preview)
+
+    def test_invalid_config(self):
+        self.assertIsNone(get_preview_config({}))
+        self.assertEqual(get_preview_config(self.daq_config)['bit_depth'], 8)
+
+        self.daq_config['preview']['bit_depth'] = 12
+        with self.assertRaises(ValueError):
+            get_preview_config(self.daq_config)
+
+    def test_buffer(self):
+        self.assertIsNone(attach_preview_buffer(self.daq_config))
+
+        preview_buffer = PreviewBuffer('test_preview', [40, 60], get_preview_config(self.daq_config), create=True)
+        try:
+            self.assertEqual(preview_buffer.shape, (10, 15))
+            viewer = attach_preview_buffer(self.daq_config)
+            self.assertEqual(viewer.get_latest(), (None, None))
+
+            image = np.random.randint(0, 1000, size=(40, 60), dtype='uint16')
+            preview_buffer.write(17, image)
+
+            image_id, preview = viewer.get_latest()
+            self.assertEqual(image_id, 17)
+            np.testing.assert_array_equal(preview, make_preview(image, preview_buffer.bin_factor))
+        finally:
+            preview_buffer.unlink()
@@ -0,0 +1,285 @@
+import unittest
+import uuid
+from time import sleep
+
+import numpy as np
+
+from std_daq_service import ram_buffer
+from std_daq_service.ram_buffer import RamBuffer, PackedRamBuffer, RamBufferCursors
+
+
+class TestRamBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.channel_name = f'test-{uuid.uuid4().hex[:8]}'
+        self.buffers = []
+
+    def tearDown(self):
+        for buffer in self.buffers:
+            buffer.shm.unlink()
+
+    def _create_buffer(self, **kwargs):
+        buffer = RamBuffer(channel_name=self.channel_name, create=True, **kwargs)
+        self.buffers.append(buffer)
+        return buffer
+
+    def test_write_read(self):
+        buffer = self._create_buffer(data_n_bytes=16, n_slots=4)
+        data = np.arange(8, dtype='uint16')
+
+        buffer.write(5, data)
+        np.testing.assert_array_equal(buffer.get_data(5, shape=(8,), dtype='uint16'), data)
+        # Slots wrap around.
+        np.testing.assert_array_equal(buffer.get_data(1, shape=(8,), dtype='uint16'), data)
+
+    def test_get_range(self):
+        buffer = self._create_buffer(data_n_bytes=16, n_slots=4)
+        for image_id in range(2, 6):
+            buffer.write(image_id, np.full((2, 4), image_id, dtype='uint16'))
+
+        views = buffer.get_range(2, 2, shape=(2, 4), dtype='uint16')
+        self.assertEqual(len(views), 1)
+        self.assertEqual(views[0].shape, (2, 2, 4))
+        np.testing.assert_array_equal(views[0][:, 0, 0], [2, 3])
+
+        # Range wraps around the end of the ring.
+        views = buffer.get_range(3, 3, shape=(2, 4), dtype='uint16')
+        self.assertEqual([len(view) for view in views], [1, 2])
+
+        data = buffer.get_range(3, 3, shape=(2, 4), dtype='uint16', concatenate=True)
+        np.testing.assert_array_equal(data.max(axis=(1, 2)), [3, 4, 5])
+
+        with self.assertRaises(ValueError):
+            buffer.get_range(0, 5, shape=(2, 4), dtype='uint16')
+        del views
+
+    def test_slot_header(self):
+        producer = self._create_buffer(data_n_bytes=16, n_slots=4, slot_header=True)
+        consumer = RamBuffer(channel_name=self.channel_name, data_n_bytes=16, n_slots=4, slot_header=True)
+
+        data, sequence = consumer.get_data_checked(1, shape=(8,), dtype='uint16')
+        self.assertIsNone(data)
+
+        producer.write(1, np.arange(8, dtype='uint16'))
+        data, sequence = consumer.get_data_checked(1, shape=(8,), dtype='uint16')
+        np.testing.assert_array_equal(data, np.arange(8, dtype='uint16'))
+        self.assertTrue(consumer.is_unchanged(1, sequence))
+        self.assertEqual(consumer.get_slot_info(1),
+                         {'image_id': 1, 'generation': 1, 'size': 16, 'write_complete': True})
+
+        # Wrong image_id for the slot.
+        data, _ = consumer.get_data_checked(5, shape=(8,), dtype='uint16')
+        self.assertIsNone(data)
+
+        # Producer overwrites the slot while the consumer holds the view.
+        producer.write(5, np.zeros(8, dtype='uint16'))
+        self.assertFalse(consumer.is_unchanged(1, sequence))
+
+        del data
+        del consumer
+
+    def test_mmap_backend(self):
+        backend = {'type': 'mmap', 'prefault': True}
+        producer = self._create_buffer(data_n_bytes=16, n_slots=4, backend=backend)
+        producer.write(3, np.arange(8, dtype='uint16'))
+
+        # Segments in /dev/shm are interchangeable with the default SharedMemory backend.
+        consumer = RamBuffer(channel_name=self.channel_name, data_n_bytes=16, n_slots=4)
+        np.testing.assert_array_equal(consumer.get_data(3, shape=(8,), dtype='uint16'), np.arange(8, dtype='uint16'))
+
+    def test_slot_header_missing(self):
+        self._create_buffer(data_n_bytes=16, n_slots=4)
+
+        with self.assertRaises(RuntimeError):
+            RamBuffer(channel_name=self.channel_name, data_n_bytes=16, n_slots=4, slot_header=True)
+
+        buffer = RamBuffer(channel_name=self.channel_name, data_n_bytes=16, n_slots=4)
+        with self.assertRaises(RuntimeError):
+            buffer.get_data_checked(0, shape=(8,), dtype='uint16')
+        with self.assertRaises(RuntimeError):
+            buffer.is_unchanged(0, 2)
+        with self.assertRaises(RuntimeError):
+            buffer.get_slot_info(0)
+
+
+class TestPackedRamBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.channel_name = f'test-{uuid.uuid4().hex[:8]}'
+        self.producer = PackedRamBuffer(channel_name=self.channel_name, ring_n_bytes=256, n_slots=8, create=True)
+
+    def tearDown(self):
+        self.producer.shm.unlink()
+
+    def test_packed_layout(self):
+        consumer = PackedRamBuffer(channel_name=self.channel_name)
+        self.assertEqual(consumer.ring_n_bytes, 256)
+        self.assertEqual(consumer.n_slots, 8)
+
+        self.producer.write(0, np.full(10, 1, dtype='uint8'))
+        self.producer.write(1, np.full(70, 2, dtype='uint8'))
+
+        data, sequence = consumer.get_data_checked(0, shape=(10,), dtype='uint8')
+        np.testing.assert_array_equal(data, np.full(10, 1, dtype='uint8'))
+        data, sequence = consumer.get_data_checked(1, shape=(70,), dtype='uint8')
+        np.testing.assert_array_equal(data, np.full(70, 2, dtype='uint8'))
+        # The index keeps the payload size, not the aligned size.
+        self.assertEqual(consumer.get_slot_info(1)['size'], 70)
+
+        # Reads larger than the committed payload would run past it.
+        with self.assertRaises(ValueError):
+            consumer.get_data_checked(1, shape=(256,), dtype='uint8')
+        del data
+
+    def test_packed_reserve_commit(self):
+        consumer = PackedRamBuffer(channel_name=self.channel_name)
+
+        output = self.producer.reserve(0, max_bytes=200)
+        self.assertEqual(len(output), 200)
+        output[:20] = 7
+        # Not visible to consumers before the commit.
+        data, _ = consumer.get_data_checked(0, shape=(20,), dtype='uint8')
+        self.assertIsNone(data)
+
+        self.producer.commit(0, n_bytes=20)
+        data, _ = consumer.get_data_checked(0, shape=(20,), dtype='uint8')
+        np.testing.assert_array_equal(data, np.full(20, 7, dtype='uint8'))
+
+        # The unused part of the reservation is returned to the ring.
+        self.producer.write(1, np.full(100, 1, dtype='uint8'))
+        self.assertEqual(consumer.get_slot_info(0)['size'], 20)
+        data, _ = consumer.get_data_checked(0, shape=(20,), dtype='uint8')
+        self.assertIsNotNone(data)
+        del data, output
+
+    def test_packed_abort(self):
+        consumer = PackedRamBuffer(channel_name=self.channel_name)
+        self.producer.write(0, np.full(10, 1, dtype='uint8'))
+        slot_info = consumer.get_slot_info(8)
+
+        # Too large for the ring: nothing is claimed and the slot is not left in a write.
+        with self.assertRaises(ValueError):
+            self.producer.reserve(8, max_bytes=512)
+        self.assertEqual(consumer.get_slot_info(8), slot_info)
+
+        self.producer.reserve(8, max_bytes=200)
+        self.assertFalse(consumer.get_slot_info(8)['write_complete'])
+        self.producer.abort(8)
+
+        self.assertTrue(consumer.get_slot_info(8)['write_complete'])
+        data, _ = consumer.get_data_checked(8, shape=(10,), dtype='uint8')
+        self.assertIsNone(data)
+        # The head is back where it was, so the next payload does not wrap over image 0.
+        self.producer.write(1, np.full(150, 2, dtype='uint8'))
+        data, _ = consumer.get_data_checked(0, shape=(10,), dtype='uint8')
+        np.testing.assert_array_equal(data, np.full(10, 1, dtype='uint8'))
+        del data
+
+    def test_packed_overwrite(self):
+        consumer = PackedRamBuffer(channel_name=self.channel_name)
+
+        self.producer.write(0, np.full(100, 1, dtype='uint8'))
+        _, sequence = consumer.get_data_checked(0, shape=(100,), dtype='uint8')
+        self.assertTrue(consumer.is_unchanged(0, sequence))
+
+        # Wrapping around the byte ring invalidates image 0 even though its index slot was not reused.
+        self.producer.write(1, np.full(100, 2, dtype='uint8'))
+        self.assertTrue(consumer.is_unchanged(0, sequence))
+        self.producer.write(2, np.full(100, 3, dtype='uint8'))
+        self.assertFalse(consumer.is_unchanged(0, sequence))
+
+        data, _ = consumer.get_data_checked(0, shape=(100,), dtype='uint8')
+        self.assertIsNone(data)
+        data, _ = consumer.get_data_checked(2, shape=(100,), dtype='uint8')
+        np.testing.assert_array_equal(data, np.full(100, 3, dtype='uint8'))
+        del data
+
+    def test_partitions(self):
+        producer = PackedRamBuffer(channel_name=f'{self.channel_name}-partitioned', ring_n_bytes=520, n_slots=8,
+                                   create=True, n_partitions=2)
+        try:
+            consumer = PackedRamBuffer(channel_name=f'{self.channel_name}-partitioned')
+            self.assertEqual(consumer.n_partitions, 2)
+            # Partitions are aligned, the remainder of the ring is unused.
+            self.assertEqual(consumer.partition_n_bytes, 256)
+            self.assertEqual(consumer.ring_n_bytes, 512)
+
+            producer.write(0, np.full(100, 1, dtype='uint8'), partition=0)
+            producer.write(1, np.full(100, 2, dtype='uint8'), partition=1)
+            self.assertEqual(producer._get_physical_offset(1, 0), 256)
+            self.assertEqual(producer._get_physical_offset(1, 300), 300)
+
+            # Consumers find the partition in the index.
+            data, _ = consumer.get_data_checked(1, shape=(100,), dtype='uint8')
+            np.testing.assert_array_equal(data, np.full(100, 2, dtype='uint8'))
+
+            # Wrapping around partition 1 does not invalidate images in partition 0.
+            _, sequence = consumer.get_data_checked(0, shape=(100,), dtype='uint8')
+            producer.write(3, np.full(100, 3, dtype='uint8'), partition=1)
+            producer.write(5, np.full(100, 4, dtype='uint8'), partition=1)
+            self.assertTrue(consumer.is_unchanged(0, sequence))
+            data, _ = consumer.get_data_checked(1, shape=(100,), dtype='uint8')
+            self.assertIsNone(data)
+            data, _ = consumer.get_data_checked(5, shape=(100,), dtype='uint8')
+            np.testing.assert_array_equal(data, np.full(100, 4, dtype='uint8'))
+
+            # Images written into only one of the partitions are overwritten twice as early.
+            self.assertEqual(producer.estimate_capacity(96), 4)
+            self.assertEqual(producer.estimate_capacity(96, n_partitions=1), 2)
+
+            with self.assertRaises(ValueError):
+                producer.reserve(7, max_bytes=10, partition=2)
+            with self.assertRaises(ValueError):
+                producer.write(7, np.zeros(300, dtype='uint8'), partition=0)
+            del data, consumer
+        finally:
+            producer.shm.unlink()
+
+
+class TestRamBufferCursors(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer_name = f'test-{uuid.uuid4().hex[:8]}-image'
+        self.producer = RamBufferCursors(self.buffer_name, capacity=100, create=True)
+
+    def tearDown(self):
+        self.producer.shm.unlink()
+
+    def test_attach_only(self):
+        with self.assertRaises(FileNotFoundError):
+            RamBufferCursors(f'{self.buffer_name}-missing')
+
+        cursors, consumer_index = ram_buffer.attach_consumer_cursor(f'{self.buffer_name}-missing', 'writer')
+        self.assertIsNone(cursors)
+
+        # A restarted producer takes over the existing segment.
+        restarted_producer = RamBufferCursors(self.buffer_name, create=True)
+        restarted_producer.publish_head(7)
+        cursors, consumer_index = ram_buffer.attach_consumer_cursor(self.buffer_name, 'writer')
+        self.assertEqual(cursors.get_lag()['writer']['head_image_id'], 7)
+
+    def test_lag(self):
+        consumer = RamBufferCursors(self.buffer_name)
+        writer_index = consumer.register_consumer('writer')
+        self.assertEqual(consumer.register_consumer('writer'), writer_index)
+        consumer.register_consumer('preview')
+
+        original_interval = ram_buffer.CURSORS_RATE_INTERVAL_NS
+        ram_buffer.CURSORS_RATE_INTERVAL_NS = 10 * 1000 * 1000
+        try:
+            self.producer.publish_head(0)
+            sleep(0.02)
+            self.producer.publish_head(40)
+        finally:
+            ram_buffer.CURSORS_RATE_INTERVAL_NS = original_interval
+
+        consumer.publish_cursor(writer_index, 30)
+        lags = consumer.get_lag()
+
+        self.assertEqual(set(lags), {'writer', 'preview'})
+        self.assertEqual(lags['writer']['lag_images'], 10)
+        self.assertGreater(lags['writer']['lag_seconds'], 0)
+        self.assertGreater(lags['writer']['time_to_overwrite_seconds'], lags['preview']['time_to_overwrite_seconds'])
+        # The preview consumer never published a cursor.
+        self.assertIsNone(lags['preview']['cursor_age_seconds'])
+        self.assertEqual(consumer.get_head()[0], 40)
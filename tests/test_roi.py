@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+from std_daq_service.compression.worker import get_image_geometry
+from std_daq_service.roi.extractor import RoiExtractor, get_rois
+
+
+class TestRoi(unittest.TestCase):
+
+    def setUp(self):
+        self.daq_config = {'detector_name': 'test', 'bit_depth': 16, 'image_pixel_height': 8, 'image_pixel_width': 10}
+
+    def test_extract(self):
+        self.daq_config['roi'] = [{'x': 2, 'y': 1, 'width': 4, 'height': 2},
+                                  {'x': 5, 'y': 5, 'width': 4, 'height': 3}]
+        extractor = RoiExtractor(get_rois(self.daq_config))
+        self.assertEqual(extractor.shape, [5, 4])
+
+        image = np.arange(80, dtype='uint16').reshape(8, 10)
+        output = np.zeros((5, 4), dtype='uint16')
+        extractor.extract(image, output=output)
+
+        # ROIs are stacked top to bottom.
+        np.testing.assert_array_equal(output[:2], image[1:3, 2:6])
+        np.testing.assert_array_equal(output[2:], image[5:8, 5:9])
+
+        self.assertEqual(get_image_geometry(self.daq_config), ([5, 4], 'uint16', 40))
+
+    def test_invalid_roi(self):
+        self.assertEqual(get_rois(self.daq_config), [])
+        self.assertEqual(get_image_geometry(self.daq_config), ([8, 10], 'uint16', 160))
+
+        for roi in [{'x': 8, 'y': 0, 'width': 4, 'height': 2},
+                    {'x': 0, 'y': 0, 'width': 4},
+                    [{'x': 0, 'y': 0, 'width': 4, 'height': 2}, {'x': 0, 'y': 0, 'width': 5, 'height': 2}]]:
+            self.daq_config['roi'] = roi
+            with self.assertRaises(ValueError):
+                get_rois(self.daq_config)
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+from time import sleep
+
+import bitshuffle.h5
+import h5py
+import numpy as np
+
+from std_daq_service.compression.codecs import create_codec
+from std_daq_service.writer.benchmark import compress_frames, write_frames
+from std_daq_service.writer.chunks import ChunkPacker, get_frames_per_chunk
+from std_daq_service.writer.layout import create_datasets, get_chunk_metadata, get_grow_n_images, resize_datasets
+from std_daq_service.writer.write_thread import ChunkWriteThread
+
+
+class SlowDataset(object):
+    """Records the chunks written, each write takes write_time seconds."""
+    def __init__(self, write_time=0, fail=False):
+        self.id = self
+        self.write_time = write_time
+        self.fail = fail
+        self.chunks = []
+
+    def write_direct_chunk(self, offset, chunk):
+        sleep(self.write_time)
+        if self.fail:
+            raise IOError("Disk full.")
+        self.chunks.append((offset, bytes(chunk)))
+
+
+class TestWriterChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.temp_dir.name, 'test.h5')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_frames_per_chunk(self):
+        codec = create_codec('bshuffle_lz4')
+        self.assertEqual(get_frames_per_chunk({}, codec, [64, 128], 'uint16'), 1)
+        self.assertEqual(get_frames_per_chunk({'writer_frames_per_chunk': 8}, codec, [64, 128], 'uint16'), 8)
+        self.assertEqual(get_frames_per_chunk({'writer_frames_per_chunk': 8}, codec, [64, 128], 'uint16', 5), 5)
+        self.assertEqual(get_frames_per_chunk({'writer_frames_per_chunk': 'auto'}, codec, [64, 128], 'uint16'), 256)
+
+        # 100 x 100 pixels do not fill whole bitshuffle blocks.
+        self.assertEqual(get_frames_per_chunk({'writer_frames_per_chunk': 8}, codec, [100, 100], 'uint16'), 1)
+
+        with self.assertRaises(ValueError):
+            get_frames_per_chunk({'writer_frames_per_chunk': 0}, codec, [64, 128], 'uint16')
+
+    def test_joined_chunks(self):
+        shape, n_frames = (64, 128), 11
+        frames = [np.random.randint(0, 4096, size=shape, dtype='uint16') for _ in range(n_frames)]
+
+        for codec_name in ['raw', 'bshuffle_lz4', 'bshuffle_zstd']:
+            codec = create_codec(codec_name)
+            # The last chunk holds 3 images and is padded.
+            write_frames(self.output_file, codec, compress_frames(codec, frames), shape, 'uint16', 4, n_frames)
+
+            with h5py.File(self.output_file, 'r') as input_file:
+                dataset = input_file['data']
+                self.assertEqual(dataset.chunks, (4, 64, 128))
+                np.testing.assert_array_equal(dataset[:], np.stack(frames))
+
+    def test_write_thread(self):
+        # Room for 2 chunks of 100 bytes, the receiver stalls while the slow writes free space.
+        dataset = SlowDataset(write_time=0.02)
+        written = []
+        write_thread = ChunkWriteThread(dataset, max_queue_n_bytes=200,
+                                        on_written=lambda offset, metadata: written.append(offset[0]))
+        for i_chunk in range(6):
+            write_thread.put((i_chunk, 0, 0), np.full(100, i_chunk, dtype='uint8'))
+        write_thread.close()
+
+        self.assertEqual([offset[0] for offset, _ in dataset.chunks], list(range(6)))
+        self.assertEqual(written, list(range(6)))
+        self.assertEqual(dataset.chunks[5][1], bytes([5] * 100))
+
+        stats = write_thread.get_stats()
+        self.assertEqual(stats['n_chunks'], 6)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertLessEqual(stats['max_queue_depth'], 2)
+        self.assertGreater(stats['io_stall_ms'], 0)
+
+    def test_write_thread_error(self):
+        write_thread = ChunkWriteThread(SlowDataset(fail=True), max_queue_n_bytes=100)
+        write_thread.put((0, 0, 0), np.zeros(100, dtype='uint8'))
+
+        with self.assertRaises(RuntimeError):
+            write_thread.put((1, 0, 0), np.zeros(100, dtype='uint8'))
+            write_thread.close()
+
+    def test_open_ended_datasets(self):
+        codec = create_codec('bshuffle_lz4')
+        shape, n_frames = (64, 128), 2003
+        frames = compress_frames(codec, [np.full(shape, i_frame, dtype='uint16') for i_frame in range(4)])
+        packer = ChunkPacker(codec, shape, 'uint16', 4)
+        grow_n_images = get_grow_n_images(4)
+
+        with h5py.File(self.output_file, 'w') as file:
+            data, metadata = create_datasets(file, 'test', shape, 'uint16', codec, 4, n_images=0)
+            self.assertEqual(data.shape[0], grow_n_images)
+            write_thread = ChunkWriteThread(data, 1024 * 1024, metadata, grow_n_images=grow_n_images)
+
+            chunk_images = []
+            for i_frame in range(n_frames):
+                chunk_images.append((100 + i_frame, 0))
+                if packer.add(frames[i_frame % 4]):
+                    write_thread.put((i_frame - 3, 0, 0), packer.get_chunk(), get_chunk_metadata(chunk_images))
+                    chunk_images = []
+            write_thread.put((n_frames - packer.n_frames, 0, 0), packer.get_chunk(), get_chunk_metadata(chunk_images))
+            write_thread.close()
+            self.assertEqual(data.shape[0], 3 * grow_n_images)
+
+            resize_datasets(data, metadata, n_frames)
+
+        with h5py.File(self.output_file, 'r') as input_file:
+            self.assertEqual(input_file['test/data'].shape, (n_frames, 64, 128))
+            self.assertEqual(input_file['test/data'].maxshape, (None, 64, 128))
+            np.testing.assert_array_equal(input_file['test/image_id'][:], np.arange(100, 100 + n_frames))
+            self.assertEqual(input_file['test/data'][-1, 0, 0], (n_frames - 1) % 4)
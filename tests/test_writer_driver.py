@@ -0,0 +1,123 @@
+import unittest
+from threading import Thread
+from time import sleep, time
+
+import zmq
+from std_buffer.writer_command_pb2 import CommandType, WriterStatus
+
+from std_daq_service.writer.striping import get_stripe_file_name
+from std_daq_service.writer_driver import WriterStatusTracker
+
+OUTPUT_FILE = '/tmp/run.h5'
+
+
+class TestWriterStatusTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        self.tracker = None
+        self.status_sender = self.ctx.socket(zmq.PUSH)
+        self.status_sender.connect('ipc:///tmp/test-writer-status-sync')
+
+    def tearDown(self):
+        if self.tracker:
+            self.tracker.close()
+        self.status_sender.close()
+        self.ctx.destroy()
+
+    def start_tracker(self, n_writers=1):
+        self.tracker = WriterStatusTracker(self.ctx, 'ipc:///tmp/test-writer-status-sync',
+                                           'ipc:///tmp/test-writer-status', 10, n_writers=n_writers)
+        # Idle writers report their stop.
+        self.send_status(CommandType.STOP_WRITING, run_id=0, output_file='')
+        self.tracker.wait_for_state('READY')
+
+    def send_status(self, command_type, run_id=1, error_message='', delay=0, output_file=OUTPUT_FILE):
+        # Writers report the run_info of their command, i_writer and n_writers are left at the defaults.
+        status = WriterStatus()
+        status.command_type = command_type
+        status.run_info.run_id = run_id
+        status.run_info.output_file = output_file
+        status.run_info.n_images = 10
+        status.error_message = error_message
+
+        if not delay:
+            self.status_sender.send(status.SerializeToString())
+            return
+
+        # Sent from a thread while the test waits, one delayed status at a time.
+        def send():
+            sleep(delay)
+            self.status_sender.send(status.SerializeToString())
+
+        Thread(target=send).start()
+
+    def test_wait_for_state(self):
+        self.start_tracker()
+
+        # The waiter wakes up on the status, not on a polling interval.
+        self.tracker.set_run_info({'run_id': 1, 'output_file': OUTPUT_FILE, 'n_images': 10})
+        self.send_status(CommandType.START_WRITING, delay=0.05)
+        start_time = time()
+        self.assertEqual(self.tracker.wait_for_state('WRITING')['state'], 'WRITING')
+        self.assertLess(time() - start_time, 0.09)
+
+        self.send_status(CommandType.WRITE_IMAGE)
+        self.tracker.log_stop_request()
+        self.send_status(CommandType.STOP_WRITING, delay=0.05)
+        stats = self.tracker.wait_for_state('READY')['acquisition']['stats']
+        self.assertEqual(stats['n_write_completed'], 1)
+        self.assertGreater(stats['start_to_first_write_ms'], 0)
+        self.assertGreaterEqual(stats['stop_to_ready_ms'], 50)
+
+        with self.assertRaises(RuntimeError):
+            self.tracker.wait_for_state('WRITING', timeout=0.1)
+
+    def test_wait_for_failed_state(self):
+        self.start_tracker()
+
+        self.send_status(CommandType.START_WRITING)
+        self.tracker.wait_for_state('WRITING')
+        self.send_status(CommandType.STOP_WRITING, error_message='ERROR: disk full', delay=0.05)
+        self.assertEqual(self.tracker.wait_for_state('READY')['acquisition']['state'], 'FAILED')
+
+        # The error of the failed acquisition does not fail the start of the next one.
+        self.send_status(CommandType.START_WRITING, run_id=2, delay=0.05)
+        self.tracker.wait_for_state('WRITING')
+
+    def test_striped_writers(self):
+        self.start_tracker(n_writers=2)
+        stripe_files = [get_stripe_file_name(OUTPUT_FILE, i_writer) for i_writer in range(2)]
+
+        self.tracker.set_run_info({'run_id': 1, 'output_file': OUTPUT_FILE, 'n_images': 10})
+        for stripe_file in stripe_files:
+            self.send_status(CommandType.START_WRITING, output_file=stripe_file)
+        self.tracker.wait_for_state('WRITING')
+        self.send_status(CommandType.WRITE_IMAGE, output_file=stripe_files[1])
+
+        # The acquisition is only finished once both writers stopped.
+        self.send_status(CommandType.STOP_WRITING, output_file=stripe_files[0])
+        with self.assertRaises(RuntimeError):
+            self.tracker.wait_for_state('READY', timeout=0.1)
+
+        self.send_status(CommandType.STOP_WRITING, output_file=stripe_files[1])
+        status = self.tracker.wait_for_state('READY')
+        self.assertEqual(status['acquisition']['info']['output_file'], OUTPUT_FILE)
+        self.assertEqual(status['acquisition']['stats']['n_write_completed_per_writer'], [0, 1])
+
+        # One failed writer fails the wait while the other one still writes.
+        self.tracker.set_run_info({'run_id': 2, 'output_file': OUTPUT_FILE, 'n_images': 10})
+        for stripe_file in stripe_files:
+            self.send_status(CommandType.START_WRITING, run_id=2, output_file=stripe_file)
+        self.tracker.wait_for_state('WRITING')
+        self.send_status(CommandType.STOP_WRITING, run_id=2, error_message='ERROR: disk full', delay=0.05,
+                         output_file=stripe_files[1])
+        with self.assertRaises(ValueError):
+            self.tracker.wait_for_state('READY')
+
+        self.send_status(CommandType.STOP_WRITING, run_id=2, output_file=stripe_files[0])
+        self.assertEqual(self.tracker.wait_for_state('READY')['acquisition']['state'], 'FAILED')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+import bitshuffle.h5
+import h5py
+import numpy as np
+
+from std_daq_service.compression.codecs import create_codec
+from std_daq_service.writer.benchmark import compress_frames, write_frames
+from std_daq_service.writer.io_profile import create_io_profile, get_file_kwargs, get_io_profile
+
+
+class TestWriterIoProfile(unittest.TestCase):
+
+    def test_get_io_profile(self):
+        daq_config = {'writer_io_profiles': {'/gpfs/': 'parallel_fs',
+                                             '/gpfs/scratch/': {'profile': 'parallel_fs', 'alignment': 1048576}}}
+
+        self.assertEqual(get_io_profile(daq_config, '/tmp/test.h5')['name'], 'default')
+        self.assertEqual(get_file_kwargs(get_io_profile(daq_config, '/tmp/test.h5')), {})
+        self.assertEqual(get_io_profile(daq_config, '/gpfs/data/test.h5')['alignment'], 4 * 1024 * 1024)
+        # The longest prefix wins.
+        self.assertEqual(get_io_profile(daq_config, '/gpfs/scratch/test.h5')['alignment'], 1048576)
+
+        file_kwargs = get_file_kwargs(get_io_profile(daq_config, '/gpfs/data/test.h5'))
+        self.assertEqual(file_kwargs['libver'], 'latest')
+        self.assertEqual(file_kwargs['fs_strategy'], 'page')
+        self.assertEqual(file_kwargs['alignment_interval'], 4 * 1024 * 1024)
+
+        for profile_config in ['lustre', {'profile': 'parallel_fs', 'stripe': 4}]:
+            with self.assertRaises(ValueError):
+                create_io_profile(profile_config)
+
+    def test_aligned_file(self):
+        codec = create_codec('bshuffle_lz4')
+        frames = [np.random.randint(0, 4096, size=(256, 512), dtype='uint16') for _ in range(6)]
+        io_profile = create_io_profile({'profile': 'parallel_fs', 'alignment': 65536, 'alignment_threshold': 1,
+                                        'page_size': 65536, 'direct_io': True})
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_file = os.path.join(temp_dir, 'test.h5')
+            write_frames(output_file, codec, compress_frames(codec, frames), (256, 512), 'uint16', 2, 6, io_profile)
+
+            with h5py.File(output_file, 'r') as input_file:
+                dataset = input_file['data']
+                np.testing.assert_array_equal(dataset[:], np.stack(frames))
+                for i_chunk in range(3):
+                    self.assertEqual(dataset.id.get_chunk_info(i_chunk).byte_offset % 65536, 0)
@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import unittest
+
+import bitshuffle.h5
+import h5py
+import numpy as np
+
+from std_daq_service.compression.codecs import create_codec
+from std_daq_service.writer.benchmark import compress_frames
+from std_daq_service.writer.raw import RawOutput, RawReader, export_to_hdf5, get_index_file_name, get_raw_config, \
+    get_segment_file_name, is_raw_output
+
+
+class TestWriterRaw(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.temp_dir.name, 'run.raw')
+        self.shape = (64, 128)
+        self.codec = create_codec('bshuffle_lz4')
+        self.frames = [np.full(self.shape, i_frame, dtype='uint16') for i_frame in range(5)]
+        self.compressed = compress_frames(self.codec, self.frames)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, segment_n_bytes=1024 ** 2, encoding=None):
+        written = []
+        output = RawOutput(self.output_file, 'test', self.shape, 'uint16', 'bshuffle_lz4',
+                           {'segment_n_bytes': segment_n_bytes}, on_written=lambda *args: written.append(args))
+        try:
+            for i_frame, data in enumerate(self.compressed):
+                output.put(100 + i_frame, i_frame % 2, encoding or self.codec.encoding, data)
+        finally:
+            output.close()
+
+        self.assertEqual(len(written), len(self.compressed))
+        return output
+
+    def test_config(self):
+        self.assertTrue(is_raw_output('/data/run.raw'))
+        self.assertFalse(is_raw_output('/data/run.h5'))
+        self.assertEqual(get_raw_config({}), {'segment_n_bytes': 4 * 1024 ** 3})
+        self.assertEqual(get_raw_config({'writer_raw': {'segment_gb': 0.5}}), {'segment_n_bytes': 512 * 1024 ** 2})
+        with self.assertRaises(ValueError):
+            get_raw_config({'writer_raw': {'segment_gb': 0}})
+
+        self.assertEqual(get_segment_file_name('/data/run.raw', 3), '/data/run_00003.bin')
+        self.assertEqual(get_index_file_name('/data/run.raw'), '/data/run.idx')
+
+    def test_write_and_read(self):
+        output = self.write()
+        self.assertEqual(output.get_stats()['n_segments'], 1)
+        # The last segment is truncated to the written images.
+        self.assertEqual(os.path.getsize(get_segment_file_name(self.output_file, 0)),
+                         sum(data.nbytes for data in self.compressed))
+
+        with open(self.output_file) as input_file:
+            self.assertEqual(json.load(input_file)['n_images'], 5)
+
+        reader = RawReader(self.output_file)
+        self.assertEqual(reader.n_images, 5)
+        self.assertEqual(list(reader.index['image_id']), list(range(100, 105)))
+        self.assertEqual(list(reader.index['status']), [0, 1, 0, 1, 0])
+        for i_frame, frame in enumerate(self.frames):
+            np.testing.assert_array_equal(reader.get_image(i_frame), frame)
+
+    def test_segment_rollover(self):
+        # Two images per segment, images do not span segments.
+        segment_n_bytes = max(data.nbytes for data in self.compressed) * 2
+        output = self.write(segment_n_bytes=segment_n_bytes)
+        self.assertEqual(output.get_stats()['n_segments'], 3)
+
+        reader = RawReader(self.output_file)
+        self.assertEqual(list(reader.index['segment']), [0, 0, 1, 1, 2])
+        np.testing.assert_array_equal(reader.get_image(4), self.frames[4])
+
+        output = RawOutput(self.output_file, 'test', self.shape, 'uint16', 'bshuffle_lz4', {'segment_n_bytes': 16})
+        try:
+            with self.assertRaises(ValueError):
+                output.put(0, 0, self.codec.encoding, self.compressed[0])
+        finally:
+            output.close()
+
+    def test_export_to_hdf5(self):
+        self.write(segment_n_bytes=max(data.nbytes for data in self.compressed) * 2)
+        hdf5_file = os.path.join(self.temp_dir.name, 'run.h5')
+        self.assertEqual(export_to_hdf5(self.output_file, hdf5_file), 5)
+
+        with h5py.File(hdf5_file, 'r') as input_file:
+            self.assertEqual(list(input_file['test/image_id'][:]), list(range(100, 105)))
+            self.assertEqual(list(input_file['test/status'][:]), [0, 1, 0, 1, 0])
+            np.testing.assert_array_equal(input_file['test/data'][3], self.frames[3])
+
+    def test_export_mixed_encoding(self):
+        self.write(encoding=self.codec.encoding + 1)
+        with self.assertRaises(ValueError):
+            export_to_hdf5(self.output_file, os.path.join(self.temp_dir.name, 'run.h5'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import bitshuffle.h5
+import h5py
+import numpy as np
+
+from std_daq_service.compression.codecs import create_codec
+from std_daq_service.writer.benchmark import compress_frames
+from std_daq_service.writer.chunks import ChunkPacker
+from std_daq_service.writer.io_profile import create_io_profile
+from std_daq_service.writer.output_file import OutputFiles
+from std_daq_service.writer.rollover import get_part_file_name, get_rollover_config
+
+
+class TestWriterRollover(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.temp_dir.name, 'run.h5')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, n_frames, n_images, rollover):
+        shape, frames_per_chunk = (64, 128), 4
+        codec = create_codec('bshuffle_lz4')
+        frames = compress_frames(codec, [np.full(shape, i_frame, dtype='uint16') for i_frame in range(n_frames)])
+        packer = ChunkPacker(codec, shape, 'uint16', frames_per_chunk)
+
+        output_files = OutputFiles(self.output_file, n_images, rollover, 'test', shape, 'uint16', codec,
+                                   frames_per_chunk, create_io_profile('default'), 1024 * 1024)
+        chunk_images = []
+        for i_frame in range(n_frames):
+            chunk_images.append((1000 + i_frame, 0))
+            if packer.add(frames[i_frame]):
+                output_files.put(i_frame + 1 - frames_per_chunk, packer.get_chunk(), chunk_images)
+                chunk_images = []
+        if packer.n_frames:
+            output_files.put(n_frames - packer.n_frames, packer.get_chunk(), chunk_images)
+        output_files.close(n_frames)
+
+    def assert_master(self, n_frames):
+        with h5py.File(self.output_file, 'r') as input_file:
+            self.assertEqual(input_file['test/data'].shape, (n_frames, 64, 128))
+            self.assertTrue(input_file['test/data'].is_virtual)
+            np.testing.assert_array_equal(input_file['test/data'][:, 0, 0], np.arange(n_frames))
+            np.testing.assert_array_equal(input_file['test/image_id'][:], np.arange(1000, 1000 + n_frames))
+
+    def test_rollover_config(self):
+        self.assertIsNone(get_rollover_config({}, 4))
+        self.assertEqual(get_rollover_config({'writer_rollover': {'n_images': 10}}, 4), {'n_images': 12, 'n_bytes': 0})
+        self.assertEqual(get_rollover_config({'writer_rollover': {'n_gb': 0.5}}, 4)['n_bytes'], 512 * 1024 ** 2)
+        with self.assertRaises(ValueError):
+            get_rollover_config({'writer_rollover': {'n_images': 0}}, 4)
+
+        self.assertEqual(get_part_file_name('/data/run.h5', 3), '/data/run_00003.h5')
+
+    def test_rollover_n_images(self):
+        # The last part of the fixed length acquisition is shorter than a chunk.
+        for n_images, n_frames in [(0, 21), (21, 21), (18, 18)]:
+            self.write(n_frames, n_images, get_rollover_config({'writer_rollover': {'n_images': 8}}, 4))
+            self.assert_master(n_frames)
+
+            for i_part, part_n_images in enumerate([8, 8, n_frames - 16]):
+                with h5py.File(get_part_file_name(self.output_file, i_part), 'r') as input_file:
+                    self.assertEqual(input_file['test/data'].shape[0], part_n_images)
+                    self.assertEqual(input_file['test/image_id'][0], 1000 + 8 * i_part)
+            self.assertFalse(os.path.exists(get_part_file_name(self.output_file, 3)))
+
+    def test_rollover_n_bytes(self):
+        # With a limit of 1 byte every chunk goes into its own file.
+        self.write(20, 0, {'n_images': 0, 'n_bytes': 1})
+        self.assert_master(20)
+        self.assertTrue(os.path.exists(get_part_file_name(self.output_file, 4)))
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from std_daq_service.writer.striping import get_n_writers, get_stripe_file_name, get_stripe_n_images, \
+    create_striped_master_file
+
+
+class TestWriterStriping(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.temp_dir.name, 'run.h5')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_config(self):
+        self.assertEqual(get_n_writers({}), 1)
+        self.assertEqual(get_n_writers({'writer_n_writers': 4}), 4)
+        with self.assertRaises(ValueError):
+            get_n_writers({'writer_n_writers': -1})
+
+        self.assertEqual(get_stripe_file_name('/data/run.h5', 3), '/data/run_w03.h5')
+
+    def test_stripe_n_images(self):
+        for n_images in range(12):
+            for n_writers in range(1, 5):
+                stripe_n_images = [get_stripe_n_images(n_images, i_writer, n_writers)
+                                   for i_writer in range(n_writers)]
+                self.assertEqual(sum(stripe_n_images), n_images)
+                self.assertEqual(stripe_n_images, [len(range(i_writer, n_images, n_writers))
+                                                   for i_writer in range(n_writers)])
+
+    def test_master_file(self):
+        n_images, n_writers, shape = 11, 3, (4, 5)
+
+        # Writer i_writer writes images i_writer, i_writer + n_writers, ... densely into its own file.
+        stripe_files = [get_stripe_file_name(self.output_file, i_writer) for i_writer in range(n_writers)]
+        for i_writer, stripe_file in enumerate(stripe_files):
+            image_ids = np.arange(i_writer, n_images, n_writers, dtype='uint64') + 1000
+            with h5py.File(stripe_file, 'w') as file:
+                file.create_dataset('test/data', data=np.stack([np.full(shape, i, dtype='uint16')
+                                                                for i in image_ids - 1000]))
+                file.create_dataset('test/image_id', data=image_ids)
+
+        create_striped_master_file(self.output_file, stripe_files, n_images)
+
+        with h5py.File(self.output_file, 'r') as file:
+            self.assertEqual(file['test/data'].shape, (n_images,) + shape)
+            np.testing.assert_array_equal(file['test/image_id'][:], np.arange(n_images) + 1000)
+            np.testing.assert_array_equal(file['test/data'][:, 0, 0], np.arange(n_images))
+            self.assertEqual(file['test/data'][7].sum(), 7 * shape[0] * shape[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
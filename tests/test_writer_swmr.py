@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from time import sleep
+
+import bitshuffle.h5
+import numpy as np
+
+from std_daq_service.compression.codecs import create_codec
+from std_daq_service.writer.benchmark import compress_frames
+from std_daq_service.writer.chunks import ChunkPacker
+from std_daq_service.writer.io_profile import create_io_profile
+from std_daq_service.writer.layout import get_chunk_metadata
+from std_daq_service.writer.output_file import OutputFile
+from std_daq_service.writer.swmr import SwmrReader, get_swmr_config
+
+# HDF5 does not open a file for SWMR reading in the process that writes it.
+READ_N_IMAGES = """
+import sys
+from std_daq_service.writer.swmr import SwmrReader
+with SwmrReader(sys.argv[1]) as reader:
+    print(reader.refresh(), reader.file.swmr_mode, list(reader.image_id[:reader.n_images]))
+"""
+
+
+class TestWriterSwmr(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.temp_dir.name, 'run.h5')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read(self):
+        output = subprocess.run([sys.executable, '-c', READ_N_IMAGES, self.output_file], check=True,
+                                capture_output=True, text=True,
+                                env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))).stdout.split(' ', 2)
+        return int(output[0]), output[1] == 'True', eval(output[2])
+
+    def test_config(self):
+        self.assertIsNone(get_swmr_config({}))
+        self.assertEqual(get_swmr_config({'writer_swmr': True}), {'flush_interval': 1.0})
+        self.assertEqual(get_swmr_config({'writer_swmr': {'flush_interval': 0.2}}), {'flush_interval': 0.2})
+        with self.assertRaises(ValueError):
+            get_swmr_config({'writer_swmr': {'flush_interval': 0}})
+
+    def test_read_while_writing(self):
+        shape, frames_per_chunk = (64, 128), 2
+        codec = create_codec('bshuffle_lz4')
+        frames = compress_frames(codec, [np.full(shape, i_frame, dtype='uint16') for i_frame in range(8)])
+        packer = ChunkPacker(codec, shape, 'uint16', frames_per_chunk)
+        packer.add(frames[0])
+        packer.add(frames[1])
+        chunk = packer.get_chunk()
+
+        output_file = OutputFile(self.output_file, 'test', shape, 'uint16', codec, frames_per_chunk, 8,
+                                 create_io_profile('default'), 1024 * 1024, swmr={'flush_interval': 0.05})
+        try:
+            self.assertEqual(self.read(), (0, True, []))
+
+            for i_image in (0, 2):
+                output_file.put(i_image, chunk, get_chunk_metadata([(100 + i_image, 0), (101 + i_image, 0)]))
+            # The write thread flushes on its cadence, without waiting for more chunks.
+            sleep(0.3)
+            self.assertEqual(self.read(), (4, True, [100, 101, 102, 103]))
+            self.assertGreater(output_file.write_thread.get_stats()['n_flushes'], 0)
+
+            output_file.put(4, chunk, get_chunk_metadata([(104, 0), (105, 0)]))
+        finally:
+            output_file.close(6)
+
+        n_images, _, image_ids = self.read()
+        self.assertEqual(n_images, 6)
+        self.assertEqual(image_ids, list(range(100, 106)))
+
+        with SwmrReader(self.output_file) as reader:
+            np.testing.assert_array_equal(reader.data[5], np.full(shape, 1, dtype='uint16'))
+
+
+if __name__ == '__main__':
+    unittest.main()